@@ -4,6 +4,8 @@ Klipper Macro Scheduler installer.
 
 Performs the following steps:
   - Copies the Moonraker component and web UI into their standard locations.
+  - Installs the web UI next to the component with gzip (and brotli, when the
+    brotli module is available) variants so Moonraker serves it directly.
   - Deploys the KlipperScreen panels (listing + editor) to the configuration
     directory and mirrors them into the KlipperScreen source tree when present.
   - Ensures moonraker.conf contains the required [macro_scheduler] section and
@@ -12,6 +14,7 @@ Performs the following steps:
 """
 
 import argparse
+import gzip
 import shutil
 import sys
 from dataclasses import dataclass
@@ -20,10 +23,16 @@ from pathlib import Path
 from textwrap import dedent
 from typing import List, Optional
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 
 MOONRAKER_COMPONENTS_DIR = Path.home() / "moonraker" / "moonraker" / "components"
+WEB_UI_COMPONENT_DIR = MOONRAKER_COMPONENTS_DIR / "macro_scheduler_ui"
 MAINSAIL_DIR = Path.home() / "mainsail"
 CONFIG_DIR = Path.home() / "printer_data" / "config"
 KLIPPERSCREEN_PANEL_DIR = CONFIG_DIR / "KlipperScreen" / "panels"
@@ -45,6 +54,21 @@ def copy_file(src: Path, dst: Path, *, chmod: Optional[int] = 0o644) -> None:
         dst.chmod(chmod)
 
 
+def write_compressed(path: Path) -> List[Path]:
+    """Write precompressed variants of path next to it, returns their paths"""
+    data = path.read_bytes()
+    variants = [(path.with_name(path.name + ".gz"), gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append((path.with_name(path.name + ".br"), brotli.compress(data, quality=11)))
+    else:
+        # A stale variant from an earlier install would be ignored, remove it anyway
+        path.with_name(path.name + ".br").unlink(missing_ok=True)
+    for variant, compressed in variants:
+        variant.write_bytes(compressed)
+        variant.chmod(0o644)
+    return [variant for variant, _ in variants]
+
+
 def backup_file(path: Path) -> Path:
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup = path.with_suffix(path.suffix + f".bak{timestamp}")
@@ -144,8 +168,18 @@ def install(dry_run: bool = False) -> InstallResult:
         copy_file(component_src, component_dst)
         copied.append(str(component_dst))
 
-    # Web UI
+    # Web UI, served by the component and kept in Mainsail for existing bookmarks
     ui_src = SCRIPT_DIR / "scheduler_ui.html"
+    served_dst = WEB_UI_COMPONENT_DIR / "scheduler_ui.html"
+    if dry_run:
+        print(f"[DRY] Would copy {ui_src} -> {served_dst} and write compressed variants")
+    else:
+        copy_file(ui_src, served_dst)
+        copied.append(str(served_dst))
+        copied.extend(str(path) for path in write_compressed(served_dst))
+        if brotli is None:
+            warnings.append("Python brotli module not installed, the web UI is served with gzip only")
+
     ui_dst = MAINSAIL_DIR / "scheduler.html"
     if dry_run:
         print(f"[DRY] Would copy {ui_src} -> {ui_dst}")
@@ -212,7 +246,7 @@ def main() -> None:
             " 1. Verify moonraker.conf and KlipperScreen.conf updates (backups saved if modified).\n"
             " 2. Restart Moonraker: sudo systemctl restart moonraker\n"
             " 3. Restart KlipperScreen: sudo systemctl restart KlipperScreen\n"
-            " 4. Access the web UI at http://your-printer-ip/scheduler.html\n"
+            " 4. Access the web UI at http://your-printer-ip/server/macro_scheduler/ui\n"
         )
 
 
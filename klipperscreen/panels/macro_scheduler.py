@@ -1,5 +1,10 @@
+import functools
 import logging
-from typing import Any, Dict, List
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import gi
 
@@ -8,10 +13,27 @@ from gi.repository import Gtk, Pango, GLib
 
 from ks_includes.screen_panel import ScreenPanel
 
+# Moonraker requests run here so a slow response never blocks the GTK main loop,
+# the editor panel submits its requests through submit_request as well
+_API_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="macro_scheduler_api")
+
+
+def submit_request(func: Callable[..., Any], callback: Callable[[Future], Any], *args, **kwargs) -> Future:
+    """Run func(*args, **kwargs) on the worker pool, callback receives the
+    finished future on the GTK main loop"""
+    future = _API_POOL.submit(func, *args, **kwargs)
+    future.add_done_callback(lambda f: GLib.idle_add(callback, f))
+    return future
+
 
 class Panel(ScreenPanel):
     """KlipperScreen panel for viewing and managing Macro Scheduler entries."""
 
+    # Schedules are fetched a page at a time, so the widget count stays
+    # constant however many schedules exist
+    PAGE_SIZE = 20
+    FILTER_TYPES = ("once", "daily", "weekly", "interval", "cron", "solar", "sequence")
+
     def __init__(self, screen, title):
         title = title or _("Macro Scheduler")
         super().__init__(screen, title)
@@ -24,7 +46,7 @@ class Panel(ScreenPanel):
         refresh_btn.set_hexpand(False)
         refresh_btn.set_valign(Gtk.Align.CENTER)
         refresh_btn.set_vexpand(False)
-        refresh_btn.connect("clicked", self.refresh_schedules)
+        refresh_btn.connect("clicked", self._on_refresh_clicked)
         toolbar.pack_start(refresh_btn, False, False, 0)
 
         add_btn = self._gtk.Button("custom-script", _("New"), "color3", self.bts * 0.7, Gtk.PositionType.LEFT, 1)
@@ -35,6 +57,10 @@ class Panel(ScreenPanel):
         add_btn.connect("clicked", self._open_creator)
         toolbar.pack_start(add_btn, False, False, 0)
 
+        self.labels["busy"] = Gtk.Spinner()
+        self.labels["busy"].set_no_show_all(True)
+        toolbar.pack_start(self.labels["busy"], False, False, 0)
+
         self.labels["status"] = Gtk.Label(label=_("No schedules loaded"))
         self.labels["status"].set_xalign(0.0)
         self.labels["status"].set_yalign(0.5)
@@ -51,14 +77,81 @@ class Panel(ScreenPanel):
 
         scroll = self._gtk.ScrolledWindow()
         scroll.add(self.labels["schedule_grid"])
+        self.labels["scroll"] = scroll
 
         container = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         container.pack_start(toolbar, False, False, 0)
+        container.pack_start(self._build_filter_bar(), False, False, 0)
         container.pack_start(scroll, True, True, 0)
+        container.pack_start(self._build_page_bar(), False, False, 0)
 
         self.content.add(container)
+
+        self._page = 0
+        self._total = 0
+        self._filters: Dict[str, Any] = {"enabled": None, "schedule_type": None, "tag": None}
+
+        # Rows keyed by schedule id, reconciled against each refresh so only
+        # added, removed or changed schedules touch their widgets
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self.render_stats: Dict[str, Any] = {"renders": 0, "last_ms": 0.0, "max_ms": 0.0}
+        # Key -> (sequence, future, callback) of the latest request per key
+        self._requests: Dict[str, Tuple[int, Future, Callable[[Any], None]]] = {}
+        self._request_seq = 0
+        self._busy_count = 0
+        # Schedule id -> action of toggles and deletes awaiting the server
+        self._pending: Dict[int, str] = {}
+        # One timer drives the countdowns of all rows while the panel is shown
+        self._countdown_timer: Optional[int] = None
+        self._reload_timer: Optional[int] = None
+        self._load_tags()
         self.refresh_schedules()
 
+    def _build_filter_bar(self) -> Gtk.Box:
+        bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+
+        enabled_toggle = Gtk.ToggleButton(label=_("Enabled only"))
+        enabled_toggle.connect("toggled", self._on_filter_changed)
+        bar.pack_start(enabled_toggle, False, False, 0)
+        self.labels["filter_enabled"] = enabled_toggle
+
+        type_combo = Gtk.ComboBoxText()
+        type_combo.append("", _("All types"))
+        for schedule_type in self.FILTER_TYPES:
+            type_combo.append(schedule_type, schedule_type.title())
+        type_combo.set_active_id("")
+        type_combo.connect("changed", self._on_filter_changed)
+        bar.pack_start(type_combo, False, False, 0)
+        self.labels["filter_type"] = type_combo
+
+        tag_combo = Gtk.ComboBoxText()
+        tag_combo.append("", _("All tags"))
+        tag_combo.set_active_id("")
+        tag_combo.connect("changed", self._on_filter_changed)
+        bar.pack_start(tag_combo, False, False, 0)
+        self.labels["filter_tag"] = tag_combo
+        return bar
+
+    def _build_page_bar(self) -> Gtk.Box:
+        bar = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+
+        prev_btn = self._gtk.Button("arrow-left", _("Previous"), "color1", self.bts * 0.7, Gtk.PositionType.LEFT, 1)
+        prev_btn.get_style_context().add_class("buttons_slim")
+        prev_btn.connect("clicked", self._change_page, -1)
+        bar.pack_start(prev_btn, False, False, 0)
+        self.labels["page_prev"] = prev_btn
+
+        page_label = Gtk.Label(hexpand=True)
+        bar.pack_start(page_label, True, True, 0)
+        self.labels["page"] = page_label
+
+        next_btn = self._gtk.Button("arrow-right", _("Next"), "color1", self.bts * 0.7, Gtk.PositionType.RIGHT, 1)
+        next_btn.get_style_context().add_class("buttons_slim")
+        next_btn.connect("clicked", self._change_page, 1)
+        bar.pack_end(next_btn, False, False, 0)
+        self.labels["page_next"] = next_btn
+        return bar
+
     # ------------------------------------------------------------------ helpers
     def _set_status(self, message: str):
         if "status" in self.labels:
@@ -68,6 +161,7 @@ class Panel(ScreenPanel):
         grid = self.labels["schedule_grid"]
         for child in grid.get_children():
             grid.remove(child)
+        self._rows = {}
 
     def _render_placeholder(self, message: str):
         self._clear_schedule_rows()
@@ -94,11 +188,7 @@ class Panel(ScreenPanel):
         if schedule_type:
             pieces.append(schedule_type)
 
-        if schedule.get("enabled"):
-            next_run = schedule.get("next_run")
-            if next_run:
-                pieces.append(_("next: %s") % next_run)
-        else:
+        if not schedule.get("enabled"):
             pieces.append(_("disabled"))
 
         params = schedule.get("params")
@@ -108,79 +198,364 @@ class Panel(ScreenPanel):
 
         return " · ".join(pieces) if pieces else _("No additional details")
 
+    def _row_signature(self, schedule: Dict[str, Any]) -> Tuple[str, str, bool, Optional[str]]:
+        name = schedule.get("name") or _("Unnamed")
+        enabled = bool(schedule.get("enabled"))
+        next_run = schedule.get("next_run") if enabled else None
+        return name, self._format_details(schedule), enabled, next_run
+
+    @staticmethod
+    def _format_countdown(seconds: float) -> str:
+        if seconds <= 0:
+            return _("due now")
+        seconds = int(seconds)
+        days, seconds = divmod(seconds, 86400)
+        hours, seconds = divmod(seconds, 3600)
+        minutes, seconds = divmod(seconds, 60)
+        if days:
+            return _("in %dd %dh") % (days, hours)
+        if hours:
+            return _("in %dh %dm") % (hours, minutes)
+        if minutes:
+            return _("in %dm %ds") % (minutes, seconds)
+        return _("in %ds") % seconds
+
+    def _update_countdown(self, entry: Dict[str, Any], now: datetime):
+        next_run = entry["next_run"]
+        text = self._format_countdown((next_run - now).total_seconds()) if next_run else ""
+        if text != entry["countdown_text"]:
+            entry["countdown_text"] = text
+            entry["countdown"].set_text(text)
+            entry["countdown"].set_visible(bool(text))
+
+    def _create_toggle_button(self, schedule_id: int, enabled: bool):
+        toggle_icon = "pause" if enabled else "resume"
+        toggle_label = _("Disable") if enabled else _("Enable")
+        toggle_btn = self._gtk.Button(toggle_icon, toggle_label, "color3", self.bts, Gtk.PositionType.LEFT, 1)
+        toggle_btn.get_style_context().add_class("buttons_slim")
+        toggle_btn.set_hexpand(False)
+        toggle_btn.connect("clicked", self._toggle_schedule, schedule_id)
+        return toggle_btn
+
+    def _create_row(self, schedule_id: int) -> Dict[str, Any]:
+        row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10, hexpand=True)
+        row.get_style_context().add_class("frame-item")
+
+        info_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4, hexpand=True)
+
+        name_label = Gtk.Label(
+            halign=Gtk.Align.START,
+            valign=Gtk.Align.START,
+            hexpand=True,
+            wrap=True,
+            wrap_mode=Pango.WrapMode.WORD_CHAR,
+        )
+        info_box.add(name_label)
+
+        details_label = Gtk.Label(
+            halign=Gtk.Align.START,
+            valign=Gtk.Align.START,
+            hexpand=True,
+            wrap=True,
+            wrap_mode=Pango.WrapMode.WORD_CHAR,
+        )
+        info_box.add(details_label)
+
+        countdown_label = Gtk.Label(halign=Gtk.Align.START, valign=Gtk.Align.START)
+        countdown_label.set_no_show_all(True)
+        info_box.add(countdown_label)
+
+        row.add(info_box)
+
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+
+        delete_btn = self._gtk.Button("delete", _("Delete"), "color2", self.bts, Gtk.PositionType.LEFT, 1)
+        delete_btn.get_style_context().add_class("buttons_slim")
+        delete_btn.set_hexpand(False)
+        delete_btn.connect("clicked", self._delete_schedule, schedule_id)
+        button_box.pack_end(delete_btn, False, False, 0)
+
+        row.add(button_box)
+        return {
+            "box": row,
+            "name": name_label,
+            "details": details_label,
+            "countdown": countdown_label,
+            "countdown_text": "",
+            "next_run": None,
+            "buttons": button_box,
+            "toggle": None,
+            "signature": None,
+            "schedule": {},
+            "position": None,
+        }
+
+    def _update_row(self, schedule_id: int, entry: Dict[str, Any], signature: Tuple[str, str, bool, Optional[str]]):
+        old = entry["signature"]
+        name, details, enabled, next_run = signature
+        if old is None or old[0] != name:
+            entry["name"].set_markup(f"<big><b>{GLib.markup_escape_text(name)}</b></big>")
+        if old is None or old[1] != details:
+            entry["details"].set_text(details)
+        if old is None or old[2] != enabled:
+            if entry["toggle"] is not None:
+                entry["buttons"].remove(entry["toggle"])
+                entry["toggle"].destroy()
+            entry["toggle"] = self._create_toggle_button(schedule_id, enabled)
+            entry["buttons"].pack_start(entry["toggle"], False, False, 0)
+            entry["toggle"].show_all()
+        if old is None or old[3] != next_run:
+            try:
+                entry["next_run"] = datetime.fromisoformat(next_run) if next_run else None
+            except ValueError:
+                entry["next_run"] = None
+            self._update_countdown(entry, datetime.now())
+        entry["signature"] = signature
+
     def _render_schedule_rows(self, schedules: List[Dict[str, Any]]):
-        self._clear_schedule_rows()
+        start = time.perf_counter()
         grid = self.labels["schedule_grid"]
 
+        schedules = [s for s in schedules if s.get("id") is not None]
         if not schedules:
             self._render_placeholder(_("No schedules configured"))
             return
+        if not self._rows:
+            # Drop the placeholder left by an empty or failed load
+            self._clear_schedule_rows()
 
         schedules = sorted(schedules, key=lambda s: s.get("name", "").lower())
+        seen = set()
+        added = updated = 0
         for idx, schedule in enumerate(schedules):
-            schedule_id = schedule.get("id")
-            if schedule_id is None:
-                continue
+            schedule_id = int(schedule["id"])
+            seen.add(schedule_id)
+            signature = self._row_signature(schedule)
+            entry = self._rows.get(schedule_id)
+            if entry is None:
+                entry = self._create_row(schedule_id)
+                self._rows[schedule_id] = entry
+                added += 1
+            elif schedule_id in self._pending:
+                # Keep the optimistic state until the server responds
+                signature = entry["signature"]
+            elif entry["signature"] != signature:
+                updated += 1
+            if entry["signature"] != signature:
+                self._update_row(schedule_id, entry, signature)
+                entry["schedule"] = schedule
+            if entry["position"] != idx:
+                if entry["position"] is None:
+                    grid.attach(entry["box"], 0, idx, 1, 1)
+                    entry["box"].show_all()
+                else:
+                    grid.child_set_property(entry["box"], "top-attach", idx)
+                entry["position"] = idx
+
+        removed = [schedule_id for schedule_id in self._rows if schedule_id not in seen]
+        for schedule_id in removed:
+            entry = self._rows.pop(schedule_id)
+            grid.remove(entry["box"])
+            entry["box"].destroy()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        stats = self.render_stats
+        stats["renders"] += 1
+        stats["last_ms"] = elapsed
+        stats["max_ms"] = max(stats["max_ms"], elapsed)
+        logging.debug(
+            "Rendered %d schedule row(s) in %.1f ms: %d added, %d updated, %d removed",
+            len(schedules), elapsed, added, updated, len(removed),
+        )
 
-            row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10, hexpand=True)
-            row.get_style_context().add_class("frame-item")
-
-            info_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4, hexpand=True)
-
-            name = schedule.get("name") or _("Unnamed")
-            name_label = Gtk.Label(
-                halign=Gtk.Align.START,
-                valign=Gtk.Align.START,
-                hexpand=True,
-                wrap=True,
-                wrap_mode=Pango.WrapMode.WORD_CHAR,
-            )
-            name_label.set_markup(f"<big><b>{GLib.markup_escape_text(name)}</b></big>")
-            info_box.add(name_label)
-
-            details_label = Gtk.Label(
-                label=self._format_details(schedule),
-                halign=Gtk.Align.START,
-                valign=Gtk.Align.START,
-                hexpand=True,
-                wrap=True,
-                wrap_mode=Pango.WrapMode.WORD_CHAR,
-            )
-            info_box.add(details_label)
-
-            row.add(info_box)
-
-            button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
-
-            toggle_icon = "pause" if schedule.get("enabled") else "resume"
-            toggle_label = _("Disable") if schedule.get("enabled") else _("Enable")
-            toggle_btn = self._gtk.Button(toggle_icon, toggle_label, "color3", self.bts, Gtk.PositionType.LEFT, 1)
-            toggle_btn.get_style_context().add_class("buttons_slim")
-            toggle_btn.set_hexpand(False)
-            toggle_btn.connect("clicked", self._toggle_schedule, int(schedule_id))
-            button_box.add(toggle_btn)
-
-            delete_btn = self._gtk.Button("delete", _("Delete"), "color2", self.bts, Gtk.PositionType.LEFT, 1)
-            delete_btn.get_style_context().add_class("buttons_slim")
-            delete_btn.set_hexpand(False)
-            delete_btn.connect("clicked", self._delete_schedule, int(schedule_id))
-            button_box.add(delete_btn)
-
-            row.add(button_box)
-            grid.attach(row, 0, idx, 1, 1)
-
-        grid.show_all()
+    # ------------------------------------------------------------ live updates
+    def activate(self):
+        if self._countdown_timer is None:
+            self._countdown_timer = GLib.timeout_add_seconds(1, self._tick_countdowns)
+
+    def deactivate(self):
+        if self._countdown_timer is not None:
+            GLib.source_remove(self._countdown_timer)
+            self._countdown_timer = None
+
+    def _tick_countdowns(self):
+        now = datetime.now()
+        for entry in self._rows.values():
+            self._update_countdown(entry, now)
+        return True
+
+    def _matches_filters(self, schedule: Dict[str, Any]) -> bool:
+        filters = self._filters
+        if filters["enabled"] is not None and bool(schedule.get("enabled")) != filters["enabled"]:
+            return False
+        if filters["schedule_type"] and schedule.get("schedule_type") != filters["schedule_type"]:
+            return False
+        if filters["tag"] and filters["tag"] not in (schedule.get("tags") or []):
+            return False
+        return True
+
+    def _schedule_reload(self):
+        """Refetch the current page once a burst of notifications settles"""
+        if self._reload_timer is not None:
+            return
+
+        def _reload():
+            self._reload_timer = None
+            self.refresh_schedules()
+            return False
+
+        self._reload_timer = GLib.timeout_add(300, _reload)
+
+    def process_update(self, action, data):
+        if action != "notify_macro_scheduler_changed" or not isinstance(data, dict):
+            return
+        if data.get("reload"):
+            self._schedule_reload()
+            return
+        needs_reload = False
+        for schedule in data.get("schedules", []):
+            if schedule.get("id") in self._pending:
+                continue
+            entry = self._rows.get(schedule.get("id"))
+            if entry is None:
+                # New, or changed into the current page and filters
+                needs_reload = needs_reload or self._matches_filters(schedule)
+                continue
+            signature = self._row_signature(schedule)
+            if signature[0] != entry["signature"][0] or not self._matches_filters(schedule):
+                # Renamed rows may move to another page, filtered ones leave
+                needs_reload = True
+            elif signature != entry["signature"]:
+                self._update_row(schedule["id"], entry, signature)
+                entry["schedule"] = schedule
+        if any(
+            schedule_id in self._rows and schedule_id not in self._pending
+            for schedule_id in data.get("removed", [])
+        ):
+            needs_reload = True
+        if needs_reload:
+            self._schedule_reload()
 
     # --------------------------------------------------------------- API calls
+    def _set_busy(self, delta: int):
+        self._busy_count += delta
+        spinner = self.labels["busy"]
+        if self._busy_count > 0:
+            spinner.show()
+            spinner.start()
+        else:
+            spinner.stop()
+            spinner.hide()
+
+    def _submit_request(self, key: str, func: Callable[[], Any], callback: Callable[[Any], None]):
+        """Run func on the worker pool, callback receives its result on the main loop
+
+        A newer request with the same key supersedes an older one: the older
+        request is cancelled if it has not started, and its response is
+        discarded otherwise.
+        """
+        previous = self._requests.get(key)
+        if previous is not None:
+            previous[1].cancel()
+        self._request_seq += 1
+        seq = self._request_seq
+        future = submit_request(func, functools.partial(self._finish_request, key, seq))
+        self._requests[key] = (seq, future, callback)
+        self._set_busy(1)
+
+    def _finish_request(self, key: str, seq: int, future: Future):
+        self._set_busy(-1)
+        current = self._requests.get(key)
+        if current is None or current[0] != seq or future.cancelled():
+            logging.debug("Discarding stale %s response", key)
+            return False
+        del self._requests[key]
+        try:
+            result = future.result()
+        except Exception as exc:
+            logging.error("Macro Scheduler request %s failed: %s", key, exc)
+            result = None
+        current[2](result)
+        return False
+
+    def _on_refresh_clicked(self, _widget=None):
+        self._load_tags()
+        self.refresh_schedules()
+
+    def _on_filter_changed(self, _widget=None):
+        enabled = self.labels["filter_enabled"].get_active()
+        self._filters = {
+            "enabled": True if enabled else None,
+            "schedule_type": self.labels["filter_type"].get_active_id() or None,
+            "tag": self.labels["filter_tag"].get_active_id() or None,
+        }
+        self._page = 0
+        self.refresh_schedules()
+
+    def _change_page(self, _widget, step: int):
+        page = self._page + step
+        if page < 0 or page * self.PAGE_SIZE >= self._total:
+            return
+        self._page = page
+        self.labels["scroll"].get_vadjustment().set_value(0)
+        self.refresh_schedules()
+
+    def _schedules_query(self) -> str:
+        query: Dict[str, Any] = {
+            "sort": "name",
+            "offset": self._page * self.PAGE_SIZE,
+            "limit": self.PAGE_SIZE,
+        }
+        if self._filters["enabled"] is not None:
+            query["enabled"] = "true" if self._filters["enabled"] else "false"
+        for key in ("schedule_type", "tag"):
+            if self._filters[key]:
+                query[key] = self._filters[key]
+        return f"server/macro_scheduler/schedules?{urlencode(query)}"
+
+    def _load_tags(self):
+        apiclient = getattr(self._screen, "apiclient", None)
+        if not apiclient:
+            return
+        self._submit_request(
+            "tags",
+            lambda: apiclient.send_request("server/macro_scheduler/tags"),
+            self._on_tags_loaded,
+        )
+
+    def _on_tags_loaded(self, response):
+        if not response or not isinstance(response.get("tags"), dict):
+            return
+        combo = self.labels["filter_tag"]
+        active = self._filters["tag"]
+        tags = sorted(response["tags"])
+        if active and active not in tags:
+            tags.append(active)
+        # Rebuilding the model emits "changed", keep the current filter
+        combo.handler_block_by_func(self._on_filter_changed)
+        combo.remove_all()
+        combo.append("", _("All tags"))
+        for tag in tags:
+            combo.append(tag, tag)
+        combo.set_active_id(active or "")
+        combo.handler_unblock_by_func(self._on_filter_changed)
+
     def refresh_schedules(self, _widget=None):
-        if not getattr(self._screen, "apiclient", None):
+        apiclient = getattr(self._screen, "apiclient", None)
+        if not apiclient:
             self._render_placeholder(_("Moonraker connection unavailable"))
             self._set_status(_("Not connected"))
             return
 
         self._set_status(_("Loading schedules…"))
-        response = self._screen.apiclient.send_request("server/macro_scheduler/schedules")
+        query = self._schedules_query()
+        self._submit_request(
+            "refresh",
+            lambda: apiclient.send_request(query),
+            self._on_schedules_loaded,
+        )
 
+    def _on_schedules_loaded(self, response):
         if not response or "schedules" not in response:
             logging.error("Failed to load schedules: %s", response)
             self._render_placeholder(_("Unable to load schedules"))
@@ -188,34 +563,118 @@ class Panel(ScreenPanel):
             return
 
         schedules = response.get("schedules", [])
-        self._render_schedule_rows(schedules)
-        self._set_status(_("%d schedule(s) loaded") % len(schedules))
+        self._total = int(response.get("total", len(schedules)))
+        if not schedules and self._page > 0:
+            # The page emptied, e.g. after deleting its last schedules
+            self._page = max(0, (self._total - 1) // self.PAGE_SIZE)
+            self.refresh_schedules()
+            return
+        if not schedules and any(value is not None for value in self._filters.values()):
+            self._render_placeholder(_("No matching schedules"))
+        else:
+            self._render_schedule_rows(schedules)
+        self._update_page_bar(len(schedules))
+        self._set_status(_("%d schedule(s)") % self._total)
+
+    def _update_page_bar(self, count: int):
+        first = self._page * self.PAGE_SIZE
+        if count:
+            self.labels["page"].set_text(f"{first + 1}–{first + count} / {self._total}")
+        else:
+            self.labels["page"].set_text("")
+        self.labels["page_prev"].set_sensitive(self._page > 0)
+        self.labels["page_next"].set_sensitive(first + count < self._total)
+
+    @staticmethod
+    def _response_result(response) -> Optional[Dict[str, Any]]:
+        if not isinstance(response, dict) or "error" in response:
+            return None
+        result = response.get("result", response)
+        return result if isinstance(result, dict) else None
+
+    def _set_row_pending(self, entry: Dict[str, Any], pending: bool):
+        entry["box"].set_opacity(0.5 if pending else 1.0)
+        entry["buttons"].set_sensitive(not pending)
+
+    def _post_action(self, action: str, schedule_id: int, callback: Callable[[Optional[Dict[str, Any]]], None]):
+        apiclient = getattr(self._screen, "apiclient", None)
+        if not apiclient:
+            callback(None)
+            return
+        self._submit_request(
+            f"{action}:{schedule_id}",
+            lambda: apiclient.post_request(
+                f"server/macro_scheduler/{action}",
+                json={"id": schedule_id},
+            ),
+            lambda response: callback(self._response_result(response)),
+        )
 
     def _toggle_schedule(self, _widget, schedule_id: int):
-        if not getattr(self._screen, "apiclient", None):
+        entry = self._rows.get(schedule_id)
+        if entry is None or schedule_id in self._pending:
             return
 
-        result = self._screen.apiclient.post_request(
-            "server/macro_scheduler/toggle",
-            json={"id": schedule_id},
-        )
-        if not result:
-            self._screen.show_popup_message(_("Failed to toggle schedule"), level=2)
-            return
-        self.refresh_schedules()
+        # Show the new state right away, the server response confirms it
+        previous = (entry["signature"], entry["schedule"])
+        schedule = {**entry["schedule"], "enabled": not previous[0][2]}
+        self._pending[schedule_id] = "toggle"
+        self._update_row(schedule_id, entry, self._row_signature(schedule))
+        entry["schedule"] = schedule
+        self._set_row_pending(entry, True)
+
+        def _on_result(result):
+            self._pending.pop(schedule_id, None)
+            entry = self._rows.get(schedule_id)
+            if entry is None:
+                return
+            self._set_row_pending(entry, False)
+            confirmed = result.get("schedule") if result else None
+            if not isinstance(confirmed, dict):
+                self._update_row(schedule_id, entry, previous[0])
+                entry["schedule"] = previous[1]
+                self._screen.show_popup_message(_("Failed to toggle schedule"), level=2)
+                return
+            if not self._matches_filters(confirmed):
+                self._schedule_reload()
+                return
+            signature = self._row_signature(confirmed)
+            if signature != entry["signature"]:
+                self._update_row(schedule_id, entry, signature)
+            entry["schedule"] = confirmed
+
+        self._post_action("toggle", schedule_id, _on_result)
 
     def _delete_schedule(self, _widget, schedule_id: int):
-        if not getattr(self._screen, "apiclient", None):
+        entry = self._rows.get(schedule_id)
+        if entry is None or schedule_id in self._pending:
             return
 
-        result = self._screen.apiclient.post_request(
-            "server/macro_scheduler/delete",
-            json={"id": schedule_id},
-        )
-        if not result:
-            self._screen.show_popup_message(_("Failed to delete schedule"), level=2)
-            return
-        self.refresh_schedules()
+        self._pending[schedule_id] = "delete"
+        self._set_row_pending(entry, True)
+        entry["box"].hide()
+
+        def _on_result(result):
+            self._pending.pop(schedule_id, None)
+            entry = self._rows.get(schedule_id)
+            if not result or "deleted" not in result:
+                if entry is not None:
+                    self._set_row_pending(entry, False)
+                    entry["box"].show()
+                self._screen.show_popup_message(_("Failed to delete schedule"), level=2)
+                return
+            if entry is not None:
+                del self._rows[schedule_id]
+                self.labels["schedule_grid"].remove(entry["box"])
+                entry["box"].destroy()
+            self._total = max(0, self._total - 1)
+            self._set_status(_("%d schedule(s)") % self._total)
+            self._update_page_bar(len(self._rows))
+            if not self._rows or self._total > self._page * self.PAGE_SIZE + len(self._rows):
+                # Pull the next schedules up into the page
+                self._schedule_reload()
+
+        self._post_action("delete", schedule_id, _on_result)
 
     def _open_creator(self, _widget=None):
         # Remove existing editor instances so the back stack remains clean
@@ -1,6 +1,9 @@
+import bisect
+import functools
 import logging
 from datetime import datetime, date
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import gi
 
@@ -8,12 +11,19 @@ gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, GLib
 
 from ks_includes.screen_panel import ScreenPanel
+from panels.macro_scheduler import submit_request
+
+# Sorted macro names shared by every editor, refreshed from the server's
+# cached catalogue in the background
+_MACRO_CACHE: List[str] = []
+MAX_SUGGESTIONS = 50
+CRON_PREVIEW_DELAY_MS = 400
 
 
 class Panel(ScreenPanel):
-    """Panel for creating Macro Scheduler entries (except cron schedules)."""
+    """Panel for creating Macro Scheduler entries."""
 
-    SUPPORTED_TYPES = ("once", "daily", "weekly", "interval")
+    SUPPORTED_TYPES = ("once", "daily", "weekly", "interval", "cron")
     WEEKDAY_LABELS = [
         _("Mon"),
         _("Tue"),
@@ -42,11 +52,24 @@ class Panel(ScreenPanel):
         self._weekly_time_controls: Dict[str, Any] = {}
         self._interval_spin: Optional[Gtk.SpinButton] = None
         self._combo_drop_times: Dict[int, datetime] = {}
+        self._macro_store: Optional[Gtk.ListStore] = None
+        # (prefix, start, end) of the names matching the last typed prefix
+        self._macro_range: Optional[Tuple[str, int, int]] = None
+        self._macro_shown: List[str] = []
+        self._cron_entry: Optional[Gtk.Entry] = None
+        self._cron_preview: Optional[Gtk.Label] = None
+        self._cron_timer: Optional[int] = None
+        # (expression, valid, error) of the last server preview
+        self._cron_result: Optional[Tuple[str, bool, Optional[str]]] = None
+        self._create_btn: Optional[Gtk.Button] = None
+        self._busy_spinner: Optional[Gtk.Spinner] = None
+        self._creating = False
 
         for child in self.content.get_children():
             self.content.remove(child)
 
         self._build_form()
+        self._load_macros()
 
     # ------------------------------------------------------------------ layout
     def _build_form(self):
@@ -90,6 +113,7 @@ class Panel(ScreenPanel):
         self._stack.add_named(self._build_daily_page(), "daily")
         self._stack.add_named(self._build_weekly_page(), "weekly")
         self._stack.add_named(self._build_interval_page(), "interval")
+        self._stack.add_named(self._build_cron_page(), "cron")
         self._stack.set_visible_child_name("once")
 
         self._hook_keyboard_entries()
@@ -114,6 +138,7 @@ class Panel(ScreenPanel):
         fields = [
             self._name_entry,
             self._params_entry,
+            self._cron_entry,
         ]
         for field in fields:
             if isinstance(field, Gtk.Entry):
@@ -157,6 +182,9 @@ class Panel(ScreenPanel):
         if isinstance(self._interval_spin, Gtk.SpinButton):
             self._interval_spin.set_value(60)
 
+        if isinstance(self._cron_entry, Gtk.Entry):
+            self._cron_entry.set_text("")
+
     @staticmethod
     def _apply_toggle_style(button: Gtk.ToggleButton):
         ctx = button.get_style_context()
@@ -207,10 +235,12 @@ class Panel(ScreenPanel):
         lbl.set_yalign(0.5)
         grid.attach(lbl, 0, row, 1, 1)
 
+        if not _MACRO_CACHE:
+            _MACRO_CACHE[:] = sorted({macro.upper() for macro in self._printer.get_gcode_macros() or []})
+
+        # Holds at most MAX_SUGGESTIONS names matching the typed prefix
         store = Gtk.ListStore(str)
-        macros = sorted(self._printer.get_gcode_macros() or [])
-        for macro in macros:
-            store.append([macro])
+        self._macro_store = store
 
         combo = Gtk.ComboBox.new_with_model_and_entry(store)
         combo.set_hexpand(True)
@@ -220,12 +250,61 @@ class Panel(ScreenPanel):
         entry = combo.get_child()
         if isinstance(entry, Gtk.Entry):
             entry.set_placeholder_text(_("Green"))
+            completion = Gtk.EntryCompletion(model=store)
+            completion.set_text_column(0)
+            completion.set_minimum_key_length(1)
+            # The store only holds matches already
+            completion.set_match_func(lambda *_args: True)
+            entry.set_completion(completion)
+            entry.connect("changed", self._on_macro_text_changed)
             entry.connect("touch-event", self._show_keyboard_delayed)
             entry.connect("button-press-event", self._show_keyboard_delayed)
             entry.connect("focus-out-event", self._screen.remove_keyboard)
         grid.attach(combo, 1, row, 1, 1)
+        self._filter_macros("")
         return combo
 
+    def _filter_macros(self, text: str):
+        """Show the names starting with text, narrowing the previous match range while typing"""
+        prefix = text.strip().upper()
+        names = _MACRO_CACHE
+        start, end = 0, len(names)
+        if self._macro_range is not None and prefix.startswith(self._macro_range[0]):
+            start, end = self._macro_range[1], self._macro_range[2]
+        start = bisect.bisect_left(names, prefix, start, end)
+        end = bisect.bisect_left(names, prefix + "\uffff", start, end)
+        self._macro_range = (prefix, start, end)
+
+        shown = names[start:min(end, start + MAX_SUGGESTIONS)]
+        if shown == self._macro_shown or self._macro_store is None:
+            return
+        self._macro_shown = shown
+        self._macro_store.clear()
+        for macro in shown:
+            self._macro_store.append([macro])
+
+    def _on_macro_text_changed(self, entry: Gtk.Entry):
+        self._filter_macros(entry.get_text())
+
+    def _load_macros(self):
+        apiclient = getattr(self._screen, "apiclient", None)
+        if not apiclient:
+            return
+        submit_request(apiclient.send_request, self._on_macros_loaded, "server/macro_scheduler/macros")
+
+    def _on_macros_loaded(self, future):
+        try:
+            result = future.result()
+        except Exception as exc:
+            logging.error("Failed to load macros: %s", exc)
+            return False
+        if not isinstance(result, dict) or not isinstance(result.get("macros"), list):
+            return False
+        _MACRO_CACHE[:] = sorted(macro["name"] for macro in result["macros"])
+        self._macro_range = None
+        self._filter_macros(self._get_macro_text())
+        return False
+
     def _add_type_selector(self, grid: Gtk.Grid, row: int) -> Gtk.ComboBoxText:
         lbl = Gtk.Label(label=_("Type:"))
         lbl.set_xalign(0.0)
@@ -294,6 +373,22 @@ class Panel(ScreenPanel):
         self._interval_spin = spin
         return box
 
+    def _build_cron_page(self) -> Gtk.Box:
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        entry = Gtk.Entry()
+        entry.set_hexpand(True)
+        entry.set_placeholder_text("0 9 * * 1")
+        entry.set_tooltip_text(_("minute hour day month weekday (0 = Sunday), e.g. */15 8 * * 1,3,5"))
+        entry.connect("changed", self._on_cron_changed)
+        self._cron_entry = entry
+        box.pack_start(self._wrap_with_label(_("Expression"), entry), False, False, 0)
+
+        preview = Gtk.Label(halign=Gtk.Align.START, wrap=True)
+        preview.set_xalign(0.0)
+        self._cron_preview = preview
+        box.pack_start(preview, False, False, 0)
+        return box
+
     def _wrap_with_label(self, text: str, widget: Gtk.Widget) -> Gtk.Box:
         lbl = Gtk.Label(label=f"{text}:")
         lbl.set_xalign(0.0)
@@ -323,6 +418,11 @@ class Panel(ScreenPanel):
         create_btn.set_vexpand(False)
         create_btn.connect("clicked", self._create_schedule)
         footer.pack_end(create_btn, False, False, 0)
+        self._create_btn = create_btn
+
+        self._busy_spinner = Gtk.Spinner()
+        self._busy_spinner.set_no_show_all(True)
+        footer.pack_end(self._busy_spinner, False, False, 0)
 
         return footer
 
@@ -350,6 +450,55 @@ class Panel(ScreenPanel):
         if selected in self.SUPPORTED_TYPES:
             self._stack.set_visible_child_name(selected or "once")
 
+    def _on_cron_changed(self, entry: Gtk.Entry):
+        # Ask the server once typing pauses
+        if self._cron_timer is not None:
+            GLib.source_remove(self._cron_timer)
+        self._cron_timer = GLib.timeout_add(CRON_PREVIEW_DELAY_MS, self._request_cron_preview)
+
+    def _request_cron_preview(self):
+        self._cron_timer = None
+        expression = self._cron_entry.get_text().strip() if self._cron_entry else ""
+        apiclient = getattr(self._screen, "apiclient", None)
+        if not expression or not apiclient:
+            self._cron_preview.set_text("")
+            return False
+        self._cron_preview.set_text(_("Checking…"))
+        query = urlencode({"schedule_type": "cron", "cron_expression": expression, "count": 5})
+        submit_request(
+            apiclient.send_request,
+            functools.partial(self._on_cron_preview, expression),
+            f"server/macro_scheduler/preview?{query}",
+        )
+        return False
+
+    def _on_cron_preview(self, expression: str, future):
+        if not self._cron_entry or self._cron_entry.get_text().strip() != expression:
+            # The expression changed while the request was in flight
+            return False
+        try:
+            result = future.result()
+        except Exception as exc:
+            logging.error("Cron preview failed: %s", exc)
+            result = None
+        if not isinstance(result, dict):
+            self._cron_result = None
+            self._cron_preview.set_text(_("Preview unavailable"))
+            return False
+        valid = bool(result.get("valid"))
+        self._cron_result = (expression, valid, result.get("error"))
+        if not valid:
+            self._cron_preview.set_text(result.get("error") or _("Invalid expression"))
+            return False
+        runs = []
+        for run in result.get("runs", []):
+            try:
+                runs.append(datetime.fromisoformat(run).strftime("%a %Y-%m-%d %H:%M"))
+            except ValueError:
+                runs.append(run)
+        self._cron_preview.set_text(_("Next runs:") + "\n" + "\n".join(runs))
+        return False
+
     def _go_back(self, _widget=None):
         if self._screen._cur_panels and self._screen._cur_panels[-1] == "macro_scheduler_editor":
             # Return to the listing panel when exiting the editor
@@ -357,15 +506,41 @@ class Panel(ScreenPanel):
         else:
             self._screen._menu_go_back(True)
 
+    def _set_busy(self, busy: bool):
+        self._creating = busy
+        if self._create_btn:
+            self._create_btn.set_sensitive(not busy)
+        if self._busy_spinner:
+            if busy:
+                self._busy_spinner.show()
+                self._busy_spinner.start()
+            else:
+                self._busy_spinner.stop()
+                self._busy_spinner.hide()
+
     def _create_schedule(self, widget):
+        if self._creating:
+            return
         payload = self._collect_payload()
         if not payload:
             return
 
-        result = self._screen.apiclient.post_request(
+        apiclient = self._screen.apiclient
+        self._set_busy(True)
+        submit_request(
+            apiclient.post_request,
+            self._on_schedule_created,
             "server/macro_scheduler/add",
             json=payload,
         )
+
+    def _on_schedule_created(self, future):
+        self._set_busy(False)
+        try:
+            result = future.result()
+        except Exception as exc:
+            logging.error("Scheduler creation request failed: %s", exc)
+            result = None
         schedule = None
         if isinstance(result, dict):
             if "schedule" in result:
@@ -375,11 +550,12 @@ class Panel(ScreenPanel):
         if not schedule:
             self._screen.show_popup_message(_("Failed to create schedule"), level=2)
             logging.error("Scheduler creation failed: %s", result)
-            return
+            return False
 
         self._screen.show_popup_message(_("Schedule created"), level=1)
         self._reset_form()
         self._screen.show_panel("macro_scheduler", title=_("Macro Scheduler"), panel_name="macro_scheduler")
+        return False
 
     # -------------------------------------------------------------- validation
     def _collect_payload(self) -> Optional[Dict]:
@@ -428,6 +604,8 @@ class Panel(ScreenPanel):
                 payload.update(self._collect_weekly_fields())
             elif schedule_type == "interval":
                 payload.update(self._collect_interval_fields())
+            elif schedule_type == "cron":
+                payload.update(self._collect_cron_fields())
         except ValueError as exc:
             self._screen.show_popup_message(str(exc), level=2)
             return None
@@ -485,6 +663,14 @@ class Panel(ScreenPanel):
             raise ValueError(_("Interval must be greater than zero"))
         return {"interval_minutes": minutes}
 
+    def _collect_cron_fields(self) -> Dict[str, str]:
+        expression = self._cron_entry.get_text().strip() if self._cron_entry else ""
+        if not expression:
+            raise ValueError(_("Cron expression is required"))
+        if self._cron_result and self._cron_result[0] == expression and not self._cron_result[1]:
+            raise ValueError(self._cron_result[2] or _("Invalid expression"))
+        return {"cron_expression": expression}
+
     def _build_time_selector(self, default: str = "12:00") -> (Gtk.Box, Dict[str, Any]):
         try:
             default_dt = datetime.strptime(default, "%H:%M")
@@ -7,8 +7,749 @@
 
 import logging
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Any, List
+import bisect
+import configparser
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Any, Callable, Deque, List, Optional, Set, Tuple
+
+try:
+    from tornado.web import RequestHandler
+except ImportError:
+    # Outside Moonraker, e.g. tools/soak_simulation.py, the web UI is not served
+    RequestHandler = object
+
+MISFIRE_POLICIES = ("run_once", "run_all", "skip")
+RATE_LIMIT_MODES = ("queue", "drop")
+
+# Longest single sleep of a schedule loop before the wall clock is checked
+MAX_SLEEP_SECONDS = 300.
+
+# Largest width and precision of a template format spec, larger values
+# render G-code lines of that size on every fire
+TEMPLATE_MAX_SPEC_WIDTH = 64
+# [[fill]align][sign][z][#][0][width][grouping][.precision][type]
+FORMAT_SPEC = re.compile(
+    r"^(?:.?[<>=^])?[+\- ]?z?#?0?(?P<width>\d*)[,_]?"
+    r"(?:\.(?P<precision>\d+))?[a-zA-Z%]?$",
+    re.DOTALL
+)
+
+# Prefix of the RESPOND lines bracketing scheduled scripts when
+# capture_markers is enabled
+OUTPUT_MARKER = "macro_scheduler"
+OUTPUT_MAX_LINE_LENGTH = 256
+# Periodic temperature reports, these are never attributed to a run
+TEMPERATURE_REPORT = re.compile(r"^(ok\s+)?[BT]\d*:-?\d")
+
+# Learned lead time of prepare macros: longest of the recent successful
+# prepare runs plus a margin
+PREPARE_SAMPLES = 5
+PREPARE_LEAD_MARGIN = 1.1
+
+# Solar events -> (zenith angle in degrees, rising)
+SOLAR_EVENTS: Dict[str, Tuple[float, bool]] = {
+    "sunrise": (90.833, True),
+    "sunset": (90.833, False),
+    "civil_dawn": (96., True),
+    "civil_dusk": (96., False)
+}
+
+# Exclusion windows are expanded into intervals this far ahead
+EXCLUSION_HORIZON_DAYS = 400
+# Upper bound of occurrences skipped while looking for an allowed run
+MAX_EXCLUSION_SKIPS = 1000
+
+# Standard G, M and T codes, always accepted by macro validation
+STANDARD_GCODE = re.compile(r"^[GMT]\d+(\.\d+)?$", re.IGNORECASE)
+# Klipper object name prefix of G-code macros
+MACRO_OBJECT_PREFIX = "gcode_macro "
+# Help text Klipper gives macros without a description
+MACRO_DEFAULT_HELP = "G-Code macro"
+
+# Declarative schedule file, one "[schedule <name>]" section per schedule
+SCHEDULE_SECTION = re.compile(r"^\[\s*schedule\s+(.+?)\s*\]\s*$")
+# Editors often save in several steps, changes are applied once the file
+# has been quiet for this long
+FILE_RELOAD_DELAY = .5
+
+# Cron fields as (name, minimum, maximum, "*/N" allowed, lists allowed),
+# matching what _calculate_next_cron_run understands
+CRON_FIELDS = (
+    ("minute", 0, 59, True, False),
+    ("hour", 0, 23, True, False),
+    ("day", 1, 31, False, False),
+    ("month", 1, 12, False, False),
+    ("weekday", 0, 6, False, True)
+)
+PREVIEW_MAX_RUNS = 50
+
+# Larger batches of changes notify clients to reload instead
+NOTIFY_MAX_SCHEDULES = 100
+CHANGE_LOG_MAX = 1000
+
+# Orders accepted by the schedules endpoint
+SCHEDULE_SORT_KEYS = ("id", "name", "next_run")
+# Schedule fields tracking the schedule file, not returned by the API
+FILE_FIELDS = ("file_section", "file_digest")
+
+# Schedule definition fields written by exports, in CSV column order
+EXPORT_FIELDS = (
+    "name", "macro", "schedule_type", "enabled", "datetime", "time", "days",
+    "interval_minutes", "cron_expression", "latitude", "longitude",
+    "solar_event", "offset_minutes", "trigger_type", "steps",
+    "budget_seconds", "params", "tags", "max_retries",
+    "retry_backoff_seconds", "misfire_policy", "misfire_grace_seconds",
+    "prepare_macro", "prepare_params", "lead_seconds"
+)
+# Fields holding lists or objects, JSON encoded in CSV cells
+IMPORT_JSON_FIELDS = ("days", "steps", "params", "tags", "prepare_params")
+EXPORT_FORMATS = ("jsonl", "csv")
+# First line of JSON Lines exports, skipped as a comment on import. Exports
+# only replace files starting with it or with the CSV header
+EXPORT_MARKER = "# macro_scheduler export"
+IMPORT_MAX_ERRORS = 100
+
+# CPU heavy work runs on a small thread pool so the event loop keeps
+# serving Moonraker. Listing and compiling fewer schedules than
+# OFFLOAD_MIN_SCHEDULES is cheaper inline than the thread hop
+OFFLOAD_WORKERS = 2
+OFFLOAD_THREAD_NAME = "macro_scheduler_worker"
+OFFLOAD_MIN_SCHEDULES = 500
+# Wake-ups of the latency probe later than this count as stalls
+LOOP_STALL_SECONDS = .1
+
+# Web UI page installed next to the component by install.py, together with
+# precompressed variants. Encodings in order of preference
+WEB_UI_FILE = "macro_scheduler_ui/scheduler_ui.html"
+WEB_UI_ROUTE = "/server/macro_scheduler/ui/?"
+WEB_UI_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+class CircuitBreaker:
+    """Tracks consecutive failures of a single macro
+
+    closed    -> executions are allowed
+    open      -> executions are skipped until reset_seconds have elapsed
+    half_open -> a single trial execution is allowed; success closes the
+                 breaker, failure opens it again. Other executions are
+                 skipped while the trial runs
+    """
+    def __init__(self, macro: str, threshold: int, reset_seconds: float):
+        self.macro = macro
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+        self.opened_at: Optional[float] = None
+        self.opened_time: Optional[str] = None
+        self.trial_running = False
+    
+    def allow(self) -> bool:
+        """Return True if the macro may be sent to Klippy
+
+        In half_open state only the first caller is allowed, it must end
+        its trial with record_success, record_failure or release.
+        """
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.trial_running:
+                return False
+            self.trial_running = True
+        return True
+    
+    def release(self):
+        """End an allowed execution that did not run, without an outcome"""
+        self.trial_running = False
+    
+    def record_success(self):
+        self.trial_running = False
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.opened_time = None
+    
+    def record_failure(self, error: str):
+        self.trial_running = False
+        self.failures += 1
+        self.total_failures += 1
+        self.last_error = error
+        if self.state == "half_open" or self.failures >= self.threshold:
+            if self.state != "open":
+                logging.warning(
+                    f"Circuit breaker opened for macro {self.macro} after "
+                    f"{self.failures} consecutive failures"
+                )
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opened_time = datetime.now().isoformat()
+    
+    def get_status(self) -> Dict[str, Any]:
+        state = self.state
+        if (
+            state == "open" and
+            time.monotonic() - self.opened_at >= self.reset_seconds
+        ):
+            # The next execution will be let through as a trial
+            state = "half_open"
+        return {
+            "macro": self.macro,
+            "state": state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error,
+            "opened_at": self.opened_time,
+            "reset_seconds": self.reset_seconds,
+            "trial_running": self.trial_running
+        }
+
+class RateLimitExceeded(Exception):
+    """An execution was dropped by a rate limiter"""
+
+class BudgetExceeded(Exception):
+    """A sequence ran past its wall-clock budget"""
+
+class TokenBucket:
+    """Rate limiter holding up to burst tokens, refilled at a fixed rate
+
+    Every execution takes a token. Reservations may take the balance
+    below zero, the wait of a reservation is the time until the balance
+    is back at zero, so queued executions run in order at the refill
+    rate.
+    """
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60.
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.allowed = 0
+        self.queued = 0
+        self.dropped = 0
+        self.wait_seconds = 0.
+        self.max_wait_seconds = 0.
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            float(self.burst), self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+    
+    def wait_time(self) -> float:
+        """Seconds until a token is available"""
+        self._refill()
+        return max(0., (1. - self.tokens) / self.rate)
+    
+    def reserve(self, wait: float):
+        self.tokens -= 1.
+        if wait > 0:
+            self.queued += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        else:
+            self.allowed += 1
+    
+    def get_status(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "rate_per_minute": self.rate * 60.,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "allowed": self.allowed,
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "max_wait_seconds": round(self.max_wait_seconds, 3)
+        }
+
+class ParamTemplate:
+    """G-code text with {field} placeholders, compiled once
+
+    Supported fields:
+    {now}, {now:%H%M}        -> current time, optional strftime format
+    {run_count}              -> number of this run, starting at 1
+    {schedule_name}          -> name of the schedule
+    {schedule_id}            -> id of the schedule
+    {printer.<object>.<key>} -> cached Klipper status value
+    Fields other than now accept a Python format spec with a width and
+    precision up to TEMPLATE_MAX_SPEC_WIDTH, {{ and }} are literal braces. Invalid templates raise a ValueError on compile.
+    """
+    def __init__(self, text: str, literal: bool = False):
+        self.text = text
+        self.objects: Set[str] = set()
+        self.parts: List[Any] = []
+        if literal:
+            self.parts = [text]
+        else:
+            self._compile(text)
+        self.static = all(isinstance(p, str) for p in self.parts)
+        self.static_text = "".join(self.parts) if self.static else ""
+    
+    def _compile(self, text: str):
+        literal: List[str] = []
+        idx = 0
+        while idx < len(text):
+            start = text.find("{", idx)
+            close = text.find("}", idx)
+            if close >= 0 and (start < 0 or close < start):
+                if text.startswith("}}", close):
+                    literal.append(text[idx:close + 1])
+                    idx = close + 2
+                    continue
+                raise ValueError(f"Single '}}' in template: {text}")
+            if start < 0:
+                literal.append(text[idx:])
+                break
+            literal.append(text[idx:start])
+            if text.startswith("{{", start):
+                literal.append("{")
+                idx = start + 2
+                continue
+            end = text.find("}", start)
+            if end < 0:
+                raise ValueError(f"Unclosed '{{' in template: {text}")
+            if literal:
+                self.parts.append("".join(literal))
+                literal = []
+            self.parts.append(self._compile_field(text[start + 1:end]))
+            idx = end + 1
+        if literal and "".join(literal):
+            self.parts.append("".join(literal))
+    
+    def _compile_field(self, field: str) -> Callable[[Dict[str, Any]], str]:
+        name, _, spec = field.partition(":")
+        name = name.strip()
+        if name == "now":
+            if spec:
+                return lambda ctx: ctx["now"].strftime(spec)
+            return lambda ctx: ctx["now"].isoformat(timespec="seconds")
+        if spec:
+            sizes = FORMAT_SPEC.match(spec)
+            if sizes is None:
+                raise ValueError(f"Invalid format spec '{spec}' for {name}")
+            for size in sizes.group("width", "precision"):
+                if size and int(size) > TEMPLATE_MAX_SPEC_WIDTH:
+                    raise ValueError(
+                        f"Format spec '{spec}' for {name} exceeds the "
+                        f"width and precision limit of {TEMPLATE_MAX_SPEC_WIDTH}"
+                    )
+            # Reject specs that can't format any value up front
+            for sample in (0, 0., ""):
+                try:
+                    format(sample, spec)
+                    break
+                except (TypeError, ValueError):
+                    continue
+            else:
+                raise ValueError(f"Invalid format spec '{spec}' for {name}")
+        if name == "run_count":
+            getter = lambda ctx: ctx["schedule"].get("run_count", 0) + 1
+        elif name == "schedule_name":
+            getter = lambda ctx: ctx["schedule"].get("name", "")
+        elif name == "schedule_id":
+            getter = lambda ctx: ctx["schedule"].get("id")
+        elif name.startswith("printer."):
+            path = name.split(".")[1:]
+            if len(path) < 2 or not all(p.strip() for p in path):
+                raise ValueError(
+                    f"Printer fields require printer.<object>.<key>: {name}"
+                )
+            obj, keys = path[0].strip(), [p.strip() for p in path[1:]]
+            self.objects.add(obj)
+            
+            def getter(ctx):
+                value: Any = ctx["printer"].get(obj)
+                for key in keys:
+                    if isinstance(value, dict):
+                        value = value.get(key)
+                    elif isinstance(value, list) and key.isdigit():
+                        idx = int(key)
+                        value = value[idx] if idx < len(value) else None
+                    else:
+                        value = None
+                if value is None:
+                    logging.warning(f"No printer status available for {name}")
+                    return ""
+                return value
+        else:
+            raise ValueError(f"Unknown template field: {name}")
+        
+        def render(ctx):
+            value = getter(ctx)
+            try:
+                return format(value, spec)
+            except (TypeError, ValueError):
+                return str(value)
+        return render
+    
+    def render(self, ctx: Dict[str, Any]) -> str:
+        if self.static:
+            return self.static_text
+        return "".join(
+            p if isinstance(p, str) else p(ctx) for p in self.parts
+        )
+
+def solar_event_utc(
+    latitude: float, longitude: float, event: str, day: datetime
+) -> Optional[datetime]:
+    """UTC time of a solar event on a day, None if it doesn't occur
+
+    Sunrise equation of the Almanac for Computers (US Naval Observatory),
+    accurate to about a minute between the polar circles.
+    """
+    zenith, rising = SOLAR_EVENTS[event]
+    rad = math.radians
+    deg = math.degrees
+    day_of_year = day.timetuple().tm_yday
+    lng_hour = longitude / 15.
+    base_hour = 6. if rising else 18.
+    t = day_of_year + (base_hour - lng_hour) / 24.
+    mean_anomaly = .9856 * t - 3.289
+    true_long = (
+        mean_anomaly + 1.916 * math.sin(rad(mean_anomaly)) +
+        .020 * math.sin(rad(2 * mean_anomaly)) + 282.634
+    ) % 360.
+    right_asc = deg(math.atan(.91764 * math.tan(rad(true_long)))) % 360.
+    right_asc += (true_long // 90. - right_asc // 90.) * 90.
+    right_asc /= 15.
+    sin_dec = .39782 * math.sin(rad(true_long))
+    cos_dec = math.cos(math.asin(sin_dec))
+    cos_hour = (
+        (math.cos(rad(zenith)) - sin_dec * math.sin(rad(latitude))) /
+        (cos_dec * math.cos(rad(latitude)))
+    )
+    if not -1. <= cos_hour <= 1.:
+        # Polar day or night
+        return None
+    hour_angle = deg(math.acos(cos_hour))
+    if rising:
+        hour_angle = 360. - hour_angle
+    local_mean = hour_angle / 15. + right_asc - .06571 * t - 6.622
+    ut = (local_mean - lng_hour) % 24.
+    # The result is modulo one day, pick the instance closest to the
+    # expected time of the event on this day
+    expected = base_hour - lng_hour
+    ut += round((expected - ut) / 24.) * 24.
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return start + timedelta(hours=ut)
+
+@functools.lru_cache(maxsize=32)
+def solar_year_table(
+    latitude: float, longitude: float, event: str, year: int
+) -> Tuple[datetime, ...]:
+    """Sorted local times of a solar event for every day of a year"""
+    times: List[datetime] = []
+    day = datetime(year, 1, 1)
+    while day.year == year:
+        event_utc = solar_event_utc(latitude, longitude, event, day)
+        if event_utc is not None:
+            local = event_utc.astimezone().replace(tzinfo=None, microsecond=0)
+            times.append(local)
+        day += timedelta(days=1)
+    return tuple(sorted(times))
+
+class ExclusionIndex:
+    """Exclusion windows expanded into merged, sorted intervals
+
+    Recurring windows are expanded over a horizon starting at "start",
+    the next allowed time is found with a binary search.
+    """
+    
+    def __init__(self, windows: List[Dict[str, Any]], start: datetime):
+        self.start = start
+        self.end = start + timedelta(days=EXCLUSION_HORIZON_DAYS)
+        intervals: List[Tuple[datetime, datetime]] = []
+        for window in windows:
+            intervals.extend(self._expand(window))
+        intervals.sort()
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+        for begin, finish in intervals:
+            if finish <= begin:
+                continue
+            if self.ends and begin <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], finish)
+            else:
+                self.starts.append(begin)
+                self.ends.append(finish)
+    
+    def _expand(self, window: Dict[str, Any]) -> List[Tuple[datetime, datetime]]:
+        kind = window["type"]
+        if kind == "absolute":
+            return [(
+                datetime.fromisoformat(window["start"]),
+                datetime.fromisoformat(window["end"])
+            )]
+        first = self.start.date() - timedelta(days=1)
+        if kind == "dates":
+            result: List[Tuple[datetime, datetime]] = []
+            for date_str in window["dates"]:
+                if len(date_str) == 5:
+                    # MM-DD repeats every year
+                    years = range(first.year, self.end.year + 1)
+                    days = [f"{year}-{date_str}" for year in years]
+                else:
+                    days = [date_str]
+                for day_str in days:
+                    try:
+                        day = datetime.fromisoformat(day_str)
+                    except ValueError:
+                        # Feb 29 in a non-leap year
+                        continue
+                    result.append((day, day + timedelta(days=1)))
+            return result
+        # Daily time window, windows ending at or before their start time
+        # end on the next day
+        start_h, start_m = (int(p) for p in window["start"].split(":"))
+        end_h, end_m = (int(p) for p in window["end"].split(":"))
+        weekdays = set(window.get("days") or range(7))
+        result = []
+        day = datetime(first.year, first.month, first.day)
+        while day < self.end:
+            if day.weekday() in weekdays:
+                begin = day.replace(hour=start_h, minute=start_m)
+                finish = day.replace(hour=end_h, minute=end_m)
+                if finish <= begin:
+                    finish += timedelta(days=1)
+                result.append((begin, finish))
+            day += timedelta(days=1)
+        return result
+    
+    def covers(self, when: datetime) -> bool:
+        return self.start <= when < self.end - timedelta(days=2)
+    
+    def next_allowed(self, when: datetime) -> datetime:
+        """Return when, or the end of the exclusion interval containing it"""
+        idx = bisect.bisect_right(self.starts, when) - 1
+        if idx >= 0 and when < self.ends[idx]:
+            return self.ends[idx]
+        return when
+
+class ScheduleRecord:
+    """Options of one imported schedule record
+
+    Provides the getters of a web request so records are validated by
+    the same code as schedules added through the API. String values of
+    the options in IMPORT_JSON_FIELDS, such as CSV cells, are decoded as
+    JSON.
+    """
+    
+    _MISSING = object()
+    
+    def __init__(self, server, label: str, options: Dict[str, Any]):
+        self.server = server
+        self.label = label
+        self.options = options
+    
+    def _parse(self, option: str, value: Any) -> Any:
+        if option in IMPORT_JSON_FIELDS and isinstance(value, str):
+            return json.loads(value)
+        return value
+    
+    def get(self, option: str, default: Any = _MISSING) -> Any:
+        if option not in self.options:
+            if default is self._MISSING:
+                raise self.server.error(
+                    f"{self.label}: option '{option}' is required", 400
+                )
+            return default
+        try:
+            return self._parse(option, self.options[option])
+        except ValueError as e:
+            raise self.server.error(
+                f"{self.label}: invalid option '{option}': {e}", 400
+            )
+    
+    def _convert(self, option: str, default: Any, kind: Callable) -> Any:
+        value = self.get(option, default)
+        if option not in self.options:
+            return value
+        try:
+            return kind(value)
+        except (TypeError, ValueError):
+            raise self.server.error(
+                f"{self.label}: invalid option '{option}'", 400
+            )
+    
+    def get_str(self, option: str, default: Any = _MISSING) -> Any:
+        return self._convert(option, default, str)
+    
+    def get_int(self, option: str, default: Any = _MISSING) -> Any:
+        return self._convert(option, default, int)
+    
+    def get_float(self, option: str, default: Any = _MISSING) -> Any:
+        return self._convert(option, default, float)
+    
+    def get_boolean(self, option: str, default: Any = _MISSING) -> Any:
+        value = self.get(option, default)
+        if option not in self.options or isinstance(value, bool):
+            return value
+        value = str(value).lower()
+        if value not in configparser.ConfigParser.BOOLEAN_STATES:
+            raise self.server.error(
+                f"{self.label}: invalid option '{option}'", 400
+            )
+        return configparser.ConfigParser.BOOLEAN_STATES[value]
+
+class ScheduleFileSection(ScheduleRecord):
+    """Options of one [schedule <name>] section of the schedule file
+
+    Values are strings except for the options below:
+
+    params         -> "KEY=value KEY2=value" or a JSON object
+    prepare_params -> same as params
+    days           -> comma separated weekday numbers
+    tags           -> comma separated tags
+    steps          -> JSON list of sequence steps
+    """
+    
+    def __init__(self, server, key: str, text: str):
+        self.key = key
+        parser = configparser.ConfigParser(
+            interpolation=None, inline_comment_prefixes=("#",)
+        )
+        try:
+            parser.read_string(text)
+        except configparser.Error as e:
+            raise server.error(f"[schedule {key}]: {e}", 400)
+        section = parser.sections()[0]
+        options: Dict[str, Any] = dict(parser.items(section))
+        options.setdefault("name", key)
+        super().__init__(server, f"[schedule {key}]", options)
+    
+    def _parse(self, option: str, value: str) -> Any:
+        value = value.strip()
+        if option in ("params", "prepare_params"):
+            if value.startswith("{"):
+                return json.loads(value)
+            params: Dict[str, str] = {}
+            for item in value.split():
+                name, sep, param = item.partition("=")
+                if not sep:
+                    raise ValueError(f"expected KEY=value, got '{item}'")
+                params[name.upper()] = param
+            return params
+        if option == "days":
+            return [int(day) for day in value.split(",") if day.strip()]
+        if option == "tags":
+            return [tag for tag in value.split(",") if tag.strip()]
+        if option == "steps":
+            return json.loads(value)
+        return value
+
+class WebUIAssets:
+    """The web UI page and its compressed variants, held in memory
+
+    Variants are keyed by content coding, each with a strong ETag that
+    differs between codings of the same page.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.variants: Dict[str, Tuple[bytes, str]] = {}
+    
+    def load(self):
+        body = self.path.read_bytes()
+        mtime = self.path.stat().st_mtime
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        variants = {"identity": (body, f'"{digest}"')}
+        for encoding, suffix in WEB_UI_ENCODINGS:
+            compressed = self.path.with_name(self.path.name + suffix)
+            try:
+                if compressed.stat().st_mtime < mtime:
+                    logging.warning(
+                        f"Ignoring {compressed.name}, it is older than the page"
+                    )
+                    continue
+                data = compressed.read_bytes()
+            except OSError:
+                continue
+            variants[encoding] = (data, f'"{digest}-{encoding}"')
+        if "gzip" not in variants:
+            # Normally built by install.py
+            variants["gzip"] = (
+                gzip.compress(body, 9, mtime=0), f'"{digest}-gzip"'
+            )
+        self.variants = variants
+    
+    def select(self, accept_encoding: str) -> Tuple[str, bytes, str]:
+        """Returns the coding, body and ETag to send for a request"""
+        accepted: Set[str] = set()
+        for item in accept_encoding.split(","):
+            coding, _, params = item.partition(";")
+            quality = params.strip().lower()
+            if quality.startswith("q="):
+                try:
+                    if float(quality[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+        for encoding, _ in WEB_UI_ENCODINGS:
+            if encoding in self.variants and (
+                encoding in accepted or "*" in accepted
+            ):
+                return (encoding,) + self.variants[encoding]
+        return ("identity",) + self.variants["identity"]
+    
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "etag": self.variants["identity"][1],
+            "sizes": {
+                encoding: len(body)
+                for encoding, (body, _) in self.variants.items()
+            }
+        }
+
+class WebUIHandler(RequestHandler):
+    """Serves the web UI page from memory
+
+    The page is revalidated on every load, an unchanged page is answered
+    with 304 and no body.
+    """
+    def initialize(self, assets: WebUIAssets):
+        self.assets = assets
+    
+    def get(self):
+        self._send(True)
+    
+    def head(self):
+        self._send(False)
+    
+    def _send(self, include_body: bool):
+        encoding, body, etag = self.assets.select(
+            self.request.headers.get("Accept-Encoding", "")
+        )
+        self.set_header("Content-Type", "text/html; charset=UTF-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Vary", "Accept-Encoding")
+        self.set_header("Etag", etag)
+        if encoding != "identity":
+            self.set_header("Content-Encoding", encoding)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header("Content-Length", len(body))
+        if include_body:
+            self.write(body)
 
 class MacroScheduler:
     def __init__(self, config):
@@ -17,6 +758,198 @@ class MacroScheduler:
         self.schedules: Dict[int, Dict[str, Any]] = {}
         self.next_schedule_id = 1
         self.tasks: Dict[int, asyncio.Task] = {}
+        # Schedules whose task is executing a run, from the fire until
+        # the next run is stored
+        self.firing: Set[int] = set()
+        
+        # Retry and circuit breaker settings, schedules may override the
+        # retry settings with their own "max_retries" and
+        # "retry_backoff_seconds" fields
+        self.max_retries = config.getint("max_retries", 3, minval=0)
+        self.retry_backoff = config.getfloat(
+            "retry_backoff_seconds", 30., minval=1.
+        )
+        self.retry_backoff_max = config.getfloat(
+            "retry_backoff_max_seconds", 900., minval=1.
+        )
+        self.breaker_threshold = config.getint(
+            "circuit_breaker_threshold", 5, minval=1
+        )
+        self.breaker_reset = config.getfloat(
+            "circuit_breaker_reset_seconds", 300., minval=1.
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        
+        # Token buckets limiting executions globally and per macro, beyond
+        # the limit executions wait for a token or are dropped
+        self.rate_limit_mode = config.get("rate_limit_mode", "queue")
+        if self.rate_limit_mode not in RATE_LIMIT_MODES:
+            raise config.error(
+                f"Invalid rate_limit_mode: {self.rate_limit_mode}"
+            )
+        self.rate_limit_max_wait = config.getfloat(
+            "rate_limit_max_wait_seconds", 300., minval=0.
+        )
+        self.global_bucket: Optional[TokenBucket] = None
+        rate = config.getfloat("rate_limit_per_minute", 0., minval=0.)
+        if rate:
+            self.global_bucket = TokenBucket(
+                "global", rate,
+                config.getint("rate_limit_burst", max(1, int(rate)), minval=1)
+            )
+        self.macro_buckets: Dict[str, TokenBucket] = {}
+        for macro, limit in config.getdict("macro_rate_limits", {}).items():
+            per_minute, _, burst = limit.partition("/")
+            try:
+                bucket = TokenBucket(
+                    macro.upper(), float(per_minute),
+                    int(burst) if burst else max(1, int(float(per_minute)))
+                )
+            except ValueError:
+                raise config.error(
+                    f"Invalid macro_rate_limits entry {macro}: {limit}"
+                )
+            if bucket.rate <= 0 or bucket.burst < 1:
+                raise config.error(
+                    f"Invalid macro_rate_limits entry {macro}: {limit}"
+                )
+            self.macro_buckets[macro.upper()] = bucket
+        
+        # Prepare macros fired ahead of a run, the lead time is fixed per
+        # schedule or learned from the duration of recent prepare runs
+        self.prepare_lead = config.getfloat(
+            "prepare_lead_seconds", 600., minval=0.
+        )
+        self.prepared: Dict[int, str] = {}
+        self.prepare_tasks: Set[asyncio.Task] = set()
+        
+        # G-code commands known to Klipper, fetched once per Klippy start
+        # and used to reject schedules of unknown macros
+        self.validate_macros = config.getboolean("validate_macros", True)
+        self.macro_names: Optional[List[str]] = None
+        self.macro_help: Dict[str, str] = {}
+        self.macro_fetched_at: Optional[float] = None
+        self.macro_lock = asyncio.Lock()
+        
+        # G-code compiled once per schedule as (delay_seconds, script)
+        # segments, each segment is submitted with a single run_gcode call
+        self.scripts: Dict[int, List[Tuple[float, ParamTemplate]]] = {}
+        
+        # Klipper status used by {printer.<object>.<key>} templates, kept
+        # current through a subscription to the referenced objects
+        self.printer_status: Dict[str, Dict[str, Any]] = {}
+        self.template_objects: Set[str] = set()
+        self.subscribed_objects: Set[str] = set()
+        
+        # Tag -> schedule ids, maintained by every mutation
+        self.tag_index: Dict[str, Set[int]] = {}
+        
+        # Execution history with the console output captured per run
+        self.history: Deque[Dict[str, Any]] = deque(
+            maxlen=config.getint("history_size", 100, minval=1)
+        )
+        self.output_max_lines = config.getint("output_max_lines", 50, minval=0)
+        self.capture_markers = config.getboolean("capture_markers", False)
+        self.active_runs: Dict[int, Dict[str, Any]] = {}
+        self.marker_run: Optional[int] = None
+        self.next_run_id = 1
+        
+        # Fires that came due while Klippy was shut down or disconnected
+        self.klippy_ready = False
+        self.initialized = False
+        self.pending: Deque[Dict[str, Any]] = deque(
+            maxlen=config.getint("pending_queue_size", 50, minval=1)
+        )
+        self.misfire_grace = config.getfloat(
+            "misfire_grace_seconds", 3600., minval=0.
+        )
+        self.drain_task: Optional[asyncio.Task] = None
+        
+        # All changes to schedules are applied in order by a single writer
+        # task, commands queued together are persisted once per batch
+        self.mutations: asyncio.Queue = asyncio.Queue()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.rearm_ids: Set[int] = set()
+        # Schedules changed by the current batch without being rearmed, both
+        # sets are pushed to websocket clients once the batch is saved
+        self.changed_ids: Set[int] = set()
+        self.revision = 0
+        # Revision of the last change of each schedule, removed ones included,
+        # oldest first. Clients behind change_log_floor reload their list.
+        # The epoch tells clients that revisions restarted with Moonraker
+        self.change_log: "OrderedDict[int, int]" = OrderedDict()
+        self.change_log_floor = 0
+        self.epoch = f"{datetime.now().timestamp():.0f}"
+        self.mutation_stats: Dict[str, Any] = {
+            "commands": 0,
+            "batches": 0,
+            "max_batch": 0,
+            "failed": 0,
+            "busy_seconds": 0.
+        }
+        
+        # Blackout windows and holiday dates, global or limited to tags.
+        # Indexes are cached per set of applicable windows
+        # Replaced instead of modified in place, worker threads calculating
+        # next runs read it without locking
+        self.exclusions: Dict[int, Dict[str, Any]] = {}
+        self.next_exclusion_id = 1
+        self.exclusion_indexes: Dict[Tuple[int, ...], ExclusionIndex] = {}
+        # Jobs on the worker pool index windows in a private cache, the
+        # shared one is only filled on the loop
+        self.job_state = threading.local()
+        
+        # Schedules declared in a file inside the config directory, managed
+        # by the file and reloaded incrementally when it changes
+        self.schedule_file_option = config.get(
+            "schedule_file", "macro_schedules.cfg"
+        )
+        self.schedule_file: Optional[Path] = None
+        self.schedule_file_watched: Optional[str] = None
+        # Section name -> (schedule id, digest of the section text)
+        self.file_index: Dict[str, Tuple[int, str]] = {}
+        self.file_errors: Dict[str, str] = {}
+        self.file_stats: Dict[str, Any] = {
+            "reloads": 0,
+            "sections": 0,
+            "last_changed": 0,
+            "last_removed": 0,
+            "last_reload_seconds": 0.
+        }
+        self.file_reload_pending = False
+        self.file_task: Optional[asyncio.Task] = None
+        
+        # Worker pool for CPU heavy work, see _offload
+        self.executor = ThreadPoolExecutor(
+            max_workers=OFFLOAD_WORKERS, thread_name_prefix=OFFLOAD_THREAD_NAME
+        )
+        self.offload_slots = asyncio.Semaphore(OFFLOAD_WORKERS)
+        self.offload_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.offload_stats: Dict[str, Any] = {
+            "jobs": 0,
+            "running": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "busy_seconds": 0.,
+            "max_seconds": 0.
+        }
+        # Periodic check of how late the event loop wakes up
+        self.loop_probe_interval = config.getfloat(
+            "loop_probe_interval", 1., minval=0.
+        )
+        self.probe_task: Optional[asyncio.Task] = None
+        self.loop_latency: Dict[str, Any] = {
+            "samples": 0,
+            "stalls": 0,
+            "last_seconds": 0.,
+            "avg_seconds": 0.,
+            "max_seconds": 0.,
+            "max_offload_seconds": 0.
+        }
+        
+        # Web UI page served by Moonraker itself, see _register_web_ui
+        self.web_ui_option = config.get("web_ui_path", None)
+        self.web_ui: Optional[WebUIAssets] = None
         
         # Get database component for persistent storage
         self.database = None
@@ -48,6 +981,87 @@ class MacroScheduler:
             ['GET'], 
             self._handle_list_text
         )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/group", 
+            ['POST'], 
+            self._handle_group
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/tags", 
+            ['GET'], 
+            self._handle_list_tags
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/breakers", 
+            ['GET'], 
+            self._handle_list_breakers
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/pending", 
+            ['GET'], 
+            self._handle_list_pending
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/metrics", 
+            ['GET'], 
+            self._handle_metrics
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/history", 
+            ['GET'], 
+            self._handle_history
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/readiness", 
+            ['GET'], 
+            self._handle_readiness
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/exclusions", 
+            ['GET'], 
+            self._handle_list_exclusions
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/exclusions/add", 
+            ['POST'], 
+            self._handle_add_exclusion
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/exclusions/delete", 
+            ['POST'], 
+            self._handle_delete_exclusion
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/export", 
+            ['POST'], 
+            self._handle_export
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/import", 
+            ['POST'], 
+            self._handle_import
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/changes", 
+            ['GET'], 
+            self._handle_changes
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/preview", 
+            ['GET'], 
+            self._handle_preview
+        )
+        self.server.register_endpoint(
+            "/server/macro_scheduler/macros", 
+            ['GET'], 
+            self._handle_list_macros
+        )
+        
+        # Websocket clients receive notify_macro_scheduler_changed
+        self.server.register_notification(
+            "macro_scheduler:schedules_changed", "macro_scheduler_changed"
+        )
+        self._register_web_ui()
         
         logging.info("Macro Scheduler Component Initialized")
         
@@ -56,9 +1070,80 @@ class MacroScheduler:
             "server:klippy_ready",
             self._handle_ready
         )
+        self.server.register_event_handler(
+            "server:status_update",
+            self._handle_status_update
+        )
+        self.server.register_event_handler(
+            "server:gcode_response",
+            self._handle_gcode_response
+        )
+        self.server.register_event_handler(
+            "server:klippy_shutdown",
+            self._handle_klippy_unavailable
+        )
+        self.server.register_event_handler(
+            "server:klippy_disconnect",
+            self._handle_klippy_unavailable
+        )
+        self.server.register_event_handler(
+            "file_manager:filelist_changed",
+            self._handle_filelist_changed
+        )
+    
+    async def _handle_klippy_unavailable(self):
+        """Called when Klipper shuts down or disconnects"""
+        if self.klippy_ready:
+            logging.info("Klippy unavailable, holding due schedules")
+        self.klippy_ready = False
+        # Klippy sends a full status again on the next subscription
+        self.subscribed_objects.clear()
+    
+    def _handle_status_update(self, status: Dict[str, Any], *args):
+        """Update the cached status of objects used by templates"""
+        for obj, fields in status.items():
+            if obj in self.template_objects and isinstance(fields, dict):
+                self.printer_status.setdefault(obj, {}).update(fields)
+    
+    async def _subscribe_template_objects(self):
+        """Subscribe to Klipper objects referenced by templates"""
+        objects = self.template_objects - self.subscribed_objects
+        if not objects or not self.klippy_ready:
+            return
+        self.subscribed_objects |= objects
+        try:
+            klippy_apis = self.server.lookup_component('klippy_apis')
+            result = await klippy_apis.subscribe_objects(
+                {obj: None for obj in self.template_objects}, default=None
+            )
+        except Exception as e:
+            logging.error(f"Error subscribing to printer objects: {e}")
+            self.subscribed_objects -= objects
+            return
+        if isinstance(result, dict):
+            self._handle_status_update(result)
     
     async def _handle_ready(self):
         """Called when Klipper is ready"""
+        self.klippy_ready = True
+        # Macros may have changed with the Klipper configuration
+        self.macro_names = None
+        await self._subscribe_template_objects()
+        if self.initialized:
+            # Schedule tasks keep running across Klippy restarts, only
+            # the fires held while Klippy was unavailable need to run
+            logging.info(
+                f"Klippy ready, resuming with {len(self.pending)} pending fire(s)"
+            )
+            if self.pending and (
+                self.drain_task is None or self.drain_task.done()
+            ):
+                self.drain_task = asyncio.create_task(self._drain_pending())
+            return
+        self.initialized = True
+        if self.loop_probe_interval:
+            self.probe_task = asyncio.create_task(self._probe_loop_latency())
+        
         # Try to get database component
         try:
             self.database = self.server.lookup_component("database")
@@ -66,6 +1151,8 @@ class MacroScheduler:
         except Exception as e:
             logging.warning(f"Database not available, schedules won't persist: {e}")
         
+        self._resolve_schedule_file()
+        await self._reload_schedule_file()
         await self._start_all_schedules()
         logging.info("Macro Scheduler is ready")
         logging.info("API available at: /server/macro_scheduler/schedules")
@@ -85,10 +1172,225 @@ class MacroScheduler:
             if data:
                 self.schedules = {int(k): v for k, v in data.get("schedules", {}).items()}
                 self.next_schedule_id = data.get("next_id", 1)
+                self.exclusions = {
+                    int(k): v for k, v in data.get("exclusions", {}).items()
+                }
+                self.next_exclusion_id = data.get("next_exclusion_id", 1)
+                self.exclusion_indexes = {}
+                scripts = await self._run_sized(
+                    self._compile_scripts, list(self.schedules.items())
+                )
+                # Schedules added while compiling have their script already
+                scripts.update({
+                    sid: script for sid, script in self.scripts.items()
+                    if sid in self.schedules
+                })
+                self.scripts = scripts
+                self.tag_index = {}
+                self.file_index = {}
+                for sid, schedule in self.schedules.items():
+                    self._index_tags(sid, schedule.get("tags", []))
+                    if "file_section" in schedule:
+                        self.file_index[schedule["file_section"]] = (
+                            sid, schedule.get("file_digest", "")
+                        )
                 logging.info(f"Loaded {len(self.schedules)} schedules from database")
         except Exception as e:
             logging.error(f"Error loading schedules: {e}")
     
+    async def _mutate(self, func: Callable[[], Any]) -> Any:
+        """Apply a state change through the single writer queue
+
+        func runs on the writer task and may add schedule ids to
+        rearm_ids, the tasks of those schedules are started or stopped
+        after the batch has been persisted. Exceptions raised by func
+        are raised to the caller.
+        """
+        if self.writer_task is None or self.writer_task.done():
+            self.writer_task = asyncio.create_task(self._process_mutations())
+        fut = asyncio.get_running_loop().create_future()
+        self.mutations.put_nowait((func, fut))
+        return await fut
+    
+    async def _process_mutations(self):
+        """Writer task applying queued state changes in batches"""
+        while True:
+            batch = [await self.mutations.get()]
+            while not self.mutations.empty():
+                batch.append(self.mutations.get_nowait())
+            start = time.monotonic()
+            results: List[Tuple[asyncio.Future, Any, Optional[Exception]]] = []
+            for func, fut in batch:
+                try:
+                    results.append((fut, func(), None))
+                except Exception as e:
+                    self.mutation_stats["failed"] += 1
+                    results.append((fut, None, e))
+            self.revision += 1
+            await self._save_schedules()
+            
+            rearm_ids = self.rearm_ids
+            self.rearm_ids = set()
+            changed_ids = rearm_ids | self.changed_ids
+            self.changed_ids = set()
+            for schedule_id in sorted(rearm_ids):
+                try:
+                    schedule = self.schedules.get(schedule_id)
+                    if (
+                        schedule and schedule.get("enabled", True) and
+                        not schedule.get("suspended")
+                    ):
+                        await self._start_schedule(schedule_id)
+                    else:
+                        await self._stop_schedule(schedule_id)
+                except Exception as e:
+                    logging.error(f"Error rearming schedule {schedule_id}: {e}")
+            if changed_ids:
+                self._log_changes(changed_ids)
+                self._notify_changes(changed_ids)
+            
+            stats = self.mutation_stats
+            stats["commands"] += len(batch)
+            stats["batches"] += 1
+            stats["max_batch"] = max(stats["max_batch"], len(batch))
+            stats["busy_seconds"] += time.monotonic() - start
+            for fut, result, err in results:
+                if fut.done():
+                    # The caller was cancelled
+                    continue
+                if err is not None:
+                    fut.set_exception(err)
+                else:
+                    fut.set_result(result)
+    
+    def _log_changes(self, schedule_ids: Set[int]):
+        """Record the current revision for changed schedules"""
+        for sid in sorted(schedule_ids):
+            self.change_log.pop(sid, None)
+            self.change_log[sid] = self.revision
+        while len(self.change_log) > CHANGE_LOG_MAX:
+            _, revision = self.change_log.popitem(last=False)
+            self.change_log_floor = max(self.change_log_floor, revision)
+    
+    def _get_changes(self, since: int) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """Schedules changed and removed after revision since"""
+        changed: List[Dict[str, Any]] = []
+        removed: List[int] = []
+        for sid in reversed(self.change_log):
+            if self.change_log[sid] <= since:
+                break
+            if sid in self.schedules:
+                changed.append(self._public_schedule(sid, self.schedules[sid]))
+            else:
+                removed.append(sid)
+        changed.sort(key=lambda schedule: schedule["id"])
+        return changed, sorted(removed)
+    
+    def _notify_changes(self, schedule_ids: Set[int]):
+        """Push changed and removed schedules to websocket clients
+
+        Large batches such as imports only carry the revision, clients
+        reload their list instead.
+        """
+        payload: Dict[str, Any] = {
+            "epoch": self.epoch, "revision": self.revision
+        }
+        if len(schedule_ids) > NOTIFY_MAX_SCHEDULES:
+            payload.update(schedules=[], removed=[], reload=True)
+        else:
+            payload["schedules"] = [
+                self._public_schedule(sid, self.schedules[sid])
+                for sid in sorted(schedule_ids) if sid in self.schedules
+            ]
+            payload["removed"] = sorted(
+                sid for sid in schedule_ids if sid not in self.schedules
+            )
+            payload["reload"] = False
+        self.server.send_event("macro_scheduler:schedules_changed", payload)
+    
+    async def _offload(self, func: Callable[..., Any], *args) -> Any:
+        """Run func(cancelled, *args) on the worker pool, returns its result
+
+        cancelled is a threading.Event set when the caller is cancelled,
+        long jobs check it and return early. Jobs read snapshots or
+        fields by key and return results, state is only changed by the
+        caller on the loop.
+        """
+        cancelled = threading.Event()
+        stats = self.offload_stats
+        async with self.offload_slots:
+            loop = asyncio.get_running_loop()
+            self.offload_loop = loop
+            stats["running"] += 1
+            start = time.monotonic()
+            try:
+                return await loop.run_in_executor(
+                    self.executor, self._run_job, func, cancelled, *args
+                )
+            except asyncio.CancelledError:
+                cancelled.set()
+                stats["cancelled"] += 1
+                raise
+            except Exception:
+                stats["failed"] += 1
+                raise
+            finally:
+                elapsed = time.monotonic() - start
+                stats["running"] -= 1
+                stats["jobs"] += 1
+                stats["busy_seconds"] += elapsed
+                stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+    
+    def _run_job(
+        self, func: Callable[..., Any], cancelled: threading.Event, *args
+    ) -> Any:
+        """Run an offloaded job with its own exclusion index cache"""
+        self.job_state.exclusion_indexes = {}
+        try:
+            return func(cancelled, *args)
+        finally:
+            del self.job_state.exclusion_indexes
+    
+    def _get_index_cache(self) -> Dict[Tuple[int, ...], ExclusionIndex]:
+        """Index cache of the live windows for the calling thread"""
+        return getattr(
+            self.job_state, "exclusion_indexes", self.exclusion_indexes
+        )
+    
+    async def _run_sized(
+        self, func: Callable[..., Any], items: List[Any], *args
+    ) -> Any:
+        """Offload func(cancelled, items, *args) for many items, else run inline"""
+        if len(items) > OFFLOAD_MIN_SCHEDULES:
+            return await self._offload(func, items, *args)
+        return func(threading.Event(), items, *args)
+    
+    async def _probe_loop_latency(self):
+        """Measure how late the event loop wakes up from a sleep"""
+        loop = asyncio.get_running_loop()
+        stats = self.loop_latency
+        while True:
+            expected = loop.time() + self.loop_probe_interval
+            await asyncio.sleep(self.loop_probe_interval)
+            lag = max(0., loop.time() - expected)
+            stats["samples"] += 1
+            stats["last_seconds"] = lag
+            # Moving average over roughly the last 20 samples
+            stats["avg_seconds"] += (lag - stats["avg_seconds"]) * .05
+            stats["max_seconds"] = max(stats["max_seconds"], lag)
+            if self.offload_stats["running"]:
+                stats["max_offload_seconds"] = max(
+                    stats["max_offload_seconds"], lag
+                )
+            if lag > LOOP_STALL_SECONDS:
+                stats["stalls"] += 1
+    
+    async def close(self):
+        """Called by Moonraker on shutdown"""
+        if self.probe_task is not None:
+            self.probe_task.cancel()
+        self.executor.shutdown(wait=False)
+    
     async def _save_schedules(self):
         """Save schedules to database"""
         if not self.database:
@@ -100,117 +1402,1268 @@ class MacroScheduler:
                 "schedules",
                 {
                     "schedules": {str(k): v for k, v in self.schedules.items()},
-                    "next_id": self.next_schedule_id
+                    "next_id": self.next_schedule_id,
+                    "exclusions": {
+                        str(k): v for k, v in self.exclusions.items()
+                    },
+                    "next_exclusion_id": self.next_exclusion_id
                 }
             )
         except Exception as e:
             logging.error(f"Error saving schedules: {e}")
     
-    async def _handle_list_schedules(self, web_request):
-        """GET /server/macro_scheduler/schedules"""
-        schedule_list = [
-            {**schedule, "id": int(schedule.get("id", sid))}
-            for sid, schedule in self.schedules.items()
-        ]
-        return {"schedules": schedule_list}
+    async def _handle_list_schedules(self, web_request):
+        """GET /server/macro_scheduler/schedules
+
+        Optionally filtered by enabled state, schedule type and tag, sorted
+        and paged. Without arguments every schedule is returned in id order.
+        """
+        enabled = web_request.get_boolean("enabled", None)
+        schedule_type = web_request.get_str("schedule_type", None)
+        tag = web_request.get_str("tag", None)
+        sort = web_request.get_str("sort", "id")
+        descending = web_request.get_boolean("descending", False)
+        offset = max(0, web_request.get_int("offset", 0))
+        limit = max(0, web_request.get_int("limit", 0))
+        if sort not in SCHEDULE_SORT_KEYS:
+            raise self.server.error(f"Invalid sort: {sort}", 400)
+        # Shallow copies, the writer adds and removes fields of the live
+        # schedules while a worker walks them
+        if tag is not None:
+            ids = self.tag_index.get(tag.strip().lower(), set())
+            candidates = [
+                (sid, dict(self.schedules[sid]))
+                for sid in ids if sid in self.schedules
+            ]
+        else:
+            candidates = [
+                (sid, dict(schedule)) for sid, schedule in self.schedules.items()
+            ]
+        total, schedule_list = await self._run_sized(
+            self._select_schedules, candidates, enabled, schedule_type,
+            sort, descending, offset, limit
+        )
+        return {
+            "schedules": schedule_list,
+            "total": total,
+            "offset": offset,
+            "epoch": self.epoch,
+            "revision": self.revision
+        }
+    
+    @staticmethod
+    def _select_schedules(
+        cancelled: threading.Event,
+        candidates: List[Tuple[int, Dict[str, Any]]],
+        enabled: Optional[bool],
+        schedule_type: Optional[str],
+        sort: str,
+        descending: bool,
+        offset: int,
+        limit: int
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Filter, sort and page schedules, returns the total and the page"""
+        selected = [
+            (sid, schedule) for sid, schedule in candidates
+            if (enabled is None or schedule.get("enabled", True) == enabled) and
+            (schedule_type is None or schedule.get("schedule_type") == schedule_type)
+        ]
+        if sort == "name":
+            selected.sort(
+                key=lambda item: (str(item[1].get("name", "")).lower(), item[0]),
+                reverse=descending
+            )
+        elif sort == "next_run":
+            # Schedules without a next run sort last
+            selected.sort(
+                key=lambda item: (
+                    item[1].get("next_run") is None,
+                    item[1].get("next_run") or "",
+                    item[0]
+                ),
+                reverse=descending
+            )
+        else:
+            selected.sort(key=lambda item: item[0], reverse=descending)
+        total = len(selected)
+        end = offset + limit if limit else total
+        schedule_list = [
+            MacroScheduler._public_schedule(sid, schedule)
+            for sid, schedule in selected[offset:end]
+        ]
+        return total, schedule_list
+    
+    @staticmethod
+    def _public_schedule(
+        schedule_id: int, schedule: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Copy of a schedule as returned by the API
+
+        Schedules loaded from the schedule file are marked with source
+        "file" instead of the fields tracking their section.
+        """
+        result = {
+            key: value for key, value in schedule.items()
+            if key not in FILE_FIELDS
+        }
+        result["id"] = int(schedule_id)
+        if "file_section" in schedule:
+            result["source"] = "file"
+        return result
+    
+    async def _handle_changes(self, web_request):
+        """GET /server/macro_scheduler/changes
+
+        Schedules changed or removed after the revision a client last saw,
+        the polling counterpart of notify_macro_scheduler_changed. Clients
+        from another epoch or too far behind are told to reload.
+        """
+        since = web_request.get_int("since", 0)
+        epoch = web_request.get_str("epoch", self.epoch)
+        payload: Dict[str, Any] = {
+            "epoch": self.epoch, "revision": self.revision
+        }
+        if (
+            epoch != self.epoch or since > self.revision or
+            since < self.change_log_floor
+        ):
+            payload.update(schedules=[], removed=[], reload=True)
+            return payload
+        changed, removed = self._get_changes(since)
+        if len(changed) + len(removed) > NOTIFY_MAX_SCHEDULES:
+            payload.update(schedules=[], removed=[], reload=True)
+        else:
+            payload.update(schedules=changed, removed=removed, reload=False)
+        return payload
+    
+    async def _handle_add_schedule(self, web_request):
+        """POST /server/macro_scheduler/add"""
+        try:
+            schedule, script = self._build_schedule(
+                web_request, register=False
+            )
+            self._check_macros(schedule, await self._get_macro_names())
+            
+            def apply():
+                schedule_id = self.next_schedule_id
+                schedule["id"] = schedule_id
+                self._register_script(schedule, script)
+                self.scripts[schedule_id] = script
+                self.schedules[schedule_id] = schedule
+                self.next_schedule_id += 1
+                self._index_tags(schedule_id, schedule.get("tags", []))
+                self.rearm_ids.add(schedule_id)
+                return {"schedule": self._public_schedule(schedule_id, schedule)}
+            
+            return await self._mutate(apply)
+        except Exception as e:
+            logging.error(f"Error adding schedule: {e}")
+            raise self.server.error(str(e), 400)
+    
+    def _build_schedule(
+        self, web_request, register: bool = True
+    ) -> Tuple[Dict[str, Any], List[Tuple[float, ParamTemplate]]]:
+        """Validate schedule arguments, returns the schedule and its script
+
+        web_request may be a request or ScheduleFileSection, the schedule
+        is returned without an id. Without register the templates don't
+        subscribe to printer objects, see _register_script.
+        """
+        name = web_request.get_str("name")
+        schedule_type = web_request.get_str("schedule_type", "once")
+        params = web_request.get("params", {})
+        
+        steps: Optional[List[Dict[str, Any]]] = None
+        timing_type = schedule_type
+        if schedule_type == "sequence":
+            steps = self._validate_steps(web_request.get("steps"))
+            timing_type = web_request.get_str("trigger_type", "once")
+            if timing_type == "sequence":
+                raise self.server.error(
+                    "trigger_type of a sequence cannot be 'sequence'", 400
+                )
+            macro = web_request.get_str(
+                "macro", ", ".join(step["macro"] for step in steps)
+            )
+        else:
+            macro = web_request.get_str("macro")
+        
+        schedule = {
+            "id": None,
+            "name": name,
+            "macro": macro,
+            "schedule_type": schedule_type,
+            "params": params,
+            "enabled": True,
+            "next_run": None
+        }
+        tags = self._normalize_tags(web_request.get("tags", []))
+        if tags:
+            schedule["tags"] = tags
+        if steps is not None:
+            schedule["steps"] = steps
+            schedule["trigger_type"] = timing_type
+            if web_request.get("budget_seconds", None) is not None:
+                budget = web_request.get_float("budget_seconds")
+                if budget <= 0:
+                    raise self.server.error(
+                        "budget_seconds must be greater than zero", 400
+                    )
+                schedule["budget_seconds"] = budget
+        
+        if timing_type == "once":
+            datetime_str = web_request.get_str("datetime")
+            schedule["datetime"] = datetime_str
+            schedule["next_run"] = datetime_str
+        elif timing_type == "daily":
+            time_str = web_request.get_str("time")
+            schedule["time"] = time_str
+            schedule["next_run"] = self._calculate_next_daily_run(time_str)
+        elif timing_type == "weekly":
+            time_str = web_request.get_str("time")
+            days = web_request.get("days", [])
+            schedule["time"] = time_str
+            schedule["days"] = days
+            schedule["next_run"] = self._calculate_next_weekly_run(time_str, days)
+        elif timing_type == "interval":
+            interval_minutes = web_request.get_int("interval_minutes", 60)
+            schedule["interval_minutes"] = interval_minutes
+            schedule["next_run"] = self._calculate_next_interval_run(interval_minutes)
+        elif timing_type == "cron":
+            cron_expr = web_request.get_str("cron_expression")
+            self._validate_cron(cron_expr)
+            schedule["cron_expression"] = cron_expr
+            schedule["next_run"] = self._calculate_next_cron_run(cron_expr)
+        elif timing_type == "solar":
+            latitude = web_request.get_float("latitude")
+            longitude = web_request.get_float("longitude")
+            event = web_request.get_str("solar_event", "sunset")
+            if not -90. <= latitude <= 90. or not -180. <= longitude <= 180.:
+                raise self.server.error("Invalid latitude or longitude", 400)
+            if event not in SOLAR_EVENTS:
+                raise self.server.error(f"Invalid solar_event: {event}", 400)
+            schedule["latitude"] = latitude
+            schedule["longitude"] = longitude
+            schedule["solar_event"] = event
+            schedule["offset_minutes"] = web_request.get_int("offset_minutes", 0)
+            schedule["next_run"] = self._calculate_next_run(schedule)
+            if schedule["next_run"] is None:
+                raise self.server.error(
+                    f"No {event} at this location in the coming year", 400
+                )
+        
+        # Optional per-schedule retry overrides
+        if web_request.get("max_retries", None) is not None:
+            schedule["max_retries"] = max(0, web_request.get_int("max_retries"))
+        if web_request.get("retry_backoff_seconds", None) is not None:
+            schedule["retry_backoff_seconds"] = max(
+                1., web_request.get_float("retry_backoff_seconds")
+            )
+        
+        # Handling of fires missed while Klippy was unavailable
+        misfire_policy = web_request.get_str("misfire_policy", None)
+        if misfire_policy is not None:
+            if misfire_policy not in MISFIRE_POLICIES:
+                raise self.server.error(
+                    f"Invalid misfire_policy: {misfire_policy}", 400
+                )
+            schedule["misfire_policy"] = misfire_policy
+        if web_request.get("misfire_grace_seconds", None) is not None:
+            schedule["misfire_grace_seconds"] = max(
+                0., web_request.get_float("misfire_grace_seconds")
+            )
+        
+        if schedule["next_run"] is not None:
+            schedule["next_run"] = self._skip_exclusions(
+                schedule, schedule["next_run"]
+            )
+            if schedule["next_run"] is None:
+                raise self.server.error(
+                    "Every run of the schedule falls in an exclusion window", 400
+                )
+        
+        # Optional macro fired lead_seconds ahead of each run, without a
+        # lead time it is learned from previous prepare runs
+        prepare_macro = web_request.get_str("prepare_macro", None)
+        if prepare_macro:
+            schedule["prepare_macro"] = prepare_macro
+            prepare_params = web_request.get("prepare_params", {})
+            if prepare_params:
+                schedule["prepare_params"] = prepare_params
+            if web_request.get("lead_seconds", None) is not None:
+                lead = web_request.get_float("lead_seconds")
+                if lead < 0:
+                    raise self.server.error(
+                        "lead_seconds must not be negative", 400
+                    )
+                schedule["lead_seconds"] = lead
+        
+        try:
+            script = self._compile_script(schedule, register=register)
+            self._compile_prepare(schedule, register=register)
+        except ValueError as e:
+            raise self.server.error(f"Invalid parameter template: {e}", 400)
+        return schedule, script
+    
+    async def _handle_delete_schedule(self, web_request):
+        """POST /server/macro_scheduler/delete"""
+        try:
+            schedule_id = web_request.get_int("id")
+            
+            def apply():
+                if schedule_id not in self.schedules:
+                    raise self.server.error(
+                        f"Schedule {schedule_id} not found", 404
+                    )
+                if "file_section" in self.schedules[schedule_id]:
+                    raise self.server.error(
+                        f"Schedule {schedule_id} is managed by the schedule "
+                        "file, remove it from the file instead", 400
+                    )
+                schedule = self.schedules.pop(schedule_id)
+                self.scripts.pop(schedule_id, None)
+                self._unindex_tags(schedule_id, schedule.get("tags", []))
+                self.rearm_ids.add(schedule_id)
+                return {"deleted": schedule_id}
+            
+            return await self._mutate(apply)
+        except Exception as e:
+            logging.error(f"Error deleting schedule: {e}")
+            raise self.server.error(str(e), 400)
+    
+    async def _handle_toggle_schedule(self, web_request):
+        """POST /server/macro_scheduler/toggle"""
+        try:
+            schedule_id = web_request.get_int("id")
+            
+            def apply():
+                if schedule_id not in self.schedules:
+                    raise self.server.error(
+                        f"Schedule {schedule_id} not found", 404
+                    )
+                schedule = self.schedules[schedule_id]
+                schedule["enabled"] = not schedule["enabled"]
+                self.rearm_ids.add(schedule_id)
+                return {"schedule": self._public_schedule(schedule_id, schedule)}
+            
+            return await self._mutate(apply)
+        except Exception as e:
+            logging.error(f"Error toggling schedule: {e}")
+            raise self.server.error(str(e), 400)
+    
+    def _normalize_tags(self, tags: Any) -> List[str]:
+        """Validate tags, returns sorted lowercase tags without duplicates"""
+        if isinstance(tags, str):
+            tags = [tags]
+        if not isinstance(tags, list):
+            raise self.server.error("tags must be a list of strings", 400)
+        result: Set[str] = set()
+        for tag in tags:
+            if not isinstance(tag, str) or not tag.strip():
+                raise self.server.error("tags must be non-empty strings", 400)
+            result.add(tag.strip().lower())
+        return sorted(result)
+    
+    def _index_tags(self, schedule_id: int, tags: List[str]):
+        for tag in tags:
+            self.tag_index.setdefault(tag, set()).add(schedule_id)
+    
+    def _unindex_tags(self, schedule_id: int, tags: List[str]):
+        for tag in tags:
+            ids = self.tag_index.get(tag)
+            if ids is None:
+                continue
+            ids.discard(schedule_id)
+            if not ids:
+                del self.tag_index[tag]
+    
+    async def _handle_group(self, web_request):
+        """POST /server/macro_scheduler/group
+
+        Enable, disable or delete every schedule carrying one of the
+        given tags in a single mutation.
+        """
+        try:
+            action = web_request.get_str("action")
+            if action not in ("enable", "disable", "delete"):
+                raise self.server.error(f"Invalid group action: {action}", 400)
+            tags = web_request.get("tags", web_request.get("tag", None))
+            if not tags:
+                raise self.server.error("At least one tag is required", 400)
+            tags = self._normalize_tags(tags)
+            
+            def apply():
+                ids: Set[int] = set()
+                for tag in tags:
+                    ids |= self.tag_index.get(tag, set())
+                changed: List[int] = []
+                for schedule_id in sorted(ids):
+                    schedule = self.schedules[schedule_id]
+                    if action == "delete":
+                        if "file_section" in schedule:
+                            # Managed by the schedule file
+                            continue
+                        del self.schedules[schedule_id]
+                        self.scripts.pop(schedule_id, None)
+                        self._unindex_tags(schedule_id, schedule.get("tags", []))
+                    else:
+                        enabled = action == "enable"
+                        if schedule.get("enabled", True) == enabled:
+                            continue
+                        schedule["enabled"] = enabled
+                    self.rearm_ids.add(schedule_id)
+                    changed.append(schedule_id)
+                return {"action": action, "tags": tags, "schedules": changed}
+            
+            return await self._mutate(apply)
+        except Exception as e:
+            logging.error(f"Error applying group action: {e}")
+            raise self.server.error(str(e), 400)
+    
+    def _register_web_ui(self):
+        """Serve the web UI at /server/macro_scheduler/ui when installed"""
+        app = self.server.lookup_component("application", None)
+        router = getattr(app, "mutable_router", None)
+        if router is None or RequestHandler is object:
+            return
+        if self.web_ui_option:
+            path = Path(self.web_ui_option).expanduser()
+        else:
+            path = Path(__file__).resolve().parent / WEB_UI_FILE
+        assets = WebUIAssets(path)
+        try:
+            assets.load()
+        except OSError as e:
+            logging.info(f"Web UI not served, unable to read {path}: {e}")
+            return
+        router.add_handler(WEB_UI_ROUTE, WebUIHandler, {"assets": assets})
+        self.web_ui = assets
+        logging.info(
+            f"Serving web UI from {path}, encodings: "
+            f"{', '.join(sorted(assets.variants))}"
+        )
+    
+    def _get_config_dir(self) -> Optional[Path]:
+        file_manager = self.server.lookup_component("file_manager", None)
+        if file_manager is None:
+            return None
+        config_dir = file_manager.get_directory("config")
+        return Path(config_dir) if config_dir else None
+    
+    def _resolve_schedule_file(self):
+        """Locate the schedule file, relative paths are in the config directory"""
+        option = self.schedule_file_option.strip()
+        if not option:
+            return
+        path = Path(option).expanduser()
+        config_dir = self._get_config_dir()
+        if not path.is_absolute():
+            if config_dir is None:
+                logging.warning(
+                    f"Config directory unknown, schedule file {option} not loaded"
+                )
+                return
+            path = Path(config_dir) / path
+        self.schedule_file = path
+        # The file manager watches the config directory with inotify
+        if config_dir is not None:
+            try:
+                self.schedule_file_watched = str(
+                    path.resolve().relative_to(Path(config_dir).resolve())
+                )
+            except ValueError:
+                logging.info(
+                    f"Schedule file {path} is outside the config directory, "
+                    "changes are only loaded on restart"
+                )
+    
+    def _handle_filelist_changed(self, data: Dict[str, Any]):
+        """Reload the schedule file when the file manager reports a change"""
+        if self.schedule_file_watched is None:
+            return
+        for item in (data.get("item"), data.get("source_item")):
+            if (
+                isinstance(item, dict) and
+                item.get("root") == "config" and
+                item.get("path") == self.schedule_file_watched
+            ):
+                self.file_reload_pending = True
+                if self.file_task is None or self.file_task.done():
+                    self.file_task = asyncio.create_task(
+                        self._process_file_reloads()
+                    )
+                return
+    
+    async def _process_file_reloads(self):
+        while self.file_reload_pending:
+            self.file_reload_pending = False
+            await asyncio.sleep(FILE_RELOAD_DELAY)
+            await self._reload_schedule_file()
+    
+    @staticmethod
+    def _split_schedule_file(text: str) -> Dict[str, str]:
+        """Split the file into section name -> section text"""
+        sections: Dict[str, List[str]] = {}
+        current: Optional[List[str]] = None
+        for line in text.splitlines():
+            if line.startswith("["):
+                match = SCHEDULE_SECTION.match(line)
+                if match is None:
+                    logging.warning(f"Ignoring unknown section in schedule file: {line}")
+                    current = None
+                    continue
+                key = match.group(1)
+                if key in sections:
+                    logging.warning(f"Duplicate [schedule {key}], using the last one")
+                current = sections[key] = [line]
+            elif current is not None:
+                current.append(line)
+        # Trailing blank lines depend on the next section, they must not
+        # make a section look changed
+        return {
+            key: "\n".join(lines).rstrip() for key, lines in sections.items()
+        }
+    
+    def _parse_schedule_file(
+        self,
+        cancelled: threading.Event,
+        path: Path,
+        file_index: Dict[str, Tuple[int, str]]
+    ) -> Tuple[
+        Set[str],
+        Dict[str, Tuple[Dict[str, Any], List[Tuple[float, ParamTemplate]]]],
+        Dict[str, str]
+    ]:
+        """Read the schedule file and build its changed sections, runs on
+        the worker pool
+
+        Returns the section keys, the changed sections and the errors of
+        sections that failed to parse. Templates are registered once the
+        sections are applied.
+        """
+        text = path.read_text() if path.is_file() else ""
+        sections = self._split_schedule_file(text)
+        changed: Dict[str, Tuple[Dict[str, Any], List[Tuple[float, ParamTemplate]]]] = {}
+        errors: Dict[str, str] = {}
+        for key, section_text in sections.items():
+            if cancelled.is_set():
+                break
+            indexed = file_index.get(key)
+            digest = hashlib.sha1(section_text.encode()).hexdigest()
+            if indexed is not None and indexed[1] == digest:
+                continue
+            try:
+                section = ScheduleFileSection(self.server, key, section_text)
+                schedule, script = self._build_schedule(
+                    section, register=False
+                )
+                schedule["enabled"] = section.get_boolean("enabled", True)
+            except Exception as e:
+                logging.error(f"Error in schedule file section [schedule {key}]: {e}")
+                errors[key] = str(e)
+                continue
+            schedule["file_section"] = key
+            schedule["file_digest"] = digest
+            changed[key] = (schedule, script)
+        return set(sections), changed, errors
+    
+    async def _reload_schedule_file(self):
+        """Apply changes of the schedule file
+
+        Only sections whose text changed since they were last applied are
+        parsed, unchanged schedules keep their state and next run. A
+        section that fails to parse keeps its previous version.
+        """
+        path = self.schedule_file
+        if path is None:
+            return
+        start = time.monotonic()
+        try:
+            sections, changed, errors = await self._offload(
+                self._parse_schedule_file, path, dict(self.file_index)
+            )
+        except Exception as e:
+            logging.error(f"Error reading schedule file {path}: {e}")
+            return
+        # Sections applied while the file was parsed are compared again
+        changed = {
+            key: built for key, built in changed.items()
+            if self.file_index.get(key, (None, None))[1] !=
+            built[0]["file_digest"]
+        }
+        removed = [key for key in self.file_index if key not in sections]
+        self.file_errors = errors
+        
+        def apply():
+            for key in removed:
+                schedule_id = self.file_index.pop(key)[0]
+                old = self.schedules.pop(schedule_id, None)
+                if old is not None:
+                    self.scripts.pop(schedule_id, None)
+                    self._unindex_tags(schedule_id, old.get("tags", []))
+                    self.rearm_ids.add(schedule_id)
+            for key, (schedule, script) in changed.items():
+                indexed = self.file_index.get(key)
+                old = self.schedules.get(indexed[0]) if indexed else None
+                if old is not None:
+                    schedule_id = indexed[0]
+                    self._unindex_tags(schedule_id, old.get("tags", []))
+                    for field in ("run_count", "last_error"):
+                        if field in old:
+                            schedule[field] = old[field]
+                else:
+                    schedule_id = self.next_schedule_id
+                    self.next_schedule_id += 1
+                schedule["id"] = schedule_id
+                self._register_script(schedule, script)
+                self.schedules[schedule_id] = schedule
+                self.scripts[schedule_id] = script
+                self._index_tags(schedule_id, schedule.get("tags", []))
+                self.file_index[key] = (schedule_id, schedule["file_digest"])
+                self.rearm_ids.add(schedule_id)
+        
+        if changed or removed:
+            await self._mutate(apply)
+        stats = self.file_stats
+        stats["reloads"] += 1
+        stats["sections"] = len(sections)
+        stats["last_changed"] = len(changed)
+        stats["last_removed"] = len(removed)
+        stats["last_reload_seconds"] = time.monotonic() - start
+        if changed or removed or errors:
+            logging.info(
+                f"Schedule file reloaded: {len(changed)} changed, "
+                f"{len(removed)} removed, {len(errors)} invalid"
+            )
+    
+    def _get_transfer_path(self, filename: str, fmt: str) -> Path:
+        """Resolve an export or import file name in the config directory
+
+        The name must carry the extension of the format, so printer.cfg,
+        moonraker.conf and other configuration files are never touched.
+        """
+        if (
+            not filename or Path(filename).name != filename or
+            filename.startswith(".")
+        ):
+            raise self.server.error(f"Invalid file name: {filename}", 400)
+        if Path(filename).suffix.lower() != f".{fmt}":
+            raise self.server.error(
+                f"File name of a {fmt} file must end with .{fmt}: {filename}",
+                400
+            )
+        config_dir = self._get_config_dir()
+        if config_dir is None:
+            raise self.server.error("Config directory unavailable", 503)
+        return config_dir / filename
+    
+    @staticmethod
+    def _get_transfer_format(web_request, filename: Optional[str]) -> str:
+        default = "jsonl"
+        if filename is not None and filename.lower().endswith(".csv"):
+            default = "csv"
+        return web_request.get_str("format", default).lower()
+    
+    @staticmethod
+    def _iter_export_records(schedules: List[Dict[str, Any]]):
+        """Yield the definition fields of each schedule"""
+        for schedule in schedules:
+            yield {
+                field: schedule[field]
+                for field in EXPORT_FIELDS if field in schedule
+            }
+    
+    def _write_export(
+        self,
+        cancelled: threading.Event,
+        schedules: List[Dict[str, Any]],
+        path: Path,
+        fmt: str
+    ) -> int:
+        """Write schedules to path through a temporary file, runs on the
+        worker pool. Returns the number of records written.
+        """
+        if path.exists() and not self._is_export_file(path):
+            raise FileExistsError(
+                f"{path.name} exists and was not written by an export"
+            )
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        count = 0
+        try:
+            with tmp_path.open("w", newline="") as f:
+                if fmt == "csv":
+                    writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+                    writer.writeheader()
+                else:
+                    f.write(EXPORT_MARKER + "\n")
+                for record in self._iter_export_records(schedules):
+                    if cancelled.is_set():
+                        raise RuntimeError("Export cancelled")
+                    if fmt == "csv":
+                        writer.writerow({
+                            field: (
+                                json.dumps(value)
+                                if isinstance(value, (bool, list, dict))
+                                else value
+                            )
+                            for field, value in record.items()
+                        })
+                    else:
+                        f.write(json.dumps(record) + "\n")
+                    count += 1
+            tmp_path.replace(path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return count
+    
+    @staticmethod
+    def _is_export_file(path: Path) -> bool:
+        """Whether a file starts like an export, see EXPORT_MARKER"""
+        try:
+            with path.open(newline="") as f:
+                first = f.readline(4096).rstrip("\r\n")
+        except (OSError, UnicodeDecodeError):
+            return False
+        return first in (EXPORT_MARKER, ",".join(EXPORT_FIELDS))
+    
+    async def _handle_export(self, web_request):
+        """POST /server/macro_scheduler/export
+
+        Streams the schedules record by record into a file of the config
+        root, which clients download through the file manager.
+        """
+        filename = web_request.get_str("filename", None)
+        fmt = self._get_transfer_format(web_request, filename)
+        if fmt not in EXPORT_FORMATS:
+            raise self.server.error(f"Invalid export format: {fmt}", 400)
+        if filename is None:
+            filename = f"macro_schedules_export.{fmt}"
+        path = self._get_transfer_path(filename, fmt)
+        tags = self._normalize_tags(web_request.get("tags", []))
+        if tags:
+            selected: Set[int] = set()
+            for tag in tags:
+                selected |= self.tag_index.get(tag, set())
+            ids = sorted(selected)
+        else:
+            ids = sorted(self.schedules)
+        # Only fields read by key are exported and nested values are never
+        # modified in place, so the worker can read the live schedules
+        schedules = [
+            self.schedules[sid] for sid in ids if sid in self.schedules
+        ]
+        try:
+            count = await self._offload(self._write_export, schedules, path, fmt)
+        except FileExistsError as e:
+            logging.error(f"Refusing to export schedules to {path}: {e}")
+            raise self.server.error(str(e), 409)
+        except Exception as e:
+            logging.error(f"Error exporting schedules to {path}: {e}")
+            raise self.server.error(str(e), 500)
+        return {
+            "root": "config",
+            "filename": filename,
+            "format": fmt,
+            "count": count,
+            "size": path.stat().st_size
+        }
+    
+    def _iter_import_records(self, source: io.TextIOBase, fmt: str):
+        """Yield (line number, options) for each record of the source"""
+        if fmt == "csv":
+            reader = csv.DictReader(source)
+            for row in reader:
+                # Empty cells are left to the option defaults
+                yield reader.line_num, {
+                    key: value for key, value in row.items()
+                    if key is not None and value not in (None, "")
+                }
+            return
+        for line_no, line in enumerate(source, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+                continue
+            if not isinstance(record, dict):
+                record = ValueError("record must be a JSON object")
+            yield line_no, record
+    
+    def _build_import(
+        self,
+        cancelled: threading.Event,
+        path: Optional[Path],
+        data: Optional[str],
+        fmt: str,
+        macro_names: Optional[List[str]]
+    ) -> Tuple[
+        List[Tuple[Dict[str, Any], List[Tuple[float, ParamTemplate]]]],
+        int,
+        List[Dict[str, Any]]
+    ]:
+        """Parse and validate import records, runs on the worker pool
+
+        Returns the built schedules, the number of invalid records and
+        the first errors. Templates are registered once the schedules
+        are saved.
+        """
+        built: List[Tuple[Dict[str, Any], List[Tuple[float, ParamTemplate]]]] = []
+        errors: List[Dict[str, Any]] = []
+        invalid = 0
+        if path is not None:
+            source = path.open(newline="")
+        else:
+            source = io.StringIO(data, newline="")
+        with source:
+            for line_no, options in self._iter_import_records(source, fmt):
+                if cancelled.is_set():
+                    break
+                try:
+                    if isinstance(options, Exception):
+                        raise options
+                    record = ScheduleRecord(
+                        self.server, f"line {line_no}", options
+                    )
+                    schedule, script = self._build_schedule(
+                        record, register=False
+                    )
+                    schedule["enabled"] = record.get_boolean("enabled", True)
+                    self._check_macros(schedule, macro_names)
+                    built.append((schedule, script))
+                except Exception as e:
+                    invalid += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append({"line": line_no, "error": str(e)})
+        return built, invalid, errors
+    
+    async def _handle_import(self, web_request):
+        """POST /server/macro_scheduler/import
+
+        Reads schedules from a file of the config root or from inline
+        data one record at a time. Every valid record is added through a
+        single mutation, so the whole import is persisted once.
+        """
+        filename = web_request.get_str("filename", None)
+        data = web_request.get_str("data", None)
+        if (filename is None) == (data is None):
+            raise self.server.error(
+                "Either 'filename' or 'data' is required", 400
+            )
+        fmt = self._get_transfer_format(web_request, filename)
+        if fmt not in EXPORT_FORMATS:
+            raise self.server.error(f"Invalid import format: {fmt}", 400)
+        dry_run = web_request.get_boolean("dry_run", False)
+        start = time.monotonic()
+        path = (
+            self._get_transfer_path(filename, fmt)
+            if filename is not None else None
+        )
+        macro_names = await self._get_macro_names()
+        try:
+            built, invalid, errors = await self._offload(
+                self._build_import, path, data, fmt, macro_names
+            )
+        except (OSError, csv.Error, UnicodeDecodeError) as e:
+            logging.error(f"Error reading schedule import: {e}")
+            raise self.server.error(str(e), 400)
+        
+        def apply():
+            ids: List[int] = []
+            for schedule, script in built:
+                schedule_id = self.next_schedule_id
+                self.next_schedule_id += 1
+                schedule["id"] = schedule_id
+                self._register_script(schedule, script)
+                self.schedules[schedule_id] = schedule
+                self.scripts[schedule_id] = script
+                self._index_tags(schedule_id, schedule.get("tags", []))
+                self.rearm_ids.add(schedule_id)
+                ids.append(schedule_id)
+            return ids
+        
+        ids: List[int] = []
+        if built and not dry_run:
+            ids = await self._mutate(apply)
+        elapsed = time.monotonic() - start
+        logging.info(
+            f"Schedule import: {len(built)} valid, {invalid} invalid records "
+            f"in {elapsed:.2f}s{' (dry run)' if dry_run else ''}"
+        )
+        return {
+            "imported": len(ids),
+            "valid": len(built),
+            "invalid": invalid,
+            "errors": errors,
+            "dry_run": dry_run,
+            "ids": ids,
+            "elapsed_seconds": elapsed
+        }
+    
+    async def _get_macro_names(self) -> Optional[List[str]]:
+        """Sorted G-code commands known to Klipper, None if unknown
+
+        Built from /printer/gcode/help, which lists built-in, module and
+        macro commands, merged with the gcode_macro objects so macros
+        are known even when the help request fails.
+        """
+        if self.macro_names is not None or not self.klippy_ready:
+            return self.macro_names
+        async with self.macro_lock:
+            if self.macro_names is not None:
+                return self.macro_names
+            klippy_apis = self.server.lookup_component("klippy_apis")
+            macro_help: Dict[str, str] = {}
+            fetched = False
+            try:
+                # klippy_apis has no public wrapper for gcode/help
+                result = await klippy_apis._send_klippy_request(
+                    "gcode/help", {}
+                )
+            except Exception as e:
+                logging.warning(f"Unable to fetch G-code help: {e}")
+            else:
+                fetched = True
+                for name, help_text in result.items():
+                    macro_help[str(name).upper()] = str(help_text)
+            try:
+                objects = await klippy_apis.get_object_list()
+            except Exception as e:
+                logging.warning(f"Unable to fetch G-code macros: {e}")
+            else:
+                fetched = True
+                for obj in objects:
+                    if obj.lower().startswith(MACRO_OBJECT_PREFIX):
+                        name = obj[len(MACRO_OBJECT_PREFIX):].strip().upper()
+                        macro_help.setdefault(name, MACRO_DEFAULT_HELP)
+            if not fetched:
+                return None
+            self.macro_help = macro_help
+            self.macro_names = sorted(macro_help)
+            self.macro_fetched_at = time.time()
+            logging.info(f"Cached {len(self.macro_names)} G-code commands")
+        return self.macro_names
+    
+    def _check_macros(
+        self, schedule: Dict[str, Any], macro_names: Optional[List[str]]
+    ):
+        """Reject schedules running a command unknown to Klipper
+
+        Standard G, M and T codes are always accepted.
+        """
+        if not self.validate_macros or macro_names is None:
+            return
+        if "steps" in schedule:
+            macros = [step["macro"] for step in schedule["steps"]]
+        else:
+            macros = [schedule["macro"]]
+        if schedule.get("prepare_macro"):
+            macros.append(schedule["prepare_macro"])
+        for macro in macros:
+            name = macro.upper()
+            if STANDARD_GCODE.match(name) or name in self.macro_help:
+                continue
+            raise self.server.error(f"Unknown macro: {macro}", 400)
     
-    async def _handle_add_schedule(self, web_request):
-        """POST /server/macro_scheduler/add"""
+    async def _handle_list_macros(self, web_request):
+        """GET /server/macro_scheduler/macros
+
+        Commands are sorted, so a prefix search is a bisection of the
+        cached list. Commands starting with an underscore are hidden
+        unless requested.
+        """
+        prefix = web_request.get_str("prefix", "").strip().upper()
+        limit = web_request.get_int("limit", 0)
+        include_hidden = web_request.get_boolean("include_hidden", False)
+        names = await self._get_macro_names()
+        if names is None:
+            raise self.server.error("G-code commands unavailable", 503)
+        macros: List[Dict[str, str]] = []
+        for idx in range(bisect.bisect_left(names, prefix), len(names)):
+            name = names[idx]
+            if not name.startswith(prefix):
+                break
+            if name.startswith("_") and not include_hidden:
+                continue
+            macros.append({"name": name, "help": self.macro_help[name]})
+            if len(macros) == limit:
+                break
+        return {
+            "macros": macros,
+            "total": len(names),
+            "fetched_at": self.macro_fetched_at
+        }
+    
+    async def _handle_list_exclusions(self, web_request):
+        """GET /server/macro_scheduler/exclusions"""
+        return {
+            "exclusions": [
+                window for _, window in sorted(self.exclusions.items())
+            ]
+        }
+    
+    async def _handle_add_exclusion(self, web_request):
+        """POST /server/macro_scheduler/exclusions/add"""
         try:
-            name = web_request.get_str("name")
-            macro = web_request.get_str("macro")
-            schedule_type = web_request.get_str("schedule_type", "once")
-            params = web_request.get("params", {})
-            
-            schedule = {
-                "id": self.next_schedule_id,
-                "name": name,
-                "macro": macro,
-                "schedule_type": schedule_type,
-                "params": params,
-                "enabled": True,
-                "next_run": None
-            }
-            
-            if schedule_type == "once":
-                datetime_str = web_request.get_str("datetime")
-                schedule["datetime"] = datetime_str
-                schedule["next_run"] = datetime_str
-            elif schedule_type == "daily":
-                time_str = web_request.get_str("time")
-                schedule["time"] = time_str
-                schedule["next_run"] = self._calculate_next_daily_run(time_str)
-            elif schedule_type == "weekly":
-                time_str = web_request.get_str("time")
-                days = web_request.get("days", [])
-                schedule["time"] = time_str
-                schedule["days"] = days
-                schedule["next_run"] = self._calculate_next_weekly_run(time_str, days)
-            elif schedule_type == "interval":
-                interval_minutes = web_request.get_int("interval_minutes", 60)
-                schedule["interval_minutes"] = interval_minutes
-                schedule["next_run"] = self._calculate_next_interval_run(interval_minutes)
-            elif schedule_type == "cron":
-                cron_expr = web_request.get_str("cron_expression")
-                schedule["cron_expression"] = cron_expr
-                schedule["next_run"] = self._calculate_next_cron_run(cron_expr)
-            
-            self.schedules[self.next_schedule_id] = schedule
-            self.next_schedule_id += 1
+            window = self._build_exclusion(web_request)
+            exclusions = self.exclusions
+            exclusion_id = self.next_exclusion_id
+            plan = await self._plan_reschedule(
+                window, {**exclusions, exclusion_id: window}
+            )
             
-            await self._save_schedules()
-            await self._start_schedule(schedule["id"])
+            def apply():
+                if (
+                    self.exclusions is not exclusions or
+                    self.next_exclusion_id != exclusion_id
+                ):
+                    # Another window changed while planning
+                    plan.clear()
+                self.next_exclusion_id += 1
+                window["id"] = exclusion_id
+                window.setdefault("name", f"Exclusion {exclusion_id}")
+                self.exclusions = {**self.exclusions, exclusion_id: window}
+                return {
+                    "exclusion": window,
+                    "rescheduled": self._reschedule_exclusions(window, plan)
+                }
             
-            return {"schedule": schedule}
+            return await self._mutate(apply)
         except Exception as e:
-            logging.error(f"Error adding schedule: {e}")
+            logging.error(f"Error adding exclusion: {e}")
             raise self.server.error(str(e), 400)
     
-    async def _handle_delete_schedule(self, web_request):
-        """POST /server/macro_scheduler/delete"""
+    async def _handle_delete_exclusion(self, web_request):
+        """POST /server/macro_scheduler/exclusions/delete"""
         try:
-            schedule_id = web_request.get_int("id")
+            exclusion_id = web_request.get_int("id")
+            current = self.exclusions
+            plan: Dict[int, Tuple[Dict[str, Any], Optional[str], Optional[str]]] = {}
+            if exclusion_id in current:
+                remaining = dict(current)
+                plan = await self._plan_reschedule(
+                    remaining.pop(exclusion_id), remaining
+                )
             
-            if schedule_id in self.schedules:
-                await self._stop_schedule(schedule_id)
-                del self.schedules[schedule_id]
-                await self._save_schedules()
-                return {"deleted": schedule_id}
+            def apply():
+                if exclusion_id not in self.exclusions:
+                    raise self.server.error(
+                        f"Exclusion {exclusion_id} not found", 404
+                    )
+                if self.exclusions is not current:
+                    # Another window changed while planning
+                    plan.clear()
+                exclusions = dict(self.exclusions)
+                window = exclusions.pop(exclusion_id)
+                self.exclusions = exclusions
+                return {
+                    "deleted": exclusion_id,
+                    "rescheduled": self._reschedule_exclusions(window, plan)
+                }
             
-            raise self.server.error(f"Schedule {schedule_id} not found", 404)
+            return await self._mutate(apply)
         except Exception as e:
-            logging.error(f"Error deleting schedule: {e}")
+            logging.error(f"Error deleting exclusion: {e}")
             raise self.server.error(str(e), 400)
     
-    async def _handle_toggle_schedule(self, web_request):
-        """POST /server/macro_scheduler/toggle"""
-        try:
-            schedule_id = web_request.get_int("id")
-            
-            if schedule_id not in self.schedules:
-                raise self.server.error(f"Schedule {schedule_id} not found", 404)
-            
-            schedule = self.schedules[schedule_id]
-            schedule["enabled"] = not schedule["enabled"]
-            
-            if schedule["enabled"]:
-                await self._start_schedule(schedule_id)
+    def _build_exclusion(self, web_request) -> Dict[str, Any]:
+        """Validate the arguments of an exclusion window"""
+        kind = web_request.get_str("type", "window")
+        window: Dict[str, Any] = {"type": kind}
+        name = web_request.get_str("name", None)
+        if name:
+            window["name"] = name
+        tags = self._normalize_tags(web_request.get("tags", []))
+        if tags:
+            window["tags"] = tags
+        if kind == "window":
+            for field in ("start", "end"):
+                value = web_request.get_str(field)
+                try:
+                    datetime.strptime(value, "%H:%M")
+                except ValueError:
+                    raise self.server.error(
+                        f"{field} must be a time in HH:MM format", 400
+                    )
+                window[field] = value
+            days = web_request.get("days", [])
+            if days:
+                if not all(isinstance(d, int) and 0 <= d <= 6 for d in days):
+                    raise self.server.error(
+                        "days must be weekday numbers from 0 to 6", 400
+                    )
+                window["days"] = sorted(set(days))
+        elif kind == "dates":
+            dates = web_request.get("dates")
+            if isinstance(dates, str):
+                dates = [d.strip() for d in dates.split(",") if d.strip()]
+            if not isinstance(dates, list) or not dates:
+                raise self.server.error("dates must be a list of dates", 400)
+            for date_str in dates:
+                # MM-DD repeats every year, checked against a leap year
+                full = f"2000-{date_str}" if len(date_str) == 5 else date_str
+                try:
+                    datetime.strptime(full, "%Y-%m-%d")
+                except (TypeError, ValueError):
+                    raise self.server.error(
+                        f"Invalid date {date_str}, use YYYY-MM-DD or MM-DD", 400
+                    )
+            window["dates"] = sorted(set(dates))
+        elif kind == "absolute":
+            start = datetime.fromisoformat(web_request.get_str("start"))
+            end = datetime.fromisoformat(web_request.get_str("end"))
+            if end <= start:
+                raise self.server.error("end must be after start", 400)
+            window["start"] = start.isoformat()
+            window["end"] = end.isoformat()
+        else:
+            raise self.server.error(f"Invalid exclusion type: {kind}", 400)
+        return window
+    
+    def _get_rescheduled(
+        self, window: Dict[str, Any]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Enabled schedules whose next run a change of window can move"""
+        tags = set(window.get("tags", []))
+        return [
+            (sid, schedule) for sid, schedule in self.schedules.items()
+            if schedule.get("enabled", True) and
+            (schedule.get("next_run") or schedule.get("suspended")) and
+            (not tags or tags.intersection(schedule.get("tags", [])))
+        ]
+    
+    async def _plan_reschedule(
+        self, window: Dict[str, Any], exclusions: Dict[int, Dict[str, Any]]
+    ) -> Dict[int, Tuple[Dict[str, Any], Optional[str], Optional[str]]]:
+        """Calculate next runs under the exclusions a window change results
+        in, before the change is applied. Large schedule sets are planned
+        on the worker pool.
+        """
+        return await self._run_sized(
+            self._plan_next_runs, self._get_rescheduled(window), exclusions
+        )
+    
+    def _plan_next_runs(
+        self,
+        cancelled: threading.Event,
+        items: List[Tuple[int, Dict[str, Any]]],
+        exclusions: Dict[int, Dict[str, Any]]
+    ) -> Dict[int, Tuple[Dict[str, Any], Optional[str], Optional[str]]]:
+        """Maps schedule ids to the schedule, the next run the plan started
+        from and the planned next run
+        """
+        now = datetime.now()
+        # Indexes of planned windows are not shared with the live cache
+        indexes: Dict[Tuple[int, ...], ExclusionIndex] = {}
+        plan: Dict[int, Tuple[Dict[str, Any], Optional[str], Optional[str]]] = {}
+        for sid, schedule in items:
+            if cancelled.is_set():
+                break
+            current = schedule.get("next_run")
+            plan[sid] = (
+                schedule,
+                current,
+                self._next_allowed_run(schedule, now, exclusions, indexes)
+            )
+        return plan
+    
+    def _next_allowed_run(
+        self,
+        schedule: Dict[str, Any],
+        now: datetime,
+        exclusions: Optional[Dict[int, Dict[str, Any]]] = None,
+        indexes: Optional[Dict[Tuple[int, ...], ExclusionIndex]] = None
+    ) -> Optional[str]:
+        """Next run of a schedule after the exclusion windows changed"""
+        timing = self._timing_type(schedule)
+        current = schedule.get("next_run")
+        if timing == "once":
+            base = schedule["datetime"]
+            if datetime.fromisoformat(base) <= now:
+                base = current or now.isoformat()
+        elif timing == "interval" and current:
+            base = current
+        else:
+            base = self._calculate_next_occurrence(schedule)
+        return self._skip_exclusions(schedule, base, exclusions, indexes)
+    
+    def _set_next_run(self, schedule: Dict[str, Any], next_run: Optional[str]):
+        """Store a next run, None suspends the schedule until the
+        exclusion windows change
+        """
+        schedule["next_run"] = next_run
+        if next_run is not None:
+            schedule.pop("suspended", None)
+        elif not schedule.get("suspended"):
+            schedule["suspended"] = True
+            logging.info(
+                f"Schedule {schedule.get('id')} suspended, every run falls "
+                f"in an exclusion window"
+            )
+    
+    def _reschedule_exclusions(
+        self,
+        window: Dict[str, Any],
+        plan: Dict[int, Tuple[Dict[str, Any], Optional[str], Optional[str]]]
+    ) -> List[int]:
+        """Recalculate next runs after a window changed, runs on the writer task
+
+        Planned next runs are used for schedules unchanged since the plan,
+        the others are calculated here. Returns the ids of the schedules
+        whose next run moved or that were suspended or resumed.
+
+        Sleeping tasks are rearmed. A task executing a run is left to
+        finish it, it reads the next run again once the run is recorded.
+        """
+        self.exclusion_indexes = {}
+        now = datetime.now()
+        moved: List[int] = []
+        for sid, schedule in self._get_rescheduled(window):
+            current = schedule.get("next_run")
+            planned = plan.get(sid)
+            if (
+                planned is not None and planned[0] is schedule and
+                planned[1] == current
+            ):
+                next_run = planned[2]
             else:
-                await self._stop_schedule(schedule_id)
-            
-            await self._save_schedules()
-            return {"schedule": schedule}
-        except Exception as e:
-            logging.error(f"Error toggling schedule: {e}")
-            raise self.server.error(str(e), 400)
+                next_run = self._next_allowed_run(schedule, now)
+            if next_run == current:
+                continue
+            self._set_next_run(schedule, next_run)
+            if sid in self.firing:
+                self.changed_ids.add(sid)
+            else:
+                self.rearm_ids.add(sid)
+            moved.append(sid)
+        return moved
+    
+    async def _handle_list_tags(self, web_request):
+        """GET /server/macro_scheduler/tags"""
+        return {
+            "tags": {
+                tag: sorted(ids) for tag, ids in sorted(self.tag_index.items())
+            }
+        }
     
     async def _handle_list_text(self, web_request):
         """GET /server/macro_scheduler/list_text - Returns text format for macros"""
         if not self.schedules:
             return {"text": "No scheduled macros configured"}
-        
+        text = await self._run_sized(
+            self._render_text, list(self.schedules.items())
+        )
+        return {"text": text}
+    
+    @staticmethod
+    def _render_text(
+        cancelled: threading.Event, items: List[Tuple[int, Dict[str, Any]]]
+    ) -> str:
         lines = ["=== Scheduled Macros ===", ""]
-        for sid, schedule in self.schedules.items():
+        for sid, schedule in items:
             status = "✓ ACTIVE" if schedule.get("enabled") else "✗ DISABLED"
             schedule_type = schedule["schedule_type"].upper()
             
@@ -224,14 +2677,140 @@ class MacroScheduler:
             
             lines.append("")
         
-        active = sum(1 for s in self.schedules.values() if s.get("enabled"))
-        lines.append(f"Total: {active}/{len(self.schedules)} active")
+        active = sum(1 for _, s in items if s.get("enabled"))
+        lines.append(f"Total: {active}/{len(items)} active")
         
-        return {"text": "\n".join(lines)}
+        return "\n".join(lines)
+    
+    async def _handle_list_pending(self, web_request):
+        """GET /server/macro_scheduler/pending"""
+        return {
+            "klippy_ready": self.klippy_ready,
+            "max_size": self.pending.maxlen,
+            "pending": list(self.pending)
+        }
+    
+    async def _handle_history(self, web_request):
+        """GET /server/macro_scheduler/history - Newest executions first"""
+        schedule_id = web_request.get_int("schedule_id", None)
+        limit = web_request.get_int("limit", None)
+        entries: List[Dict[str, Any]] = []
+        for run in reversed(self.history):
+            if schedule_id is not None and run["schedule_id"] != schedule_id:
+                continue
+            entry = {k: v for k, v in run.items() if not k.startswith("_")}
+            entry["output"] = list(run["output"])
+            entries.append(entry)
+            if limit is not None and len(entries) >= limit:
+                break
+        return {"history": entries}
     
-    def _calculate_next_daily_run(self, time_str: str) -> str:
+    async def _handle_readiness(self, web_request):
+        """GET /server/macro_scheduler/readiness
+
+        How close to the target time prepare macros finished, computed
+        from the execution history.
+        """
+        schedule_id = web_request.get_int("schedule_id", None)
+        runs: Dict[int, List[Dict[str, Any]]] = {}
+        for run in self.history:
+            if run["kind"] == "prepare" and run["status"] != "running":
+                runs.setdefault(run["schedule_id"], []).append(run)
+        reports: List[Dict[str, Any]] = []
+        for sid, schedule in sorted(self.schedules.items()):
+            if not schedule.get("prepare_macro"):
+                continue
+            if schedule_id is not None and sid != schedule_id:
+                continue
+            if "lead_seconds" in schedule:
+                lead_source = "fixed"
+            elif "learned_lead_seconds" in schedule:
+                lead_source = "learned"
+            else:
+                lead_source = "default"
+            samples = runs.get(sid, [])
+            offsets = [
+                run["ready_offset"] for run in samples if "ready_offset" in run
+            ]
+            reports.append({
+                "schedule_id": sid,
+                "name": schedule["name"],
+                "prepare_macro": schedule["prepare_macro"],
+                "lead_seconds": self._get_lead_seconds(schedule),
+                "lead_source": lead_source,
+                "samples": len(samples),
+                "failed": len(samples) - len(offsets),
+                "on_time": sum(1 for offset in offsets if offset <= 0),
+                "late": sum(1 for offset in offsets if offset > 0),
+                "mean_offset": (
+                    round(sum(offsets) / len(offsets), 3) if offsets else None
+                ),
+                "max_late": max([o for o in offsets if o > 0], default=None),
+                "recent": [
+                    {
+                        "run_id": run["run_id"],
+                        "target": run["target"],
+                        "ready": run["finished"],
+                        "ready_offset": run.get("ready_offset"),
+                        "status": run["status"]
+                    }
+                    for run in samples[-PREPARE_SAMPLES:]
+                ]
+            })
+        return {"readiness": reports}
+    
+    async def _handle_metrics(self, web_request):
+        """GET /server/macro_scheduler/metrics"""
+        stats = dict(self.mutation_stats)
+        batches = stats["batches"]
+        stats["avg_batch"] = stats["commands"] / batches if batches else 0.
+        stats["queued"] = self.mutations.qsize()
+        return {
+            "revision": self.revision,
+            "mutations": stats,
+            "rate_limits": {
+                "mode": self.rate_limit_mode,
+                "global": (
+                    self.global_bucket.get_status()
+                    if self.global_bucket is not None else None
+                ),
+                "macros": {
+                    macro: bucket.get_status()
+                    for macro, bucket in self.macro_buckets.items()
+                }
+            },
+            "web_ui": self.web_ui.get_status() if self.web_ui else None,
+            "offload": {
+                "workers": OFFLOAD_WORKERS,
+                "min_schedules": OFFLOAD_MIN_SCHEDULES,
+                **self.offload_stats
+            },
+            "loop_latency": {
+                "interval": self.loop_probe_interval,
+                **self.loop_latency
+            },
+            "schedule_file": {
+                "path": str(self.schedule_file) if self.schedule_file else None,
+                "watched": self.schedule_file_watched is not None,
+                "errors": dict(self.file_errors),
+                **self.file_stats
+            }
+        }
+    
+    async def _handle_list_breakers(self, web_request):
+        """GET /server/macro_scheduler/breakers"""
+        return {
+            "breakers": {
+                macro: breaker.get_status()
+                for macro, breaker in self.breakers.items()
+            }
+        }
+    
+    def _calculate_next_daily_run(
+        self, time_str: str, after: Optional[datetime] = None
+    ) -> str:
         """Calculate next run time for daily schedule"""
-        now = datetime.now()
+        now = after or datetime.now()
         time_parts = time_str.split(":")
         hour, minute = int(time_parts[0]), int(time_parts[1])
         
@@ -241,14 +2820,16 @@ class MacroScheduler:
         
         return next_run.isoformat()
     
-    def _calculate_next_weekly_run(self, time_str: str, days: List[int]) -> str:
+    def _calculate_next_weekly_run(
+        self, time_str: str, days: List[int], after: Optional[datetime] = None
+    ) -> str:
         """Calculate next run time for weekly schedule
         days: list of weekday numbers (0=Monday, 6=Sunday)
         """
         if not days:
-            return self._calculate_next_daily_run(time_str)
+            return self._calculate_next_daily_run(time_str, after)
         
-        now = datetime.now()
+        now = after or datetime.now()
         time_parts = time_str.split(":")
         hour, minute = int(time_parts[0]), int(time_parts[1])
         
@@ -271,15 +2852,106 @@ class MacroScheduler:
             return next_run.isoformat()
         
         # Fallback shouldn't be reached, but ensure we always return a future run
-        return self._calculate_next_daily_run(time_str)
+        return self._calculate_next_daily_run(time_str, after)
     
-    def _calculate_next_interval_run(self, interval_minutes: int) -> str:
+    def _calculate_next_interval_run(
+        self, interval_minutes: int, after: Optional[datetime] = None
+    ) -> str:
         """Calculate next run time for interval-based schedule"""
-        now = datetime.now()
+        now = after or datetime.now()
         next_run = now + timedelta(minutes=interval_minutes)
         return next_run.isoformat()
     
-    def _calculate_next_cron_run(self, cron_expression: str) -> str:
+    def _calculate_next_solar_run(
+        self, latitude: float, longitude: float, event: str,
+        offset_minutes: int, after: Optional[datetime] = None
+    ) -> Optional[str]:
+        """Calculate next run time relative to a sun event
+
+        Event times come from yearly tables cached per location, the
+        next run is a binary search in the table.
+        """
+        offset = timedelta(minutes=offset_minutes)
+        target = (after or datetime.now()) - offset
+        # Tables are by UTC day, events near new year may be in the
+        # table of the neighbouring year
+        for year in range(target.year - 1, target.year + 2):
+            table = solar_year_table(latitude, longitude, event, year)
+            idx = bisect.bisect_right(table, target)
+            if idx < len(table):
+                return (table[idx] + offset).isoformat()
+        return None
+    
+    def _validate_cron(self, cron_expression: str):
+        """Reject expressions the cron parser does not support"""
+        parts = cron_expression.split()
+        if len(parts) != 5:
+            raise self.server.error(
+                "Cron expression needs 5 fields: minute hour day month weekday",
+                400
+            )
+        for part, (field, low, high, step, multiple) in zip(parts, CRON_FIELDS):
+            if part == "*":
+                continue
+            if step and part.startswith("*/"):
+                values = [part[2:]]
+                low = 1
+            elif multiple:
+                values = part.split(",")
+            else:
+                values = [part]
+            for value in values:
+                if not value.isdigit() or not low <= int(value) <= high:
+                    raise self.server.error(
+                        f"Invalid cron {field} field: {part}", 400
+                    )
+    
+    async def _handle_preview(self, web_request):
+        """GET /server/macro_scheduler/preview
+
+        Validates a schedule definition without saving it and returns its
+        next runs, exclusion windows applied. Invalid definitions are
+        reported in the result so editors can show the error while typing.
+        """
+        count = min(max(1, web_request.get_int("count", 5)), PREVIEW_MAX_RUNS)
+        options = {
+            key: value for key, value in web_request.get_args().items()
+            if key != "count"
+        }
+        options.setdefault("name", "preview")
+        options.setdefault("macro", "PREVIEW")
+        return await self._offload(self._preview_runs, options, count)
+    
+    def _preview_runs(
+        self, cancelled: threading.Event, options: Dict[str, Any], count: int
+    ) -> Dict[str, Any]:
+        """Build a preview schedule and walk its next runs, runs on the
+        worker pool
+        """
+        try:
+            schedule, _ = self._build_schedule(
+                ScheduleRecord(self.server, "preview", options), register=False
+            )
+        except Exception as e:
+            return {"valid": False, "error": str(e), "runs": []}
+        runs: List[str] = []
+        next_run = schedule["next_run"]
+        while (
+            next_run is not None and len(runs) < count and
+            not cancelled.is_set()
+        ):
+            runs.append(next_run)
+            next_run = self._skip_exclusions(
+                schedule,
+                self._calculate_next_occurrence(
+                    schedule, datetime.fromisoformat(next_run)
+                )
+            )
+        return {"valid": True, "error": None, "runs": runs}
+    
+    def _calculate_next_cron_run(
+        self, cron_expression: str, after: Optional[datetime] = None
+    ) -> str:
         """Calculate next run time for cron-style schedule
         Simplified cron parser supporting: minute hour day month weekday
         Examples:
@@ -287,14 +2959,14 @@ class MacroScheduler:
         - "30 14 * * 1,3,5" = Every Mon, Wed, Fri at 2:30 PM
         - "0 */3 * * *" = Every 3 hours
         """
+        now = after or datetime.now()
         try:
             parts = cron_expression.split()
             if len(parts) != 5:
                 logging.error(f"Invalid cron expression: {cron_expression}")
-                return datetime.now().isoformat()
+                return now.isoformat()
             
             minute, hour, day, month, weekday = parts
-            now = datetime.now()
             
             # Simple cron parser for common patterns
             # Start from current time and check next valid times
@@ -347,13 +3019,15 @@ class MacroScheduler:
             
         except Exception as e:
             logging.error(f"Error parsing cron expression {cron_expression}: {e}")
-            return (datetime.now() + timedelta(hours=1)).isoformat()
+            return (now + timedelta(hours=1)).isoformat()
     
     async def _start_all_schedules(self):
-        """Start all enabled schedules"""
+        """Start all enabled schedules, suspended ones wait for a change
+        of the exclusion windows
+        """
         for schedule_id in list(self.schedules.keys()):
             schedule = self.schedules[schedule_id]
-            if schedule.get("enabled", True):
+            if schedule.get("enabled", True) and not schedule.get("suspended"):
                 await self._start_schedule(schedule_id)
     
     async def _start_schedule(self, schedule_id: int):
@@ -363,23 +3037,178 @@ class MacroScheduler:
         
         schedule = self.schedules[schedule_id]
         task = asyncio.create_task(self._run_schedule(schedule_id))
+        task.add_done_callback(
+            lambda t, sid=schedule_id: self._on_task_done(sid, t)
+        )
         self.tasks[schedule_id] = task
         
         logging.info(f"Started schedule {schedule_id}: {schedule['name']}")
     
+    def _on_task_done(self, schedule_id: int, task: asyncio.Task):
+        """Drop tasks that ended on their own (finished one-shots)"""
+        if self.tasks.get(schedule_id) is task:
+            del self.tasks[schedule_id]
+    
     async def _stop_schedule(self, schedule_id: int):
         """Stop a specific schedule"""
-        if schedule_id in self.tasks:
-            self.tasks[schedule_id].cancel()
+        task = self.tasks.pop(schedule_id, None)
+        if task is not None:
+            task.cancel()
             try:
-                await self.tasks[schedule_id]
+                await task
             except asyncio.CancelledError:
                 pass
-            del self.tasks[schedule_id]
             logging.info(f"Stopped schedule {schedule_id}")
     
+    def _calculate_next_run(self, schedule: Dict[str, Any]) -> Optional[str]:
+        """Calculate the next allowed run after a fire"""
+        return self._skip_exclusions(
+            schedule, self._calculate_next_occurrence(schedule)
+        )
+    
+    def _calculate_next_occurrence(
+        self, schedule: Dict[str, Any], after: Optional[datetime] = None
+    ) -> Optional[str]:
+        """Calculate the next run based on schedule type"""
+        schedule_type = self._timing_type(schedule)
+        if schedule_type == "daily":
+            return self._calculate_next_daily_run(schedule["time"], after)
+        elif schedule_type == "weekly":
+            return self._calculate_next_weekly_run(
+                schedule["time"],
+                schedule.get("days", []),
+                after
+            )
+        elif schedule_type == "interval":
+            return self._calculate_next_interval_run(
+                schedule["interval_minutes"], after
+            )
+        elif schedule_type == "cron":
+            return self._calculate_next_cron_run(
+                schedule["cron_expression"], after
+            )
+        elif schedule_type == "solar":
+            return self._calculate_next_solar_run(
+                schedule["latitude"],
+                schedule["longitude"],
+                schedule["solar_event"],
+                schedule.get("offset_minutes", 0),
+                after
+            )
+        return None
+    
+    @staticmethod
+    def _timing_type(schedule: Dict[str, Any]) -> str:
+        schedule_type = schedule["schedule_type"]
+        if schedule_type == "sequence":
+            return schedule.get("trigger_type", "once")
+        return schedule_type
+    
+    def _get_exclusion_index(
+        self,
+        schedule: Dict[str, Any],
+        when: datetime,
+        exclusions: Optional[Dict[int, Dict[str, Any]]] = None,
+        indexes: Optional[Dict[Tuple[int, ...], ExclusionIndex]] = None
+    ) -> Optional[ExclusionIndex]:
+        """Index of the global and tag windows applying to a schedule
+
+        exclusions and indexes default to the live windows and the cache
+        of the calling thread, see _get_index_cache.
+        """
+        tags = set(schedule.get("tags", []))
+        if exclusions is None:
+            exclusions = self.exclusions
+            indexes = self._get_index_cache()
+        elif indexes is None:
+            indexes = {}
+        key = tuple(
+            eid for eid, window in sorted(exclusions.items())
+            if not window.get("tags") or tags.intersection(window["tags"])
+        )
+        if not key:
+            return None
+        index = indexes.get(key)
+        if index is None or not index.covers(when):
+            index = ExclusionIndex(
+                [exclusions[eid] for eid in key],
+                when - timedelta(days=1)
+            )
+            indexes[key] = index
+        return index
+    
+    def _skip_exclusions(
+        self,
+        schedule: Dict[str, Any],
+        next_run: Optional[str],
+        exclusions: Optional[Dict[int, Dict[str, Any]]] = None,
+        indexes: Optional[Dict[Tuple[int, ...], ExclusionIndex]] = None
+    ) -> Optional[str]:
+        """Move a run out of exclusion windows
+
+        Recurring schedules skip to their first occurrence after the
+        window, once and interval schedules run when the window ends.
+        Returns None if no allowed run was found. exclusions and indexes
+        default to the live windows, see _get_exclusion_index.
+        """
+        if exclusions is None:
+            exclusions = self.exclusions
+            indexes = self._get_index_cache()
+        elif indexes is None:
+            indexes = {}
+        if next_run is None or not exclusions:
+            return next_run
+        when = datetime.fromisoformat(next_run)
+        limit = when + timedelta(days=2 * EXCLUSION_HORIZON_DAYS)
+        shift = self._timing_type(schedule) in ("once", "interval")
+        for _ in range(MAX_EXCLUSION_SKIPS):
+            if when > limit:
+                break
+            index = self._get_exclusion_index(
+                schedule, when, exclusions, indexes
+            )
+            if index is None:
+                return when.isoformat()
+            allowed = index.next_allowed(when)
+            if allowed == when:
+                return when.isoformat()
+            if shift:
+                when = allowed
+                continue
+            next_str = self._calculate_next_occurrence(
+                schedule, allowed - timedelta(microseconds=1)
+            )
+            if next_str is None:
+                return None
+            when = datetime.fromisoformat(next_str)
+        logging.warning(
+            f"Schedule {schedule.get('name')}: no run outside the exclusion "
+            f"windows found"
+        )
+        return None
+    
+    def _get_breaker(self, macro: str) -> CircuitBreaker:
+        """Return the circuit breaker for a macro, creating it on demand"""
+        key = macro.upper()
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                key, self.breaker_threshold, self.breaker_reset
+            )
+            self.breakers[key] = breaker
+        return breaker
+    
+    def _get_retry_delay(self, schedule: Dict[str, Any], attempt: int) -> float:
+        """Bounded exponential backoff with jitter for a retry attempt"""
+        base = schedule.get("retry_backoff_seconds", self.retry_backoff)
+        delay = min(self.retry_backoff_max, base * 2 ** (attempt - 1))
+        # Equal jitter keeps at least half of the delay so retries from
+        # schedules failing together spread out without firing immediately
+        return delay / 2 + random.uniform(0, delay / 2)
+    
     async def _run_schedule(self, schedule_id: int):
         """Execute schedule loop"""
+        attempt = 0
         while True:
             try:
                 schedule = self.schedules.get(schedule_id)
@@ -391,72 +3220,796 @@ class MacroScheduler:
                     break
                     
                 next_run = datetime.fromisoformat(next_run_str)
-                now = datetime.now()
-                
-                wait_seconds = (next_run - now).total_seconds()
-                
-                if wait_seconds > 0:
-                    await asyncio.sleep(wait_seconds)
                 
-                await self._execute_macro(schedule)
+                if (
+                    schedule.get("prepare_macro") and
+                    self.prepared.get(schedule_id) != next_run_str
+                ):
+                    lead = self._get_lead_seconds(schedule)
+                    await self._sleep_until(next_run - timedelta(seconds=lead))
+                    self._start_prepare(schedule, next_run_str)
+                await self._sleep_until(next_run)
                 
-                # Calculate next run based on schedule type
-                if schedule["schedule_type"] == "once":
-                    schedule["enabled"] = False
-                    await self._save_schedules()
-                    break
-                elif schedule["schedule_type"] == "daily":
-                    schedule["next_run"] = self._calculate_next_daily_run(
-                        schedule["time"]
-                    )
-                elif schedule["schedule_type"] == "weekly":
-                    schedule["next_run"] = self._calculate_next_weekly_run(
-                        schedule["time"],
-                        schedule.get("days", [])
+                self.firing.add(schedule_id)
+                try:
+                    fired, error = await self._fire_schedule(
+                        schedule, next_run_str
                     )
-                elif schedule["schedule_type"] == "interval":
-                    schedule["next_run"] = self._calculate_next_interval_run(
-                        schedule["interval_minutes"]
+                    attempt = 0
+                    advanced = await self._mutate(
+                        lambda: self._advance_schedule(schedule, fired, error)
                     )
-                elif schedule["schedule_type"] == "cron":
-                    schedule["next_run"] = self._calculate_next_cron_run(
-                        schedule["cron_expression"]
-                    )
-                
-                await self._save_schedules()
+                finally:
+                    self.firing.discard(schedule_id)
+                if not advanced:
+                    break
                 
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                logging.error(f"Error in schedule {schedule_id}: {e}")
-                await asyncio.sleep(60)
+                attempt += 1
+                delay = self._get_retry_delay(schedule or {}, attempt)
+                logging.error(
+                    f"Error in schedule {schedule_id}: {e}, "
+                    f"retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+    
+    async def _sleep_until(self, when: datetime):
+        """Sleep until a local wall-clock time
+
+        Sleeps in bounded steps and checks the wall clock again, so DST
+        changes and clock corrections don't fire early or late.
+        """
+        wait_seconds = (when - datetime.now()).total_seconds()
+        while wait_seconds > 0:
+            await asyncio.sleep(min(wait_seconds, MAX_SLEEP_SECONDS))
+            wait_seconds = (when - datetime.now()).total_seconds()
+    
+    def _get_lead_seconds(self, schedule: Dict[str, Any]) -> float:
+        """Lead time of the prepare macro, fixed or learned"""
+        lead = schedule.get("lead_seconds")
+        if lead is not None:
+            return lead
+        return schedule.get("learned_lead_seconds", self.prepare_lead)
+    
+    def _learn_lead_seconds(self, schedule: Dict[str, Any]):
+        """Learn the lead time from recent successful prepare runs"""
+        durations: List[float] = []
+        for run in reversed(self.history):
+            if (
+                run["schedule_id"] == schedule["id"] and
+                run["kind"] == "prepare" and
+                run["status"] == "success"
+            ):
+                durations.append(run["duration"])
+                if len(durations) >= PREPARE_SAMPLES:
+                    break
+        if durations:
+            schedule["learned_lead_seconds"] = round(
+                max(durations) * PREPARE_LEAD_MARGIN, 1
+            )
     
-    async def _execute_macro(self, schedule: Dict[str, Any]):
-        """Execute a Klipper macro"""
+    def _start_prepare(self, schedule: Dict[str, Any], due: str):
+        """Fire the prepare macro of a run in the background"""
+        self.prepared[schedule["id"]] = due
+        if datetime.now() >= datetime.fromisoformat(due):
+            # Armed too late, nothing left to prepare for
+            return
+        if not self.klippy_ready:
+            logging.info(
+                f"Klippy unavailable, skipping prepare macro of schedule "
+                f"{schedule['id']}"
+            )
+            return
+        task = asyncio.create_task(self._execute_prepare(schedule, due))
+        self.prepare_tasks.add(task)
+        task.add_done_callback(self.prepare_tasks.discard)
+    
+    async def _execute_prepare(self, schedule: Dict[str, Any], due: str):
+        """Run a prepare macro and record when the printer became ready
+
+        The prepare macro takes rate limit tokens and is checked against
+        its circuit breaker like scheduled macros, it is not retried.
+        """
+        breaker = self._get_breaker(schedule["prepare_macro"])
+        if not breaker.allow():
+            logging.warning(
+                f"Skipping prepare macro of schedule {schedule['id']}: "
+                f"circuit breaker open for macro {breaker.macro}"
+            )
+            return
+        run: Optional[Dict[str, Any]] = None
         try:
+            await self._acquire_rate_limit(schedule, prepare_target=due)
+            run = self._start_run(schedule, kind="prepare")
+            run["target"] = due
             klippy_apis = self.server.lookup_component('klippy_apis')
+            template = self._compile_prepare(schedule, strict=False)
+            gcode = template.render({
+                "now": datetime.now(),
+                "schedule": schedule,
+                "printer": self.printer_status
+            })
+            logging.info(f"Executing prepare macro: {gcode}")
+            run["gcode"] = gcode
+            await klippy_apis.run_gcode(gcode)
+        except asyncio.CancelledError:
+            breaker.release()
+            if run is not None:
+                self._finish_run(run, "cancelled")
+            raise
+        except RateLimitExceeded as e:
+            breaker.release()
+            logging.warning(
+                f"Prepare macro of schedule {schedule['id']} dropped: {e}"
+            )
+            return
+        except Exception as e:
+            breaker.record_failure(str(e))
+            if run is not None:
+                self._finish_run(run, "failed", str(e))
+            logging.error(
+                f"Error executing prepare macro {schedule['prepare_macro']}: {e}"
+            )
+            return
+        breaker.record_success()
+        self._finish_run(run, "success")
+        # Negative when ready ahead of the target time
+        run["ready_offset"] = round(
+            (datetime.now() - datetime.fromisoformat(due)).total_seconds(), 3
+        )
+    
+    def _record_fire(self, schedule: Dict[str, Any], error: Optional[str]):
+        """Store the outcome of a fire, runs on the writer task
+
+        error is None after a successful execution.
+        """
+        if self.schedules.get(schedule["id"]) is not schedule:
+            # Deleted or replaced while firing
+            return
+        schedule["last_error"] = error
+        if error is None:
+            schedule["run_count"] = schedule.get("run_count", 0) + 1
+        self.changed_ids.add(schedule["id"])
+    
+    def _advance_schedule(
+        self,
+        schedule: Dict[str, Any],
+        fired: bool,
+        error: Optional[str] = None
+    ) -> bool:
+        """Record a fire and update the next run, runs on the writer task
+
+        Returns False if the schedule loop should stop.
+        """
+        if fired:
+            self._record_fire(schedule, error)
+        if (
+            self.schedules.get(schedule["id"]) is not schedule or
+            not schedule.get("enabled", True)
+        ):
+            # Deleted or disabled while firing
+            return False
+        self.prepared.pop(schedule["id"], None)
+        # Run count, last error and the next run are pushed to clients
+        self.changed_ids.add(schedule["id"])
+        if schedule.get("prepare_macro") and "lead_seconds" not in schedule:
+            self._learn_lead_seconds(schedule)
+        # Calculate next run based on schedule type, one-shot schedules
+        # have no next run
+        next_run_str = self._calculate_next_run(schedule)
+        if next_run_str is None:
+            if self._timing_type(schedule) != "once":
+                # Every further run is excluded, resumed when the
+                # exclusion windows change
+                self._set_next_run(schedule, None)
+            elif fired:
+                # A deferred one-shot stays enabled until the pending
+                # queue has run it
+                schedule["enabled"] = False
+            return False
+        self._set_next_run(schedule, next_run_str)
+        return True
+    
+    async def _fire_schedule(
+        self, schedule: Dict[str, Any], due: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Execute a due schedule with retries and circuit breakers
+
+        Every macro of a sequence is checked against its own breaker. A
+        retry resumes at the segment that failed, completed segments are
+        not run again. Returns whether the schedule fired and the error,
+        None after a success. The caller records the outcome through the
+        writer queue. A fire deferred to the pending queue because Klippy
+        is unavailable returns (False, None).
+        """
+        schedule_id = schedule["id"]
+        segments = self.scripts.get(schedule_id)
+        if segments is None:
+            segments = self._compile_script(schedule)
+            await self._mutate(
+                lambda: self._cache_script(schedule, segments)
+            )
+        segment_macros = self._get_segment_macros(schedule, segments)
+        # First segment not run yet, advanced by _execute_macro
+        progress = {"segment": 0}
+        attempt = 0
+        while True:
+            if not self.klippy_ready:
+                self._queue_pending(schedule, due)
+                return False, None
+            start = progress["segment"]
+            breakers: Dict[str, CircuitBreaker] = {}
+            for macros in segment_macros[start:]:
+                for macro in macros:
+                    breaker = self._get_breaker(macro)
+                    breakers.setdefault(breaker.macro, breaker)
+            allowed: List[CircuitBreaker] = []
+            for breaker in breakers.values():
+                if not breaker.allow():
+                    for other in allowed:
+                        other.release()
+                    logging.warning(
+                        f"Skipping schedule {schedule_id}: circuit breaker "
+                        f"open for macro {breaker.macro}"
+                    )
+                    return True, "Circuit breaker open"
+                allowed.append(breaker)
+            try:
+                await self._execute_macro(schedule, segments, progress)
+            except asyncio.CancelledError:
+                for breaker in allowed:
+                    breaker.release()
+                raise
+            except RateLimitExceeded as e:
+                # Not a failure of the macro, no retry
+                for breaker in allowed:
+                    breaker.release()
+                return True, str(e)
+            except Exception as e:
+                if not self.klippy_ready and not isinstance(e, BudgetExceeded):
+                    # Klippy went away during the request, this is not a
+                    # failure of the macro itself
+                    for breaker in allowed:
+                        breaker.release()
+                    self._queue_pending(schedule, due)
+                    return False, None
+                failed = self._record_segment_outcome(
+                    allowed, segment_macros, start, progress["segment"],
+                    str(e)
+                )
+                attempt += 1
+                max_retries = schedule.get("max_retries", self.max_retries)
+                if (
+                    # The timed out command may still run in Klippy
+                    not isinstance(e, BudgetExceeded) and
+                    attempt <= max_retries and
+                    all(breaker.state != "open" for breaker in failed)
+                ):
+                    delay = self._get_retry_delay(schedule, attempt)
+                    logging.info(
+                        f"Retrying schedule {schedule_id} in "
+                        f"{delay:.1f}s (attempt {attempt}/{max_retries})"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                logging.error(
+                    f"Schedule {schedule_id} failed after "
+                    f"{attempt} attempt(s), waiting for next run"
+                )
+                return True, str(e)
+            for breaker in allowed:
+                breaker.record_success()
+            return True, None
+    
+    def _cache_script(
+        self,
+        schedule: Dict[str, Any],
+        segments: List[Tuple[float, ParamTemplate]]
+    ):
+        """Keep a script compiled at fire time, runs on the writer task"""
+        if self.schedules.get(schedule["id"]) is schedule:
+            self.scripts.setdefault(schedule["id"], segments)
+    
+    @staticmethod
+    def _get_segment_macros(
+        schedule: Dict[str, Any], segments: List[Tuple[float, ParamTemplate]]
+    ) -> List[List[str]]:
+        """Macros submitted by each segment of a compiled script"""
+        if schedule.get("schedule_type") != "sequence":
+            return [[schedule["macro"]]]
+        return [
+            list(dict.fromkeys(
+                line.split(None, 1)[0]
+                for line in template.text.splitlines() if line.strip()
+            ))
+            for _, template in segments
+        ]
+    
+    def _record_segment_outcome(
+        self,
+        breakers: List[CircuitBreaker],
+        segment_macros: List[List[str]],
+        start: int,
+        failed_segment: int,
+        error: str
+    ) -> List[CircuitBreaker]:
+        """Update the breakers of an attempt that failed at failed_segment
+
+        Macros of the failed segment count a failure, macros of segments
+        completed in this attempt a success, the others ran nothing.
+        Returns the breakers that recorded the failure.
+        """
+        failed_macros = {
+            macro.upper() for macro in segment_macros[failed_segment]
+        }
+        completed = {
+            macro.upper()
+            for macros in segment_macros[start:failed_segment]
+            for macro in macros
+        }
+        failed: List[CircuitBreaker] = []
+        for breaker in breakers:
+            if breaker.macro in failed_macros:
+                breaker.record_failure(error)
+                failed.append(breaker)
+            elif breaker.macro in completed:
+                breaker.record_success()
+            else:
+                breaker.release()
+        return failed
+    
+    def _queue_pending(self, schedule: Dict[str, Any], due: str):
+        """Hold a due fire until Klippy is ready again"""
+        if len(self.pending) == self.pending.maxlen:
+            dropped = self.pending[0]
+            logging.warning(
+                f"Pending queue full, dropping fire of schedule "
+                f"{dropped['id']} due at {dropped['due']}"
+            )
+        self.pending.append({
+            "id": schedule["id"],
+            "name": schedule["name"],
+            "due": due,
+            "queued_at": datetime.now().isoformat()
+        })
+        logging.info(
+            f"Klippy unavailable, holding schedule {schedule['id']} "
+            f"due at {due}"
+        )
+    
+    async def _drain_pending(self):
+        """Run fires held while Klippy was unavailable
+
+        The misfire policy of each schedule decides what is run:
+        run_once -> fires of the same schedule are coalesced into one run
+        run_all  -> every held fire is run in order
+        skip     -> held fires are dropped
+        Fires older than the misfire grace time are always dropped.
+        """
+        while self.pending and self.klippy_ready:
+            entries = list(self.pending)
+            self.pending.clear()
+            now = datetime.now()
+            
+            fires: List[Dict[str, Any]] = []
+            coalesced: Dict[int, Dict[str, Any]] = {}
+            for entry in entries:
+                schedule = self.schedules.get(entry["id"])
+                if not schedule or not schedule.get("enabled", True):
+                    continue
+                policy = schedule.get("misfire_policy", "run_once")
+                grace = schedule.get("misfire_grace_seconds", self.misfire_grace)
+                age = (now - datetime.fromisoformat(entry["due"])).total_seconds()
+                if policy == "skip" or age > grace:
+                    logging.info(
+                        f"Dropping missed fire of schedule {entry['id']} "
+                        f"due at {entry['due']} (policy {policy})"
+                    )
+                    continue
+                if policy == "run_once":
+                    if entry["id"] in coalesced:
+                        # Keep the position of the first fire, the most
+                        # recent due time wins
+                        coalesced[entry["id"]]["due"] = entry["due"]
+                        continue
+                    coalesced[entry["id"]] = entry
+                fires.append(entry)
             
-            macro_name = schedule["macro"]
-            params = schedule.get("params", {})
+            for idx, entry in enumerate(fires):
+                schedule = self.schedules.get(entry["id"])
+                if not schedule or not schedule.get("enabled", True):
+                    continue
+                logging.info(
+                    f"Running missed fire of schedule {entry['id']} "
+                    f"due at {entry['due']}"
+                )
+                fired, error = await self._fire_schedule(schedule, entry["due"])
+                if not fired:
+                    # Klippy went away again, keep the remaining fires
+                    self.pending.extend(fires[idx + 1:])
+                    break
+                await self._mutate(
+                    functools.partial(self._finish_missed_fire, schedule, error)
+                )
+    
+    def _finish_missed_fire(
+        self, schedule: Dict[str, Any], error: Optional[str]
+    ):
+        """Record a fire run from the pending queue, runs on the writer task"""
+        if self._timing_type(schedule) == "once":
+            # One-shot schedules are done once their fire has run
+            self._advance_schedule(schedule, True, error)
+        else:
+            self._record_fire(schedule, error)
+    
+    def _validate_steps(self, steps: Any) -> List[Dict[str, Any]]:
+        """Validate and normalize the steps of a sequence schedule"""
+        if not isinstance(steps, list) or not steps:
+            raise self.server.error(
+                "A sequence requires a non-empty 'steps' list", 400
+            )
+        result: List[Dict[str, Any]] = []
+        for idx, step in enumerate(steps):
+            if not isinstance(step, dict):
+                raise self.server.error(f"Step {idx} must be an object", 400)
+            macro = step.get("macro")
+            if not isinstance(macro, str) or len(macro.split()) != 1:
+                raise self.server.error(
+                    f"Step {idx} requires a single macro name", 400
+                )
+            params = step.get("params", {})
+            if not isinstance(params, dict):
+                raise self.server.error(
+                    f"Step {idx} params must be an object", 400
+                )
+            for key, value in params.items():
+                if "\n" in f"{key}{value}":
+                    raise self.server.error(
+                        f"Step {idx} params cannot contain newlines", 400
+                    )
+            try:
+                delay = float(step.get("delay_seconds", 0))
+            except (TypeError, ValueError):
+                delay = -1.
+            if delay < 0:
+                raise self.server.error(
+                    f"Step {idx} delay_seconds must be a non-negative number",
+                    400
+                )
+            result.append({
+                "macro": macro.strip(),
+                "params": params,
+                "delay_seconds": delay
+            })
+        return result
+    
+    @staticmethod
+    def _build_gcode(macro: str, params: Dict[str, Any]) -> str:
+        param_str = " ".join([f"{k}={v}" for k, v in params.items()])
+        return f"{macro} {param_str}".strip()
+    
+    def _compile_script(
+        self,
+        schedule: Dict[str, Any],
+        strict: bool = True,
+        register: bool = True
+    ) -> List[Tuple[float, ParamTemplate]]:
+        """Compile a schedule into (delay_seconds, script) segments
+
+        Consecutive sequence steps without a delay are joined into one
+        multi-line script so they are submitted with a single run_gcode
+        call. A step delay starts a new segment, the scheduler sleeps
+        between segments. Parameter templates are compiled here, with
+        strict set an invalid template raises a ValueError, otherwise the
+        text is used literally. With register the printer objects the
+        templates reference are subscribed.
+        """
+        if schedule.get("schedule_type") != "sequence":
+            gcode = self._build_gcode(
+                schedule["macro"], schedule.get("params", {})
+            )
+            raw_segments = [(0., gcode)]
+        else:
+            raw_segments = []
+            delay = 0.
+            lines: List[str] = []
+            for step in schedule.get("steps", []):
+                step_delay = step.get("delay_seconds", 0)
+                if step_delay > 0 and lines:
+                    raw_segments.append((delay, "\n".join(lines)))
+                    lines = []
+                    delay = 0.
+                delay += step_delay
+                lines.append(
+                    self._build_gcode(step["macro"], step.get("params", {}))
+                )
+            if lines:
+                raw_segments.append((delay, "\n".join(lines)))
+        
+        segments: List[Tuple[float, ParamTemplate]] = []
+        for delay, gcode in raw_segments:
+            try:
+                template = ParamTemplate(gcode)
+            except ValueError as e:
+                if strict:
+                    raise
+                logging.warning(
+                    f"Schedule {schedule.get('id')}: {e}, using parameters "
+                    f"without template substitution"
+                )
+                template = ParamTemplate(gcode, literal=True)
+            segments.append((delay, template))
+            if register:
+                self._register_template(template)
+        return segments
+    
+    def _compile_scripts(
+        self,
+        cancelled: threading.Event,
+        items: List[Tuple[int, Dict[str, Any]]]
+    ) -> Dict[int, List[Tuple[float, ParamTemplate]]]:
+        """Compile the scripts of loaded schedules, see _compile_script"""
+        scripts: Dict[int, List[Tuple[float, ParamTemplate]]] = {}
+        for sid, schedule in items:
+            if cancelled.is_set():
+                break
+            scripts[sid] = self._compile_script(schedule, strict=False)
+        return scripts
+    
+    def _compile_prepare(
+        self,
+        schedule: Dict[str, Any],
+        strict: bool = True,
+        register: bool = True
+    ) -> Optional[ParamTemplate]:
+        """Compile the prepare macro of a schedule, see _compile_script"""
+        if not schedule.get("prepare_macro"):
+            return None
+        gcode = self._build_gcode(
+            schedule["prepare_macro"], schedule.get("prepare_params", {})
+        )
+        try:
+            template = ParamTemplate(gcode)
+        except ValueError:
+            if strict:
+                raise
+            template = ParamTemplate(gcode, literal=True)
+        if register:
+            self._register_template(template)
+        return template
+    
+    def _register_script(
+        self,
+        schedule: Dict[str, Any],
+        script: List[Tuple[float, ParamTemplate]]
+    ):
+        """Subscribe to the printer objects of a schedule being saved"""
+        for _, template in script:
+            self._register_template(template)
+        self._compile_prepare(schedule, strict=False)
+    
+    def _register_template(self, template: ParamTemplate):
+        """Subscribe to the printer objects a template references"""
+        if threading.current_thread().name.startswith(OFFLOAD_THREAD_NAME):
+            # Compiled on the worker pool, subscriptions are made on the loop
+            self.offload_loop.call_soon_threadsafe(
+                self._register_template, template
+            )
+            return
+        new_objects = template.objects - self.template_objects
+        if new_objects:
+            self.template_objects |= new_objects
+            if self.klippy_ready:
+                asyncio.create_task(self._subscribe_template_objects())
+    
+    def _start_run(
+        self, schedule: Dict[str, Any], kind: str = "macro"
+    ) -> Dict[str, Any]:
+        """Create the history entry of an execution and open its window"""
+        run = {
+            "run_id": self.next_run_id,
+            "schedule_id": schedule["id"],
+            "schedule": schedule["name"],
+            "kind": kind,
+            "gcode": "",
+            "started": datetime.now().isoformat(),
+            "finished": None,
+            "duration": None,
+            "status": "running",
+            "error": None,
+            "output": deque(maxlen=self.output_max_lines),
+            "output_dropped": 0,
+            "_start": time.monotonic()
+        }
+        self.next_run_id += 1
+        self.history.append(run)
+        self.active_runs[run["run_id"]] = run
+        return run
+    
+    def _finish_run(
+        self, run: Dict[str, Any], status: str, error: Optional[str] = None
+    ):
+        """Close the output window of an execution"""
+        self.active_runs.pop(run["run_id"], None)
+        if self.marker_run == run["run_id"]:
+            self.marker_run = None
+        run["finished"] = datetime.now().isoformat()
+        run["duration"] = round(time.monotonic() - run.pop("_start"), 3)
+        run["status"] = status
+        run["error"] = error
+    
+    def _handle_gcode_response(self, response: str):
+        """Attribute console output to the scheduled runs in progress
+
+        With capture markers enabled only lines between the begin and end
+        markers of a run are captured. Without markers every line received
+        while a run is in progress is captured, overlapping runs may see
+        each other's output.
+        """
+        if not self.active_runs:
+            return
+        for line in response.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(OUTPUT_MARKER):
+                kind, _, run_id = line[len(OUTPUT_MARKER):].strip().partition("_")
+                if kind == "begin" and run_id.isdigit():
+                    self.marker_run = int(run_id)
+                elif kind == "end":
+                    self.marker_run = None
+                continue
+            if TEMPERATURE_REPORT.match(line):
+                continue
+            if self.capture_markers:
+                run = self.active_runs.get(self.marker_run)
+                runs = [run] if run is not None else []
+            else:
+                runs = list(self.active_runs.values())
+            if len(line) > OUTPUT_MAX_LINE_LENGTH:
+                line = line[:OUTPUT_MAX_LINE_LENGTH] + "..."
+            for run in runs:
+                output = run["output"]
+                if len(output) == output.maxlen:
+                    run["output_dropped"] += 1
+                output.append(line)
+    
+    async def _acquire_rate_limit(
+        self, schedule: Dict[str, Any], prepare_target: Optional[str] = None
+    ):
+        """Take a token from the global bucket and those of the macros
+
+        Waits until every bucket has a token, raises RateLimitExceeded if
+        the limit is reached in drop mode or the wait would exceed
+        rate_limit_max_wait_seconds. With prepare_target the prepare macro
+        of the run due at that time is limited instead.
+        """
+        if prepare_target is not None:
+            macros = {schedule["prepare_macro"].upper()}
+        elif schedule.get("schedule_type") == "sequence":
+            macros = {step["macro"].upper() for step in schedule.get("steps", [])}
+        else:
+            macros = {schedule["macro"].upper()}
+        buckets = [self.macro_buckets[m] for m in macros if m in self.macro_buckets]
+        if self.global_bucket is not None:
+            buckets.append(self.global_bucket)
+        if not buckets:
+            return
+        waits = [bucket.wait_time() for bucket in buckets]
+        wait = max(waits)
+        if wait > 0 and (
+            self.rate_limit_mode == "drop" or wait > self.rate_limit_max_wait
+        ):
+            for bucket, bucket_wait in zip(buckets, waits):
+                if bucket_wait > 0:
+                    bucket.dropped += 1
+            if prepare_target is not None:
+                run = self._start_run(schedule, kind="prepare")
+                run["target"] = prepare_target
+            else:
+                run = self._start_run(schedule)
+            self._finish_run(run, "dropped", "Rate limit exceeded")
+            raise RateLimitExceeded(
+                f"Rate limit exceeded, execution dropped (wait {wait:.1f}s)"
+            )
+        for bucket, bucket_wait in zip(buckets, waits):
+            bucket.reserve(bucket_wait)
+        if wait > 0:
+            logging.info(
+                f"Rate limit reached, delaying schedule {schedule['id']} "
+                f"by {wait:.1f}s"
+            )
+            await asyncio.sleep(wait)
+    
+    async def _execute_macro(
+        self,
+        schedule: Dict[str, Any],
+        segments: List[Tuple[float, ParamTemplate]],
+        progress: Dict[str, int]
+    ):
+        """Execute the segments of a schedule from progress["segment"] on
+
+        progress["segment"] is advanced as segments complete. Errors from
+        Klippy are logged and re-raised so the schedule loop can retry and
+        update the circuit breakers.
+        """
+        run: Optional[Dict[str, Any]] = None
+        try:
+            klippy_apis = self.server.lookup_component('klippy_apis')
             
-            param_str = " ".join([f"{k}={v}" for k, v in params.items()])
-            gcode = f"{macro_name} {param_str}".strip()
+            await self._acquire_rate_limit(schedule)
             
-            logging.info(f"Executing scheduled macro: {gcode}")
+            # Optional wall-clock budget covering all segments and delays
+            budget = schedule.get("budget_seconds")
+            deadline = time.monotonic() + budget if budget else None
             
-            await klippy_apis.run_gcode(gcode)
+            run = self._start_run(schedule)
+            executed: List[str] = []
+            start = progress["segment"]
+            for index in range(start, len(segments)):
+                delay, template = segments[index]
+                # The retry backoff already separates a resumed segment
+                # from the one before it
+                if delay > 0 and (index > start or start == 0):
+                    await asyncio.sleep(delay)
+                
+                gcode = template.render({
+                    "now": datetime.now(),
+                    "schedule": schedule,
+                    "printer": self.printer_status
+                })
+                logging.info(f"Executing scheduled macro: {gcode}")
+                executed.append(gcode)
+                run["gcode"] = "\n".join(executed)
+                if self.capture_markers:
+                    rid = run["run_id"]
+                    gcode = (
+                        f"RESPOND PREFIX={OUTPUT_MARKER} MSG=begin_{rid}\n"
+                        f"{gcode}\n"
+                        f"RESPOND PREFIX={OUTPUT_MARKER} MSG=end_{rid}"
+                    )
+                
+                if deadline is None:
+                    await klippy_apis.run_gcode(gcode)
+                else:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        await asyncio.wait_for(
+                            klippy_apis.run_gcode(gcode), remaining
+                        )
+                    except asyncio.TimeoutError:
+                        raise BudgetExceeded(
+                            f"Wall-clock budget of {budget}s exceeded"
+                        )
+                progress["segment"] = index + 1
             
+            self._finish_run(run, "success")
             self.server.send_event(
                 "macro_scheduler:executed",
                 {
                     "schedule": schedule["name"],
-                    "macro": gcode,
-                    "time": datetime.now().isoformat()
+                    "macro": "\n".join(executed),
+                    "time": datetime.now().isoformat(),
+                    "run_id": run["run_id"]
                 }
             )
             
+        except asyncio.CancelledError:
+            if run is not None:
+                self._finish_run(run, "cancelled")
+            raise
+        except RateLimitExceeded as e:
+            logging.warning(f"Schedule {schedule['id']}: {e}")
+            raise
         except Exception as e:
+            if run is not None:
+                self._finish_run(run, "failed", str(e))
             logging.error(f"Error executing macro {schedule['macro']}: {e}")
+            raise
 
 def load_component(config):
     return MacroScheduler(config)
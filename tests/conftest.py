@@ -0,0 +1,189 @@
+import asyncio
+import copy
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+# The component is a single module at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import macro_scheduler  # noqa: E402
+
+_MISSING = object()
+
+
+class ServerError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class WebRequest:
+    def __init__(self, args: Optional[Dict[str, Any]] = None):
+        self.args = args or {}
+
+    def get(self, key, default=_MISSING):
+        if key in self.args:
+            return self.args[key]
+        if default is _MISSING:
+            raise ServerError(f"No data for argument: {key}")
+        return default
+
+    def get_str(self, key, default=_MISSING):
+        value = self.get(key, default)
+        return value if value is None else str(value)
+
+    def get_int(self, key, default=_MISSING):
+        value = self.get(key, default)
+        return value if value is None else int(value)
+
+    def get_float(self, key, default=_MISSING):
+        value = self.get(key, default)
+        return value if value is None else float(value)
+
+    def get_boolean(self, key, default=_MISSING):
+        value = self.get(key, default)
+        if isinstance(value, str):
+            return value.lower() == "true"
+        return value
+
+    def get_args(self):
+        return self.args
+
+
+class Database:
+    def __init__(self):
+        self.data: Dict[Any, Any] = {}
+        self.writes = 0
+
+    async def get_item(self, namespace, key, default=_MISSING):
+        return copy.deepcopy(self.data.get((namespace, key), default))
+
+    async def insert_item(self, namespace, key, value):
+        self.writes += 1
+        self.data[(namespace, key)] = copy.deepcopy(value)
+
+
+class KlippyApis:
+    def __init__(self):
+        self.scripts: List[str] = []
+        # Scripts containing one of these macros raise once per entry
+        self.fail_once: List[str] = []
+        self.delay = 0.
+
+    async def run_gcode(self, script, default=_MISSING):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.scripts.append(script)
+        for macro in self.fail_once:
+            if macro in script:
+                self.fail_once.remove(macro)
+                raise ServerError(f"{macro} failed")
+        return "ok"
+
+    async def subscribe_objects(self, objects, callback=None, default=None):
+        return {}
+
+    async def query_objects(self, objects, default=None):
+        return {}
+
+    async def _send_klippy_request(self, method, params, default=None):
+        return {
+            "G28": "Home", "BED_MESH_CALIBRATE": "Perform Mesh Bed Leveling",
+            "SAVE_CONFIG": "Overwrite config file and restart",
+            "HEAT_SOAK": "Soak the chamber"
+        }
+
+    async def get_object_list(self, default=None):
+        return [
+            "gcode_move", "extruder", "gcode_macro HEAT_SOAK",
+            "gcode_macro _PARK_HEAD", "gcode_macro preheat"
+        ]
+
+
+class Server:
+    error = ServerError
+
+    def __init__(self):
+        self.endpoints: Dict[str, Any] = {}
+        self.events: Dict[str, List[Any]] = {}
+        self.components: Dict[str, Any] = {
+            "database": Database(), "klippy_apis": KlippyApis()
+        }
+
+    def register_endpoint(self, path, methods, callback, **kwargs):
+        self.endpoints[path] = callback
+
+    def register_event_handler(self, event, callback):
+        self.events.setdefault(event, []).append(callback)
+
+    def register_notification(self, event, notify_name=None):
+        pass
+
+    def send_event(self, event, *args):
+        for callback in self.events.get(event, []):
+            result = callback(*args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+
+    def lookup_component(self, name, default=_MISSING):
+        if name in self.components:
+            return self.components[name]
+        if default is _MISSING:
+            raise ServerError(f"Component {name} not found")
+        return default
+
+    def get_event_loop(self):
+        return asyncio.get_event_loop()
+
+
+class Config:
+    error = ServerError
+
+    def __init__(self, server: Server, options: Dict[str, Any]):
+        self.server = server
+        self.options = options
+
+    def get_server(self):
+        return self.server
+
+    def get_name(self):
+        return "macro_scheduler"
+
+    def get(self, option, default=_MISSING, **kwargs):
+        return self.options.get(option, default)
+
+    def getint(self, option, default=_MISSING, **kwargs):
+        return int(self.options.get(option, default))
+
+    def getfloat(self, option, default=_MISSING, **kwargs):
+        return float(self.options.get(option, default))
+
+    def getboolean(self, option, default=_MISSING, **kwargs):
+        return bool(self.options.get(option, default))
+
+    def getdict(self, option, default=_MISSING, **kwargs):
+        return dict(self.options.get(option, default))
+
+
+@pytest.fixture
+def make_scheduler():
+    """Create a scheduler on a fake Moonraker, call inside a running loop"""
+    created: List[macro_scheduler.MacroScheduler] = []
+
+    async def factory(**options):
+        options.setdefault("schedule_file", "")
+        options.setdefault("loop_probe_interval", 0.)
+        server = Server()
+        scheduler = macro_scheduler.load_component(Config(server, options))
+        await scheduler._handle_ready()
+        created.append(scheduler)
+        return server, scheduler
+
+    yield factory
+    for scheduler in created:
+        for task in scheduler.tasks.values():
+            task.cancel()
+        scheduler.executor.shutdown(wait=False)
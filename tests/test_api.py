@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from conftest import ServerError, WebRequest
+
+
+def test_group_requires_a_tag(make_scheduler):
+    async def run():
+        server, _ = await make_scheduler()
+        group = server.endpoints["/server/macro_scheduler/group"]
+        for args in ({"action": "disable"}, {"action": "disable", "tags": []}):
+            with pytest.raises(ServerError, match="At least one tag is required"):
+                await group(WebRequest(args))
+    asyncio.run(run())
+
+
+def test_file_fields_are_not_returned(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        result = await server.endpoints["/server/macro_scheduler/add"](
+            WebRequest({
+                "name": "Nightly", "macro": "G28",
+                "schedule_type": "daily", "time": "02:00"
+            })
+        )
+        schedule_id = result["schedule"]["id"]
+
+        def apply():
+            schedule = scheduler.schedules[schedule_id]
+            schedule["file_section"] = "nightly"
+            schedule["file_digest"] = "0" * 40
+            scheduler.changed_ids.add(schedule_id)
+        await scheduler._mutate(apply)
+        listed = await server.endpoints["/server/macro_scheduler/schedules"](
+            WebRequest()
+        )
+        changes = await server.endpoints["/server/macro_scheduler/changes"](
+            WebRequest({"since": 0})
+        )
+        for schedule in listed["schedules"] + changes["schedules"]:
+            assert "file_section" not in schedule
+            assert "file_digest" not in schedule
+            assert schedule["source"] == "file"
+    asyncio.run(run())
+
+
+def test_list_pages_sorted_and_filtered_schedules(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        add = server.endpoints["/server/macro_scheduler/add"]
+        for idx, (name, schedule_type) in enumerate([
+            ("delta", "daily"), ("Alpha", "interval"), ("charlie", "daily"),
+            ("bravo", "daily"), ("echo", "interval")
+        ]):
+            args = {"name": name, "macro": "G28", "schedule_type": schedule_type}
+            if schedule_type == "daily":
+                args["time"] = f"0{idx}:00"
+                args["tags"] = ["nightly"]
+            else:
+                args["interval_minutes"] = 60 * (idx + 1)
+            await add(WebRequest(args))
+        scheduler.schedules[3]["enabled"] = False
+        for sid, next_run in ((1, "2030-01-01T03:00:00"), (3, None),
+                              (4, "2030-01-01T01:00:00")):
+            scheduler.schedules[sid]["next_run"] = next_run
+        schedules = server.endpoints["/server/macro_scheduler/schedules"]
+
+        def names(result):
+            return [s["name"] for s in result["schedules"]]
+
+        result = await schedules(WebRequest())
+        assert [s["id"] for s in result["schedules"]] == [1, 2, 3, 4, 5]
+        assert result["total"] == 5 and result["offset"] == 0
+        result = await schedules(WebRequest({
+            "sort": "name", "offset": 1, "limit": 2
+        }))
+        assert names(result) == ["bravo", "charlie"]
+        assert result["total"] == 5 and result["offset"] == 1
+        result = await schedules(WebRequest({
+            "sort": "name", "descending": True, "offset": 4, "limit": 2
+        }))
+        assert names(result) == ["Alpha"]
+        result = await schedules(WebRequest({
+            "schedule_type": "daily", "enabled": True, "limit": 1
+        }))
+        assert names(result) == ["delta"] and result["total"] == 2
+        result = await schedules(WebRequest({"tag": "nightly", "sort": "next_run"}))
+        # Schedules without a next run sort last
+        assert names(result) == ["bravo", "delta", "charlie"]
+        assert result["total"] == 3
+        result = await schedules(WebRequest({"offset": 10}))
+        assert result["schedules"] == [] and result["total"] == 5
+        with pytest.raises(ServerError, match="Invalid sort"):
+            await schedules(WebRequest({"sort": "macro"}))
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+from conftest import WebRequest
+
+import macro_scheduler
+
+ADD = "/server/macro_scheduler/add"
+DELETE = "/server/macro_scheduler/delete"
+TOGGLE = "/server/macro_scheduler/toggle"
+CHANGES = "/server/macro_scheduler/changes"
+
+
+def nightly(name="Nightly"):
+    return {
+        "name": name, "macro": "G28",
+        "schedule_type": "daily", "time": "02:00"
+    }
+
+
+async def watch(server):
+    payloads = []
+    server.register_event_handler(
+        "macro_scheduler:schedules_changed", payloads.append
+    )
+    return payloads
+
+
+def test_changes_are_pushed_with_the_revision(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        payloads = await watch(server)
+        result = await server.endpoints[ADD](WebRequest(nightly()))
+        sid = result["schedule"]["id"]
+        await server.endpoints[TOGGLE](WebRequest({"id": sid}))
+        await server.endpoints[DELETE](WebRequest({"id": sid}))
+        assert [p["revision"] for p in payloads] == [
+            scheduler.revision - 2, scheduler.revision - 1, scheduler.revision
+        ]
+        added, toggled, deleted = payloads
+        assert added["epoch"] == scheduler.epoch
+        assert added["schedules"] == [result["schedule"]]
+        assert (added["removed"], added["reload"]) == ([], False)
+        assert toggled["schedules"][0]["enabled"] is False
+        assert (deleted["schedules"], deleted["removed"]) == ([], [sid])
+        assert not any("file_section" in s for p in payloads for s in p["schedules"])
+    asyncio.run(run())
+
+
+def test_large_batches_ask_clients_to_reload(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        since = scheduler.revision
+        payloads = await watch(server)
+        count = macro_scheduler.NOTIFY_MAX_SCHEDULES + 1
+        data = "\n".join(json.dumps(nightly(f"S{idx}")) for idx in range(count))
+        await server.endpoints["/server/macro_scheduler/import"](
+            WebRequest({"data": data})
+        )
+        assert len(payloads) == 1
+        assert payloads[0]["reload"] is True
+        assert payloads[0]["schedules"] == payloads[0]["removed"] == []
+        result = await server.endpoints[CHANGES](WebRequest({"since": since}))
+        assert result["reload"] is True
+    asyncio.run(run())
+
+
+def test_changes_endpoint_returns_what_a_client_missed(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        first = await server.endpoints[ADD](WebRequest(nightly("First")))
+        since = scheduler.revision
+        second = await server.endpoints[ADD](WebRequest(nightly("Second")))
+        await server.endpoints[DELETE](WebRequest({"id": first["schedule"]["id"]}))
+        result = await server.endpoints[CHANGES](WebRequest({"since": since}))
+        assert result["revision"] == scheduler.revision
+        assert result["schedules"] == [second["schedule"]]
+        assert result["removed"] == [first["schedule"]["id"]]
+        assert result["reload"] is False
+        result = await server.endpoints[CHANGES](
+            WebRequest({"since": scheduler.revision})
+        )
+        assert (result["schedules"], result["removed"]) == ([], [])
+        # A client of a previous Moonraker run reloads
+        result = await server.endpoints[CHANGES](
+            WebRequest({"since": since, "epoch": "0"})
+        )
+        assert result["reload"] is True
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+from macro_scheduler import CircuitBreaker
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("HEAT_SOAK", threshold=2, reset_seconds=60.)
+    breaker.record_failure("Klippy error")
+    breaker.record_failure("Klippy error")
+    assert breaker.state == "open"
+    # Pretend the reset time has elapsed
+    breaker.opened_at -= 60.
+    return breaker
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker("HEAT_SOAK", threshold=2, reset_seconds=60.)
+    breaker.record_failure("Klippy error")
+    assert breaker.allow()
+    breaker.record_failure("Klippy error")
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_allows_single_trial():
+    breaker = open_breaker()
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    assert breaker.allow() is False
+    assert breaker.get_status()["trial_running"]
+
+
+def test_trial_success_closes():
+    breaker = open_breaker()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_trial_failure_opens_again():
+    breaker = open_breaker()
+    assert breaker.allow()
+    breaker.record_failure("Klippy error")
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_released_trial_can_be_retried():
+    breaker = open_breaker()
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.allow() is True
+    assert breaker.allow() is False
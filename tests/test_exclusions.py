@@ -0,0 +1,110 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from conftest import WebRequest
+
+import macro_scheduler
+
+ADD = "/server/macro_scheduler/add"
+ADD_EXCLUSION = "/server/macro_scheduler/exclusions/add"
+DELETE_EXCLUSION = "/server/macro_scheduler/exclusions/delete"
+QUIET_HOURS = {"type": "window", "start": "22:00", "end": "07:00"}
+
+
+async def add_nightly(server, scheduler, name="Nightly"):
+    result = await server.endpoints[ADD](WebRequest({
+        "name": name, "macro": "G28",
+        "schedule_type": "daily", "time": "02:00"
+    }))
+    return scheduler.schedules[result["schedule"]["id"]]
+
+
+def test_fully_excluded_schedule_is_suspended_and_resumed(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        schedule = await add_nightly(server, scheduler)
+        next_run = schedule["next_run"]
+        result = await server.endpoints[ADD_EXCLUSION](WebRequest(QUIET_HOURS))
+        assert result["rescheduled"] == [schedule["id"]]
+        assert schedule["next_run"] is None
+        assert schedule["suspended"]
+        assert schedule["enabled"]
+        assert schedule["id"] not in scheduler.tasks
+        result = await server.endpoints[DELETE_EXCLUSION](
+            WebRequest({"id": result["exclusion"]["id"]})
+        )
+        assert result["rescheduled"] == [schedule["id"]]
+        assert schedule["next_run"] == next_run
+        assert "suspended" not in schedule
+        assert schedule["id"] in scheduler.tasks
+    asyncio.run(run())
+
+
+def test_recurring_schedule_is_not_disabled_after_fire(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        schedule = await add_nightly(server, scheduler)
+        # Window added without rescheduling, as if it raced the fire
+        scheduler.exclusions = {1: {**QUIET_HOURS, "id": 1}}
+        advanced = await scheduler._mutate(
+            lambda: scheduler._advance_schedule(schedule, True)
+        )
+        assert not advanced
+        assert schedule["enabled"]
+        assert schedule["suspended"]
+        assert schedule["next_run"] is None
+    asyncio.run(run())
+
+
+def test_large_reschedule_is_planned_on_the_worker_pool(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        count = macro_scheduler.OFFLOAD_MIN_SCHEDULES + 10
+        await asyncio.gather(*(
+            add_nightly(server, scheduler, f"Nightly {idx}")
+            for idx in range(count)
+        ))
+        jobs = scheduler.offload_stats["jobs"]
+        today = date.today()
+        result = await server.endpoints[ADD_EXCLUSION](WebRequest({
+            "type": "dates",
+            "dates": [str(today), str(today + timedelta(days=1))]
+        }))
+        assert scheduler.offload_stats["jobs"] == jobs + 1
+        assert len(result["rescheduled"]) == count
+        expected = f"{today + timedelta(days=2)}T02:00:00"
+        assert all(
+            s["next_run"] == expected for s in scheduler.schedules.values()
+        )
+    asyncio.run(run())
+
+
+def test_exclusion_change_lets_a_running_fire_finish(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        kapis = server.lookup_component("klippy_apis")
+        kapis.delay = 0.2
+        schedule = await add_nightly(server, scheduler)
+
+        def make_due():
+            schedule["next_run"] = datetime.now().isoformat()
+            scheduler.rearm_ids.add(schedule["id"])
+
+        await scheduler._mutate(make_due)
+        await asyncio.sleep(0.05)
+        assert schedule["id"] in scheduler.firing
+        task = scheduler.tasks[schedule["id"]]
+        today = date.today()
+        result = await server.endpoints[ADD_EXCLUSION](WebRequest({
+            "type": "dates",
+            "dates": [str(today), str(today + timedelta(days=1))]
+        }))
+        assert result["rescheduled"] == [schedule["id"]]
+        await asyncio.sleep(0.3)
+        assert kapis.scripts == ["G28"]
+        assert [r["status"] for r in scheduler.history] == ["success"]
+        assert schedule["run_count"] == 1
+        assert schedule["next_run"] == f"{today + timedelta(days=2)}T02:00:00"
+        assert scheduler.tasks[schedule["id"]] is task
+        assert not task.done()
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+import asyncio
+import re
+
+from conftest import WebRequest
+
+import macro_scheduler
+
+ADD = "/server/macro_scheduler/add"
+HISTORY = "/server/macro_scheduler/history"
+LONG_LINE = "// " + "x" * 300
+
+
+async def add_nightly(server, scheduler, macro="HEAT_SOAK"):
+    result = await server.endpoints[ADD](WebRequest({
+        "name": "Nightly", "macro": macro,
+        "schedule_type": "daily", "time": "02:00"
+    }))
+    return scheduler.schedules[result["schedule"]["id"]]
+
+
+def echo_console(server, lines):
+    """Make run_gcode answer with console lines like Klippy does"""
+    kapis = server.lookup_component("klippy_apis")
+
+    async def run_gcode(script, default=None):
+        kapis.scripts.append(script)
+        server.send_event("server:gcode_response", "// Other client")
+        for line in script.splitlines():
+            marker = re.match(r"RESPOND PREFIX=(\S+) MSG=(\S+)", line)
+            if marker:
+                server.send_event(
+                    "server:gcode_response", " ".join(marker.groups())
+                )
+            else:
+                server.send_event("server:gcode_response", "\n".join(lines))
+        return "ok"
+
+    kapis.run_gcode = run_gcode
+
+
+def test_output_is_filtered_and_bounded(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(output_max_lines=3)
+        schedule = await add_nightly(server, scheduler)
+        echo_console(server, [
+            "// Soaking", "ok B:60.0 /60.0 T0:200.0 /200.0", "", LONG_LINE,
+            "// Step 2", "// Done"
+        ])
+        assert await scheduler._fire_schedule(schedule, schedule["next_run"]) == (
+            True, None
+        )
+        # Nothing is captured outside a run
+        server.send_event("server:gcode_response", "// Idle")
+        result = await server.endpoints[HISTORY](WebRequest())
+        entry = result["history"][0]
+        assert entry["status"] == "success"
+        assert entry["gcode"] == "HEAT_SOAK"
+        limit = macro_scheduler.OUTPUT_MAX_LINE_LENGTH
+        assert entry["output"] == [LONG_LINE[:limit] + "...", "// Step 2", "// Done"]
+        assert entry["output_dropped"] == 2
+        assert not any(key.startswith("_") for key in entry)
+    asyncio.run(run())
+
+
+def test_capture_markers_only_keep_the_runs_lines(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(capture_markers=True)
+        schedule = await add_nightly(server, scheduler)
+        other = await add_nightly(server, scheduler, macro="G28")
+        echo_console(server, ["// Soaking"])
+        await scheduler._fire_schedule(schedule, schedule["next_run"])
+        # A run without console output sees none of the other lines
+        server.lookup_component("klippy_apis").run_gcode = (
+            lambda script, default=None: asyncio.sleep(0, "ok")
+        )
+        await scheduler._fire_schedule(other, other["next_run"])
+        result = await server.endpoints[HISTORY](WebRequest({"limit": 5}))
+        outputs = {e["schedule_id"]: e["output"] for e in result["history"]}
+        assert outputs == {schedule["id"]: ["// Soaking"], other["id"]: []}
+        result = await server.endpoints[HISTORY](
+            WebRequest({"schedule_id": other["id"]})
+        )
+        assert [e["schedule_id"] for e in result["history"]] == [other["id"]]
+    asyncio.run(run())
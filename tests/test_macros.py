@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from conftest import ServerError, WebRequest
+
+
+def _add(server, macro):
+    return server.endpoints["/server/macro_scheduler/add"](
+        WebRequest({
+            "name": "Nightly", "macro": macro,
+            "schedule_type": "daily", "time": "02:00"
+        })
+    )
+
+
+def test_known_commands_are_accepted(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        for macro in ("G28", "g1", "M104", "M118", "T0", "G29.1",
+                      "BED_MESH_CALIBRATE", "save_config", "HEAT_SOAK",
+                      "Preheat"):
+            result = await _add(server, macro)
+            assert result["schedule"]["id"] in scheduler.schedules, macro
+    asyncio.run(run())
+
+
+def test_unknown_macro_is_rejected(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        with pytest.raises(ServerError, match="Unknown macro: HEAT_SAOK") as exc:
+            await _add(server, "HEAT_SAOK")
+        assert exc.value.status_code == 400
+        assert not scheduler.schedules
+    asyncio.run(run())
+
+
+def test_macro_list_merges_help_and_macro_objects(make_scheduler):
+    async def run():
+        server, _ = await make_scheduler()
+        macros = server.endpoints["/server/macro_scheduler/macros"]
+        result = await macros(WebRequest())
+        assert [m["name"] for m in result["macros"]] == [
+            "BED_MESH_CALIBRATE", "G28", "HEAT_SOAK", "PREHEAT", "SAVE_CONFIG"
+        ]
+        assert {"name": "HEAT_SOAK", "help": "Soak the chamber"} in result["macros"]
+        assert {"name": "PREHEAT", "help": "G-Code macro"} in result["macros"]
+        assert result["total"] == 6
+        result = await macros(WebRequest({"prefix": "_", "include_hidden": True}))
+        assert [m["name"] for m in result["macros"]] == ["_PARK_HEAD"]
+    asyncio.run(run())
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from conftest import WebRequest
+
+ADD = "/server/macro_scheduler/add"
+TOGGLE = "/server/macro_scheduler/toggle"
+DELETE = "/server/macro_scheduler/delete"
+RECURRING = 20
+OPERATIONS = 100
+
+
+def test_concurrent_mutations_and_fires(make_scheduler):
+    """100 concurrent API mutations race scheduled fires
+
+    Every fire must be counted once, the database must hold exactly the
+    state in memory and the writer must have batched the commands.
+    """
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        endpoints = server.endpoints
+        database = server.components["database"]
+        klippy = server.components["klippy_apis"]
+        klippy.delay = .001
+        recurring = []
+        for idx in range(RECURRING):
+            result = await endpoints[ADD](WebRequest({
+                "name": f"Recurring {idx}",
+                "macro": f"RECURRING_{idx}",
+                "schedule_type": "interval",
+                "interval_minutes": 60
+            }))
+            recurring.append(result["schedule"]["id"])
+
+        async def fire_now(schedule_id):
+            # A scheduled fire: the schedule becomes due and is rearmed
+            def apply():
+                schedule = scheduler.schedules.get(schedule_id)
+                if schedule and schedule.get("enabled", True):
+                    schedule["next_run"] = datetime.now().isoformat()
+                    scheduler.rearm_ids.add(schedule_id)
+            await scheduler._mutate(apply)
+
+        async def add_once(idx):
+            return await endpoints[ADD](WebRequest({
+                "name": f"Once {idx}",
+                "macro": f"ONCE_{idx}",
+                "schedule_type": "once",
+                "datetime": datetime.now().isoformat()
+            }))
+
+        operations = []
+        for idx in range(OPERATIONS):
+            target = recurring[idx * 7 % RECURRING]
+            kind = idx % 4
+            if kind == 0:
+                operations.append(add_once(idx))
+            elif kind == 1:
+                operations.append(endpoints[TOGGLE](WebRequest({"id": target})))
+            elif kind == 2:
+                operations.append(fire_now(target))
+            else:
+                operations.append(
+                    endpoints[DELETE](WebRequest({"id": recurring[-1 - idx % 4]}))
+                )
+        stats = scheduler.mutation_stats
+        commands, batches = stats["commands"], stats["batches"]
+        writes = database.writes
+        start = time.monotonic()
+        results = await asyncio.gather(*operations, return_exceptions=True)
+        elapsed = time.monotonic() - start
+        # Repeated deletes of the same id are rejected, nothing else fails
+        errors = [r for r in results if isinstance(r, Exception)]
+        assert all("not found" in str(e).lower() for e in errors)
+
+        def fired(schedule):
+            return sum(
+                script == schedule["macro"] for script in klippy.scripts
+            )
+
+        # Let the fires started by the operations finish
+        for _ in range(500):
+            await asyncio.sleep(.01)
+            if scheduler.mutations.empty() and all(
+                schedule.get("run_count", 0) == fired(schedule)
+                for schedule in scheduler.schedules.values()
+            ) and not any(
+                schedule["schedule_type"] == "once" and schedule["enabled"]
+                for schedule in scheduler.schedules.values()
+            ):
+                break
+        await scheduler._mutate(lambda: None)
+
+        for schedule in scheduler.schedules.values():
+            assert schedule.get("run_count", 0) == fired(schedule)
+            if schedule["schedule_type"] == "once":
+                assert not schedule["enabled"]
+        stored = database.data[(scheduler.db_namespace, "schedules")]
+        assert stored["schedules"] == json.loads(json.dumps(
+            {str(sid): s for sid, s in scheduler.schedules.items()}
+        ))
+        armed = {
+            sid for sid, schedule in scheduler.schedules.items()
+            if schedule.get("enabled", True) and schedule.get("next_run") and
+            schedule["schedule_type"] != "once"
+        }
+        assert armed <= set(scheduler.tasks)
+        applied = stats["commands"] - commands
+        assert applied >= OPERATIONS
+        assert database.writes - writes == stats["batches"] - batches
+        assert stats["batches"] - batches < applied
+        # The fires really raced the API mutations
+        assert klippy.scripts
+        # Batched writes keep the whole burst well under a second
+        assert elapsed < 1.
+    asyncio.run(run())
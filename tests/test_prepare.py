@@ -0,0 +1,102 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from conftest import WebRequest
+
+ADD = "/server/macro_scheduler/add"
+READINESS = "/server/macro_scheduler/readiness"
+
+
+async def add_prepared(server, scheduler, **options):
+    result = await server.endpoints[ADD](WebRequest({
+        "name": "Morning print",
+        "macro": "G28",
+        "schedule_type": "daily",
+        "time": "07:00",
+        "prepare_macro": "HEAT_SOAK",
+        **options
+    }))
+    return scheduler.schedules[result["schedule"]["id"]]
+
+
+def add_prepare_run(scheduler, schedule, duration, status="success"):
+    run = scheduler._start_run(schedule, kind="prepare")
+    run["target"] = schedule["next_run"]
+    scheduler._finish_run(run, status)
+    run["duration"] = duration
+    return run
+
+
+def test_prepare_fires_lead_seconds_ahead(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        schedule = await add_prepared(server, scheduler, lead_seconds=0.2)
+        kapis = server.lookup_component("klippy_apis")
+        fired_at = {}
+
+        async def run_gcode(script, default=None):
+            fired_at[script] = time.monotonic()
+            kapis.scripts.append(script)
+            return "ok"
+
+        kapis.run_gcode = run_gcode
+        due = datetime.now() + timedelta(seconds=0.3)
+
+        def make_due():
+            schedule["next_run"] = due.isoformat()
+            scheduler.rearm_ids.add(schedule["id"])
+
+        start = time.monotonic()
+        await scheduler._mutate(make_due)
+        await asyncio.sleep(0.45)
+        assert kapis.scripts == ["HEAT_SOAK", "G28"]
+        assert 0.05 <= fired_at["HEAT_SOAK"] - start < 0.2
+        assert fired_at["G28"] - fired_at["HEAT_SOAK"] >= 0.15
+        prepare = [r for r in scheduler.history if r["kind"] == "prepare"]
+        assert prepare[0]["target"] == due.isoformat()
+        assert prepare[0]["ready_offset"] < 0
+        # The next run is prepared again
+        assert schedule["id"] not in scheduler.prepared
+    asyncio.run(run())
+
+
+def test_lead_time_is_learned_from_recent_successes(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(prepare_lead_seconds=600)
+        schedule = await add_prepared(server, scheduler)
+        assert scheduler._get_lead_seconds(schedule) == 600
+        add_prepare_run(scheduler, schedule, 900.)
+        for duration in (100., 120., 300., 110., 130.):
+            add_prepare_run(scheduler, schedule, duration)
+        add_prepare_run(scheduler, schedule, 2000., status="failed")
+        scheduler._learn_lead_seconds(schedule)
+        # Longest of the last five successes plus 10%, the failure and
+        # the older 900s run don't count
+        assert schedule["learned_lead_seconds"] == 330.
+        assert scheduler._get_lead_seconds(schedule) == 330.
+        schedule["lead_seconds"] = 60.
+        assert scheduler._get_lead_seconds(schedule) == 60.
+    asyncio.run(run())
+
+
+def test_readiness_reports_offsets(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(prepare_lead_seconds=600)
+        schedule = await add_prepared(server, scheduler)
+        for offset in (-30., 10.):
+            add_prepare_run(scheduler, schedule, 500.)["ready_offset"] = offset
+        add_prepare_run(scheduler, schedule, 5., status="failed")
+        result = await server.endpoints[READINESS](WebRequest())
+        report = result["readiness"][0]
+        assert report["schedule_id"] == schedule["id"]
+        assert report["lead_source"] == "default"
+        assert report["lead_seconds"] == 600
+        assert (report["samples"], report["failed"]) == (3, 1)
+        assert (report["on_time"], report["late"]) == (1, 1)
+        assert report["mean_offset"] == -10.
+        assert report["max_late"] == 10.
+        assert [r["status"] for r in report["recent"]] == [
+            "success", "success", "failed"
+        ]
+    asyncio.run(run())
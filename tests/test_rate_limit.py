@@ -0,0 +1,127 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from conftest import WebRequest
+
+ADD = "/server/macro_scheduler/add"
+
+
+async def add_prepared(server, scheduler):
+    result = await server.endpoints[ADD](WebRequest({
+        "name": "Morning print",
+        "macro": "G28",
+        "schedule_type": "daily",
+        "time": "07:00",
+        "prepare_macro": "HEAT_SOAK"
+    }))
+    return scheduler.schedules[result["schedule"]["id"]]
+
+
+def prepare_runs(scheduler):
+    return [run for run in scheduler.history if run["kind"] == "prepare"]
+
+
+def test_prepare_macro_takes_rate_limit_tokens(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(
+            rate_limit_mode="drop", macro_rate_limits={"heat_soak": "1/1"}
+        )
+        schedule = await add_prepared(server, scheduler)
+        due = (datetime.now() + timedelta(hours=1)).isoformat()
+        await scheduler._execute_prepare(schedule, due)
+        await scheduler._execute_prepare(schedule, due)
+        kapis = server.lookup_component("klippy_apis")
+        assert kapis.scripts == ["HEAT_SOAK"]
+        runs = prepare_runs(scheduler)
+        assert [r["status"] for r in runs] == ["success", "dropped"]
+        assert runs[1]["target"] == due
+        assert scheduler.macro_buckets["HEAT_SOAK"].dropped == 1
+    asyncio.run(run())
+
+
+def test_prepare_macro_respects_circuit_breaker(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(circuit_breaker_threshold=1)
+        schedule = await add_prepared(server, scheduler)
+        due = (datetime.now() + timedelta(hours=1)).isoformat()
+        kapis = server.lookup_component("klippy_apis")
+        kapis.fail_once.append("HEAT_SOAK")
+        await scheduler._execute_prepare(schedule, due)
+        breaker = scheduler.breakers["HEAT_SOAK"]
+        assert breaker.state == "open"
+        await scheduler._execute_prepare(schedule, due)
+        assert kapis.scripts == ["HEAT_SOAK"]
+        assert [r["status"] for r in prepare_runs(scheduler)] == ["failed"]
+    asyncio.run(run())
+
+
+async def add_nightly(server, scheduler, macro="G28"):
+    result = await server.endpoints[ADD](WebRequest({
+        "name": "Nightly", "macro": macro,
+        "schedule_type": "daily", "time": "02:00"
+    }))
+    return scheduler.schedules[result["schedule"]["id"]]
+
+
+def test_queue_mode_delays_executions_at_the_refill_rate(make_scheduler):
+    async def run():
+        # One token per 0.1s, one in the bucket
+        server, scheduler = await make_scheduler(
+            rate_limit_per_minute=600, rate_limit_burst=1
+        )
+        schedule = await add_nightly(server, scheduler)
+        kapis = server.lookup_component("klippy_apis")
+        start = time.monotonic()
+        results = await asyncio.gather(*(
+            scheduler._fire_schedule(schedule, schedule["next_run"])
+            for _ in range(3)
+        ))
+        elapsed = time.monotonic() - start
+        assert results == [(True, None)] * 3
+        assert kapis.scripts == ["G28"] * 3
+        assert 0.18 <= elapsed < 0.5
+        status = scheduler.global_bucket.get_status()
+        assert (status["allowed"], status["queued"], status["dropped"]) == (1, 2, 0)
+        assert status["max_wait_seconds"] >= 0.19
+    asyncio.run(run())
+
+
+def test_drop_mode_skips_executions_without_a_token(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(
+            rate_limit_mode="drop", macro_rate_limits={"g28": "1/1"}
+        )
+        schedule = await add_nightly(server, scheduler)
+        other = await add_nightly(server, scheduler, macro="HEAT_SOAK")
+        fired = await scheduler._fire_schedule(schedule, schedule["next_run"])
+        dropped = await scheduler._fire_schedule(schedule, schedule["next_run"])
+        # Other macros have their own bucket
+        unlimited = await scheduler._fire_schedule(other, other["next_run"])
+        assert fired == (True, None)
+        assert dropped[0] and "Rate limit exceeded" in dropped[1]
+        assert unlimited == (True, None)
+        kapis = server.lookup_component("klippy_apis")
+        assert kapis.scripts == ["G28", "HEAT_SOAK"]
+        assert [r["status"] for r in scheduler.history] == [
+            "success", "dropped", "success"
+        ]
+        # A dropped execution is not a macro failure
+        assert scheduler.breakers["G28"].failures == 0
+        assert scheduler.macro_buckets["G28"].get_status()["dropped"] == 1
+    asyncio.run(run())
+
+
+def test_queue_mode_drops_beyond_max_wait(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(
+            rate_limit_per_minute=1, rate_limit_max_wait_seconds=5
+        )
+        schedule = await add_nightly(server, scheduler)
+        await scheduler._fire_schedule(schedule, schedule["next_run"])
+        fired, error = await scheduler._fire_schedule(
+            schedule, schedule["next_run"]
+        )
+        assert fired and "Rate limit exceeded" in error
+        assert scheduler.global_bucket.dropped == 1
+    asyncio.run(run())
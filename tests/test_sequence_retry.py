@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from conftest import WebRequest
+
+ADD = "/server/macro_scheduler/add"
+
+
+async def add_sequence(server, scheduler, **options):
+    args = {
+        "name": "Morning prep",
+        "schedule_type": "sequence",
+        "trigger_type": "once",
+        "datetime": (datetime.now() + timedelta(days=1)).isoformat(),
+        "steps": [
+            {"macro": "HEAT_SOAK"},
+            {"macro": "CLEAN_NOZZLE", "delay_seconds": 0.01},
+            {"macro": "CALIBRATE_Z", "delay_seconds": 0.01}
+        ],
+        **options
+    }
+    result = await server.endpoints[ADD](WebRequest(args))
+    scheduler._get_retry_delay = lambda schedule, attempt: 0.
+    return scheduler.schedules[result["schedule"]["id"]]
+
+
+def test_retry_resumes_at_failed_segment(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        schedule = await add_sequence(server, scheduler)
+        klippy = server.components["klippy_apis"]
+        klippy.fail_once.append("CLEAN_NOZZLE")
+        fired, error = await scheduler._fire_schedule(
+            schedule, schedule["next_run"]
+        )
+        assert fired and error is None
+        assert klippy.scripts == [
+            "HEAT_SOAK", "CLEAN_NOZZLE", "CLEAN_NOZZLE", "CALIBRATE_Z"
+        ]
+        await scheduler._mutate(lambda: scheduler._record_fire(schedule, error))
+        assert schedule["run_count"] == 1
+    asyncio.run(run())
+
+
+def test_step_failures_use_per_macro_breakers(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(
+            validate_macros=False, max_retries=0
+        )
+        schedule = await add_sequence(server, scheduler)
+        server.components["klippy_apis"].fail_once.append("CALIBRATE_Z")
+        await scheduler._fire_schedule(schedule, schedule["next_run"])
+        breakers = scheduler.breakers
+        assert "HEAT_SOAK, CLEAN_NOZZLE, CALIBRATE_Z" not in breakers
+        assert breakers["CALIBRATE_Z"].failures == 1
+        assert breakers["HEAT_SOAK"].failures == 0
+        assert breakers["CLEAN_NOZZLE"].failures == 0
+    asyncio.run(run())
+
+
+def test_budget_exceeded_is_not_retried(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        schedule = await add_sequence(server, scheduler, budget_seconds=0.05)
+        klippy = server.components["klippy_apis"]
+        klippy.delay = 0.04
+        _, error = await scheduler._fire_schedule(
+            schedule, schedule["next_run"]
+        )
+        assert "budget" in error
+        assert "CALIBRATE_Z" not in klippy.scripts
+        assert klippy.scripts.count("HEAT_SOAK") == 1
+    asyncio.run(run())
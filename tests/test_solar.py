@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import ServerError, WebRequest
+
+from macro_scheduler import solar_event_utc, solar_year_table
+
+GREENWICH = (51.4769, 0.)
+SVALBARD = (78.2, 15.6)
+
+
+def local(event_utc):
+    return event_utc.astimezone().replace(tzinfo=None, microsecond=0)
+
+
+def test_event_times_match_the_almanac():
+    midsummer = datetime(2026, 6, 21)
+    sunrise = solar_event_utc(*GREENWICH, "sunrise", midsummer)
+    sunset = solar_event_utc(*GREENWICH, "sunset", midsummer)
+    # Published times for Greenwich: 03:43 and 20:21 UTC
+    assert abs(sunrise.hour * 60 + sunrise.minute - (3 * 60 + 43)) <= 2
+    assert abs(sunset.hour * 60 + sunset.minute - (20 * 60 + 21)) <= 2
+    dawn = solar_event_utc(*GREENWICH, "civil_dawn", datetime(2026, 3, 20))
+    assert dawn < solar_event_utc(*GREENWICH, "sunrise", datetime(2026, 3, 20))
+
+
+def test_polar_days_are_left_out_of_the_table():
+    assert solar_event_utc(*SVALBARD, "sunrise", datetime(2026, 6, 21)) is None
+    table = solar_year_table(*SVALBARD, "sunrise", 2026)
+    # Polar night in winter and midnight sun in summer
+    assert 100 < len(table) < 200
+    assert list(table) == sorted(table)
+    assert not any(t.month == 6 for t in table)
+
+
+def test_next_run_applies_offset_and_skips_to_next_event(make_scheduler):
+    async def run():
+        _, scheduler = await make_scheduler()
+        day = datetime(2026, 6, 21)
+        sunset = local(solar_event_utc(*GREENWICH, "sunset", day))
+        next_sunset = local(
+            solar_event_utc(*GREENWICH, "sunset", day + timedelta(days=1))
+        )
+        next_run = scheduler._calculate_next_solar_run(
+            *GREENWICH, "sunset", -30, day
+        )
+        assert next_run == (sunset - timedelta(minutes=30)).isoformat()
+        # Once the offset run has passed the next day's event is used
+        after = sunset - timedelta(minutes=29)
+        next_run = scheduler._calculate_next_solar_run(
+            *GREENWICH, "sunset", -30, after
+        )
+        assert next_run == (next_sunset - timedelta(minutes=30)).isoformat()
+    asyncio.run(run())
+
+
+def test_add_solar_schedule_validates_location(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        add = server.endpoints["/server/macro_scheduler/add"]
+        base = {
+            "name": "Lights", "macro": "G28", "schedule_type": "solar",
+            "solar_event": "sunset"
+        }
+        with pytest.raises(ServerError, match="Invalid latitude"):
+            await add(WebRequest({**base, "latitude": 91, "longitude": 0}))
+        with pytest.raises(ServerError, match="Invalid solar_event"):
+            await add(WebRequest({
+                **base, "latitude": 51.5, "longitude": 0, "solar_event": "noon"
+            }))
+        result = await add(WebRequest({
+            **base, "latitude": GREENWICH[0], "longitude": GREENWICH[1]
+        }))
+        next_run = datetime.fromisoformat(result["schedule"]["next_run"])
+        assert datetime.now() < next_run < datetime.now() + timedelta(days=2)
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import ServerError, WebRequest
+
+TEMPLATE_SCHEDULE = {
+    "name": "Report temperature",
+    "macro": "M118",
+    "schedule_type": "once",
+    "datetime": (datetime.now() + timedelta(days=1)).isoformat(),
+    "params": {"T": "{printer.extruder.temperature}"},
+    "prepare_macro": "PREHEAT",
+    "prepare_params": {"BED": "{printer.heater_bed.target}"}
+}
+
+
+def test_preview_and_dry_run_do_not_subscribe(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        endpoints = server.endpoints
+        preview = await endpoints["/server/macro_scheduler/preview"](
+            WebRequest(dict(TEMPLATE_SCHEDULE))
+        )
+        assert preview["valid"]
+        result = await endpoints["/server/macro_scheduler/import"](WebRequest({
+            "data": json.dumps(TEMPLATE_SCHEDULE), "dry_run": True
+        }))
+        assert result["valid"] == 1
+        assert scheduler.template_objects == set()
+    asyncio.run(run())
+
+
+def test_saved_schedules_subscribe(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        await server.endpoints["/server/macro_scheduler/import"](WebRequest({
+            "data": json.dumps(TEMPLATE_SCHEDULE)
+        }))
+        assert scheduler.template_objects == {"extruder", "heater_bed"}
+    asyncio.run(run())
+
+
+def test_oversized_format_specs_are_rejected(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler(validate_macros=False)
+        add = server.endpoints["/server/macro_scheduler/add"]
+        for spec in (">100000000", ".99999", "x<65"):
+            with pytest.raises(ServerError, match="precision limit of 64"):
+                await add(WebRequest({
+                    **TEMPLATE_SCHEDULE, "prepare_macro": None,
+                    "params": {"N": "{run_count:" + spec + "}"}
+                }))
+        result = await add(WebRequest({
+            **TEMPLATE_SCHEDULE, "prepare_macro": None,
+            "params": {"N": "{run_count:0>64}"}
+        }))
+        assert result["schedule"]["id"] in scheduler.schedules
+    asyncio.run(run())
+
+
+def test_schedule_file_subscribes_applied_sections_only(make_scheduler, tmp_path):
+    async def run():
+        path = tmp_path / "macro_schedules.cfg"
+        path.write_text(
+            "[schedule warm_bed]\n"
+            "macro: PREHEAT\n"
+            "schedule_type: daily\n"
+            "time: 07:00\n"
+            "params: BED={printer.heater_bed.target}\n"
+        )
+        server, scheduler = await make_scheduler(
+            validate_macros=False, schedule_file=str(path)
+        )
+        assert len(scheduler.file_index) == 1
+        assert scheduler.template_objects == {"heater_bed"}
+        # A parse whose sections are never applied subscribes nothing
+        path.write_text(
+            "[schedule warm_nozzle]\n"
+            "macro: PREHEAT\n"
+            "schedule_type: daily\n"
+            "time: 07:00\n"
+            "params: T={printer.extruder.target}\n"
+        )
+        _, changed, _ = await scheduler._offload(
+            scheduler._parse_schedule_file, path, {}
+        )
+        await asyncio.sleep(0)
+        assert list(changed) == ["warm_nozzle"]
+        assert scheduler.template_objects == {"heater_bed"}
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from conftest import ServerError, WebRequest
+
+
+class FileManager:
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+
+    def get_directory(self, root="gcodes"):
+        return str(self.config_dir) if root == "config" else ""
+
+
+async def _make_exporter(make_scheduler, tmp_path):
+    server, scheduler = await make_scheduler(validate_macros=False)
+    server.components["file_manager"] = FileManager(tmp_path)
+    await server.endpoints["/server/macro_scheduler/add"](
+        WebRequest({
+            "name": "Nightly", "macro": "G28",
+            "schedule_type": "daily", "time": "02:00"
+        })
+    )
+    return server, server.endpoints["/server/macro_scheduler/export"]
+
+
+def test_export_rejects_other_extensions(make_scheduler, tmp_path):
+    async def run():
+        _, export = await _make_exporter(make_scheduler, tmp_path)
+        config = tmp_path / "printer.cfg"
+        config.write_text("[printer]\n")
+        for filename in ("printer.cfg", "moonraker.conf", "export.csv.cfg"):
+            with pytest.raises(ServerError, match="must end with"):
+                await export(WebRequest({"filename": filename}))
+        with pytest.raises(ServerError, match="must end with .jsonl"):
+            await export(WebRequest({"filename": "a.csv", "format": "jsonl"}))
+        assert config.read_text() == "[printer]\n"
+    asyncio.run(run())
+
+
+def test_export_only_replaces_its_own_files(make_scheduler, tmp_path):
+    async def run():
+        _, export = await _make_exporter(make_scheduler, tmp_path)
+        foreign = tmp_path / "notes.csv"
+        foreign.write_text("a,b\n1,2\n")
+        with pytest.raises(ServerError) as exc:
+            await export(WebRequest({"filename": "notes.csv"}))
+        assert exc.value.status_code == 409
+        assert foreign.read_text() == "a,b\n1,2\n"
+
+        for filename in ("schedules.csv", "schedules.jsonl"):
+            for _ in range(2):
+                result = await export(WebRequest({"filename": filename}))
+                assert result["count"] == 1
+    asyncio.run(run())
+
+
+def test_jsonl_export_round_trips(make_scheduler, tmp_path):
+    async def run():
+        server, export = await _make_exporter(make_scheduler, tmp_path)
+        await export(WebRequest({"filename": "schedules.jsonl"}))
+        result = await server.endpoints["/server/macro_scheduler/import"](
+            WebRequest({"filename": "schedules.jsonl", "dry_run": True})
+        )
+        assert result["invalid"] == 0
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import gzip
+import os
+
+from macro_scheduler import WebUIAssets
+
+PAGE = b"<html><body>Macro Scheduler</body></html>"
+
+
+def make_assets(tmp_path, variants=()):
+    page = tmp_path / "scheduler_ui.html"
+    page.write_bytes(PAGE)
+    for suffix, data in variants:
+        (tmp_path / f"scheduler_ui.html{suffix}").write_bytes(data)
+    assets = WebUIAssets(page)
+    return page, assets
+
+
+def test_gzip_is_built_when_no_variant_is_installed(tmp_path):
+    _, assets = make_assets(tmp_path)
+    assets.load()
+    encoding, body, etag = assets.select("gzip, deflate")
+    assert encoding == "gzip"
+    assert gzip.decompress(body) == PAGE
+    identity = assets.select("")
+    assert identity[:2] == ("identity", PAGE)
+    # Codings of the same page never share an ETag
+    assert etag != identity[2]
+
+
+def test_precompressed_variants_are_negotiated(tmp_path):
+    _, assets = make_assets(tmp_path, [(".br", b"brotli"), (".gz", b"gz")])
+    assets.load()
+    assert assets.select("gzip, br")[:2] == ("br", b"brotli")
+    assert assets.select("br;q=0, gzip")[:2] == ("gzip", b"gz")
+    assert assets.select("*")[0] == "br"
+    assert assets.select("identity")[:2] == ("identity", PAGE)
+    assert assets.get_status()["sizes"] == {
+        "identity": len(PAGE), "br": 6, "gzip": 2
+    }
+
+
+def test_variants_older_than_the_page_are_ignored(tmp_path):
+    page, assets = make_assets(tmp_path, [(".br", b"stale")])
+    stat = page.stat()
+    os.utime(tmp_path / "scheduler_ui.html.br", (stat.st_atime, stat.st_mtime - 60))
+    assets.load()
+    assert "br" not in assets.variants
+    assert assets.select("br, gzip")[0] == "gzip"
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+from conftest import WebRequest
+
+import macro_scheduler
+
+ADD_EXCLUSION = "/server/macro_scheduler/exclusions/add"
+
+
+def test_offloaded_listing_reads_copies(make_scheduler, monkeypatch):
+    async def run():
+        server, scheduler = await make_scheduler()
+        for sid in range(1, 4):
+            scheduler.schedules[sid] = {
+                "id": sid, "name": f"S{sid}", "macro": "G28",
+                "schedule_type": "daily", "enabled": True
+            }
+        seen = []
+        select = scheduler._select_schedules
+
+        def spy(cancelled, candidates, *args):
+            seen.append(threading.current_thread() is threading.main_thread())
+            for sid, schedule in candidates:
+                assert schedule is not scheduler.schedules[sid]
+            return select(cancelled, candidates, *args)
+
+        monkeypatch.setattr(macro_scheduler, "OFFLOAD_MIN_SCHEDULES", 0)
+        monkeypatch.setattr(scheduler, "_select_schedules", spy)
+        result = await server.endpoints["/server/macro_scheduler/schedules"](
+            WebRequest()
+        )
+        assert seen == [False]
+        assert [s["id"] for s in result["schedules"]] == [1, 2, 3]
+    asyncio.run(run())
+
+
+def test_worker_jobs_keep_exclusion_indexes_private(make_scheduler):
+    async def run():
+        server, scheduler = await make_scheduler()
+        await server.endpoints[ADD_EXCLUSION](WebRequest({
+            "type": "window", "start": "01:00", "end": "03:00"
+        }))
+        scheduler.exclusion_indexes.clear()
+        result = await server.endpoints["/server/macro_scheduler/preview"](
+            WebRequest({
+                "schedule_type": "daily", "time": "04:00", "count": 3
+            })
+        )
+        assert result["valid"]
+        assert len(result["runs"]) == 3
+        assert scheduler.exclusion_indexes == {}
+        assert not hasattr(scheduler.job_state, "exclusion_indexes")
+    asyncio.run(run())
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Long-horizon soak simulation for the Macro Scheduler component.
+
+Drives MacroScheduler through a simulated year on a virtual clock, with
+stubbed Moonraker components instead of a running Moonraker/Klipper:
+  - Wall-clock time follows a real time zone, so DST transitions happen.
+  - Klippy is shut down and restarted at random intervals.
+  - Thousands of add, toggle, group and delete API operations churn the
+    schedule set while the baseline schedules keep firing.
+
+At every checkpoint the simulation checks heap size, the asyncio task
+count, the size of the component's task dict and firing accuracy, and
+exits non-zero if any check fails. A full year finishes in a few minutes.
+
+Usage:
+    python3 tools/soak_simulation.py [--days 365] [--seed 1] [--tz America/New_York]
+
+Requires Python 3.9+ (zoneinfo).
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import random
+import sys
+import time
+import types
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent))
+
+import macro_scheduler  # noqa: E402
+
+SIM_START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+CHECKPOINT_DAYS = 30
+TARGET_SCHEDULES = 30
+# Lateness above this is reported as late, fires within the last sleep
+# step before a DST jump may be late by up to MAX_SLEEP_SECONDS
+ON_TIME_SECONDS = 1.
+HEAP_GROWTH_FACTOR = 1.5
+HEAP_GROWTH_SLACK = 20000
+TASK_SLACK = 10
+
+
+class ServerError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps to the next timer instead of blocking"""
+
+    def __init__(self):
+        super().__init__()
+        self._virtual_time = 0.
+        # A year of seconds needs more than 1ns to stay above float precision
+        self._clock_resolution = 1e-6
+        real_select = self._selector.select
+
+        def select(timeout: Optional[float] = None):
+            if timeout is None:
+                raise RuntimeError("Simulation deadlocked, no pending timers")
+            self._virtual_time += max(0., timeout)
+            return real_select(0)
+
+        self._selector.select = select
+
+    def time(self) -> float:
+        return self._virtual_time
+
+
+def make_datetime(loop: VirtualClockLoop, tz: ZoneInfo) -> type:
+    """datetime subclass whose now() is local time on the virtual clock"""
+
+    class VirtualDatetime(datetime):
+        @classmethod
+        def now(cls, tz_arg=None):
+            utc = SIM_START + timedelta(seconds=loop.time())
+            if tz_arg is not None:
+                return utc.astimezone(tz_arg)
+            local = utc.astimezone(tz)
+            return cls(
+                local.year, local.month, local.day, local.hour,
+                local.minute, local.second, local.microsecond
+            )
+
+    return VirtualDatetime
+
+
+class WebRequest:
+    def __init__(self, args: Dict[str, Any]):
+        self.args = args
+
+    def get(self, key, default=ServerError):
+        if key in self.args:
+            return self.args[key]
+        if default is ServerError:
+            raise ServerError(f"No data for argument: {key}")
+        return default
+
+    def get_str(self, key, default=ServerError):
+        value = self.get(key, default)
+        return value if value is None else str(value)
+
+    def get_int(self, key, default=ServerError):
+        value = self.get(key, default)
+        return value if value is None else int(value)
+
+    def get_float(self, key, default=ServerError):
+        value = self.get(key, default)
+        return value if value is None else float(value)
+
+    def get_boolean(self, key, default=ServerError):
+        return bool(self.get(key, default))
+
+    def get_args(self) -> Dict[str, Any]:
+        return self.args
+
+
+class Database:
+    def __init__(self):
+        self.items: Dict[Any, str] = {}
+        self.writes = 0
+
+    async def get_item(self, namespace, key, default=None):
+        value = self.items.get((namespace, key))
+        return default if value is None else json.loads(value)
+
+    async def insert_item(self, namespace, key, value):
+        # Serializing catches values that Moonraker couldn't store
+        self.items[(namespace, key)] = json.dumps(value)
+        self.writes += 1
+
+
+class KlippyApis:
+    def __init__(self, rng: random.Random, failure_rate: float):
+        self.rng = rng
+        self.failure_rate = failure_rate
+        self.available = False
+        self.calls = 0
+        self.failures = 0
+
+    async def run_gcode(self, script: str, default=None):
+        if not self.available:
+            raise ServerError("Klippy Disconnected", 503)
+        self.calls += 1
+        await asyncio.sleep(self.rng.uniform(0.05, 2.))
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise ServerError("Simulated macro error")
+        return "ok"
+
+    async def subscribe_objects(self, objects, callback=None, default=None):
+        return {}
+
+
+class Server:
+    error = ServerError
+
+    def __init__(self, components: Dict[str, Any]):
+        self.components = components
+        self.endpoints: Dict[str, Callable] = {}
+        self.handlers: Dict[str, List[Callable]] = {}
+
+    def register_endpoint(self, path, methods, callback, **kwargs):
+        self.endpoints[path] = callback
+
+    def register_event_handler(self, event, callback):
+        self.handlers.setdefault(event, []).append(callback)
+
+    def register_notification(self, event, notify_name=None):
+        pass
+
+    def send_event(self, event, *args):
+        loop = asyncio.get_running_loop()
+        for callback in self.handlers.get(event, []):
+            loop.call_soon(self._run_handler, callback, args)
+
+    @staticmethod
+    def _run_handler(callback, args):
+        result = callback(*args)
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+    def lookup_component(self, name, default=ServerError):
+        if name in self.components:
+            return self.components[name]
+        if default is ServerError:
+            raise ServerError(f"Component ({name}) not found")
+        return default
+
+    def get_event_loop(self):
+        return asyncio.get_running_loop()
+
+
+class Config:
+    error = ServerError
+
+    def __init__(self, server: Server, options: Dict[str, Any]):
+        self.server = server
+        self.options = options
+
+    def get_server(self):
+        return self.server
+
+    def get_name(self):
+        return "macro_scheduler"
+
+    def get(self, option, default=None, **kwargs):
+        return self.options.get(option, default)
+
+    def getint(self, option, default=None, **kwargs):
+        return int(self.options.get(option, default))
+
+    def getfloat(self, option, default=None, **kwargs):
+        return float(self.options.get(option, default))
+
+    def getboolean(self, option, default=None, **kwargs):
+        return bool(self.options.get(option, default))
+
+    def getdict(self, option, default=None, **kwargs):
+        return dict(self.options.get(option, default))
+
+
+@dataclass
+class FireStats:
+    on_time: int = 0
+    late: int = 0
+    early: int = 0
+    catch_up: int = 0
+    dst_gap: int = 0
+    drained: int = 0
+    max_late: float = 0.
+    max_early: float = 0.
+
+
+@dataclass
+class Checkpoint:
+    day: int
+    schedules: int
+    enabled: int
+    component_tasks: int
+    loop_tasks: int
+    heap_blocks: int
+    fires: int
+    errors: List[str] = field(default_factory=list)
+
+
+class Simulation:
+    BASELINE = [
+        {"name": "Morning", "macro": "PREHEAT_BED", "schedule_type": "daily",
+         "time": "07:00", "params": {"TEMP": 60}, "tags": ["heating"]},
+        {"name": "DST gap", "macro": "NIGHT_CHECK", "schedule_type": "daily",
+         "time": "02:30"},
+        {"name": "Weekdays", "macro": "LIGHTS_ON", "schedule_type": "weekly",
+         "time": "09:15", "days": [0, 2, 4], "tags": ["lighting"]},
+        {"name": "Every 90", "macro": "STATUS", "schedule_type": "interval",
+         "interval_minutes": 90, "params": {"RUN": "{run_count}"}},
+        {"name": "Every 3h", "macro": "PURGE", "schedule_type": "cron",
+         "cron_expression": "0 */3 * * *", "tags": ["maintenance"]},
+        {"name": "MWF", "macro": "REPORT", "schedule_type": "cron",
+         "cron_expression": "30 14 * * 1,3,5", "params": {"AT": "{now:%H%M}"}},
+        {"name": "Warmup", "schedule_type": "sequence", "trigger_type": "daily",
+         "time": "06:00", "budget_seconds": 900, "tags": ["heating"],
+         "steps": [
+             {"macro": "HEAT_SOAK", "params": {"TEMP": 100}},
+             {"macro": "CLEAN_NOZZLE"},
+             {"macro": "CALIBRATE_Z", "delay_seconds": 120}
+         ]},
+    ]
+
+    def __init__(self, days: int, seed: int, tz: ZoneInfo, failure_rate: float):
+        self.days = days
+        self.rng = random.Random(seed)
+        random.seed(seed)
+        self.tz = tz
+        self.loop = asyncio.get_event_loop()
+        self.klippy = KlippyApis(self.rng, failure_rate)
+        self.database = Database()
+        self.server = Server({"database": self.database, "klippy_apis": self.klippy})
+        self.datetime = make_datetime(self.loop, tz)
+        macro_scheduler.datetime = self.datetime
+        macro_scheduler.time = types.SimpleNamespace(monotonic=self.loop.time)
+        # The latency probe would keep the virtual clock ticking and worker
+        # threads cannot advance it, so the probe is off in the simulation
+        self.component = macro_scheduler.load_component(
+            Config(self.server, {"loop_probe_interval": 0.})
+        )
+        self.fires = FireStats()
+        self.started_at: Dict[int, datetime] = {}
+        self.loop_errors: List[str] = []
+        self.operations: Dict[str, int] = {}
+        self.restarts = 0
+        self.checkpoints: List[Checkpoint] = []
+        self._instrument()
+
+    # ------------------------------------------------------------ instrument
+    def _instrument(self):
+        component = self.component
+        start_schedule = component._start_schedule
+        fire_schedule = component._fire_schedule
+
+        async def _start_schedule(schedule_id):
+            self.started_at[schedule_id] = self.datetime.now()
+            await start_schedule(schedule_id)
+
+        async def _fire_schedule(schedule, due):
+            self._record_fire(schedule, due)
+            return await fire_schedule(schedule, due)
+
+        component._start_schedule = _start_schedule
+        component._fire_schedule = _fire_schedule
+        self.loop.set_exception_handler(self._handle_loop_error)
+
+    def _handle_loop_error(self, loop, context):
+        self.loop_errors.append(str(context.get("exception") or context["message"]))
+
+    def _in_dst_gap(self, local: datetime) -> bool:
+        roundtrip = local.replace(tzinfo=self.tz).astimezone(timezone.utc)
+        return roundtrip.astimezone(self.tz).replace(tzinfo=None) != local
+
+    def _record_fire(self, schedule: Dict[str, Any], due: str):
+        stats = self.fires
+        if asyncio.current_task() is self.component.drain_task:
+            stats.drained += 1
+            return
+        due_time = datetime.fromisoformat(due)
+        started = self.started_at.get(schedule["id"])
+        if started is not None and due_time < started:
+            # Re-enabled or restarted after the due time passed
+            stats.catch_up += 1
+            return
+        if self._in_dst_gap(due_time):
+            stats.dst_gap += 1
+            return
+        lateness = (self.datetime.now() - due_time).total_seconds()
+        if lateness < -ON_TIME_SECONDS:
+            stats.early += 1
+            stats.max_early = max(stats.max_early, -lateness)
+        elif lateness > ON_TIME_SECONDS:
+            stats.late += 1
+        else:
+            stats.on_time += 1
+        stats.max_late = max(stats.max_late, lateness)
+
+    # ------------------------------------------------------------ operations
+    async def _call(self, path: str, args: Dict[str, Any]) -> Optional[Dict]:
+        name = path.rsplit("/", 1)[-1]
+        self.operations[name] = self.operations.get(name, 0) + 1
+        try:
+            return await self.server.endpoints[path](WebRequest(args))
+        except ServerError:
+            return None
+
+    async def _random_operation(self):
+        component = self.component
+        ids = list(component.schedules)
+        churned = [sid for sid in ids if sid > len(self.BASELINE)]
+        roll = self.rng.random()
+        now = self.datetime.now()
+        if len(ids) < TARGET_SCHEDULES and roll < 0.5:
+            if self.rng.random() < 0.6:
+                when = now + timedelta(minutes=self.rng.randint(10, 72 * 60))
+                await self._call("/server/macro_scheduler/add", {
+                    "name": "churn once", "macro": "ONE_SHOT",
+                    "schedule_type": "once",
+                    "datetime": when.replace(second=0, microsecond=0).isoformat(),
+                    "tags": ["churn"]
+                })
+            else:
+                await self._call("/server/macro_scheduler/add", {
+                    "name": "churn interval", "macro": "PERIODIC",
+                    "schedule_type": "interval",
+                    "interval_minutes": self.rng.randint(30, 600),
+                    "tags": ["churn"], "misfire_policy": "skip"
+                })
+        elif churned and roll < 0.8:
+            await self._call(
+                "/server/macro_scheduler/delete", {"id": self.rng.choice(churned)}
+            )
+        elif roll < 0.95:
+            await self._call(
+                "/server/macro_scheduler/toggle", {"id": self.rng.choice(ids)}
+            )
+        else:
+            await self._call("/server/macro_scheduler/group", {
+                "action": self.rng.choice(["enable", "disable"]),
+                "tags": [self.rng.choice(["lighting", "maintenance", "churn"])]
+            })
+
+    async def _klippy_restart(self):
+        self.restarts += 1
+        self.klippy.available = False
+        self.server.send_event(
+            self.rng.choice(["server:klippy_shutdown", "server:klippy_disconnect"])
+        )
+        await asyncio.sleep(self.rng.uniform(60, 3600))
+        self.klippy.available = True
+        self.server.send_event("server:klippy_ready")
+
+    # ------------------------------------------------------------ checkpoint
+    def _checkpoint(self, day: int) -> Checkpoint:
+        gc.collect()
+        component = self.component
+        enabled = sum(1 for s in component.schedules.values() if s.get("enabled"))
+        schedule_tasks = [
+            t for t in asyncio.all_tasks()
+            if getattr(t.get_coro(), "__name__", "") == "_run_schedule"
+            and not t.done()
+        ]
+        point = Checkpoint(
+            day=day,
+            schedules=len(component.schedules),
+            enabled=enabled,
+            component_tasks=len(component.tasks),
+            loop_tasks=len(asyncio.all_tasks()),
+            heap_blocks=sys.getallocatedblocks(),
+            fires=self.klippy.calls
+        )
+        errors = point.errors
+        if any(task.done() for task in component.tasks.values()):
+            errors.append("finished tasks left in self.tasks")
+        if not set(component.tasks) <= set(component.schedules):
+            errors.append("tasks of deleted schedules in self.tasks")
+        if point.component_tasks > enabled:
+            errors.append(f"{point.component_tasks} tasks for {enabled} enabled schedules")
+        if len(schedule_tasks) != point.component_tasks:
+            errors.append(
+                f"{len(schedule_tasks)} schedule loops running, "
+                f"{point.component_tasks} tracked (orphaned tasks)"
+            )
+        if point.loop_tasks > point.component_tasks + TASK_SLACK:
+            errors.append(f"{point.loop_tasks} asyncio tasks alive")
+        if self.checkpoints:
+            baseline = self.checkpoints[0].heap_blocks
+            limit = baseline * HEAP_GROWTH_FACTOR + HEAP_GROWTH_SLACK
+            if point.heap_blocks > limit:
+                errors.append(f"heap grew from {baseline} to {point.heap_blocks} blocks")
+        if self.fires.early:
+            errors.append(f"{self.fires.early} early fires (max {self.fires.max_early:.1f}s)")
+        if self.fires.max_late > macro_scheduler.MAX_SLEEP_SECONDS + ON_TIME_SECONDS:
+            errors.append(f"fire late by {self.fires.max_late:.1f}s")
+        errors.extend(self.loop_errors)
+        self.loop_errors.clear()
+        return point
+
+    def _print_checkpoint(self, point: Checkpoint):
+        status = "ok" if not point.errors else "FAIL: " + "; ".join(point.errors)
+        print(
+            f"day {point.day:4d} | schedules {point.schedules:3d} "
+            f"(enabled {point.enabled:3d}) | tasks {point.component_tasks:3d} "
+            f"/ loop {point.loop_tasks:3d} | heap {point.heap_blocks:8d} "
+            f"| fires {point.fires:6d} | {status}"
+        )
+
+    # ------------------------------------------------------------------ run
+    async def run(self) -> bool:
+        for args in self.BASELINE:
+            await self._call("/server/macro_scheduler/add", dict(args))
+        self.klippy.available = True
+        self.server.send_event("server:klippy_ready")
+
+        end = self.days * 86400.
+        next_checkpoint = 0.
+        next_restart = self.rng.uniform(3, 10) * 86400.
+        while self.loop.time() < end:
+            await asyncio.sleep(self.rng.uniform(0.5, 3.5) * 3600.)
+            await self._random_operation()
+            if self.loop.time() >= next_restart:
+                await self._klippy_restart()
+                next_restart = self.loop.time() + self.rng.uniform(3, 10) * 86400.
+            if self.loop.time() >= next_checkpoint:
+                day = int(self.loop.time() // 86400)
+                point = self._checkpoint(day)
+                self.checkpoints.append(point)
+                self._print_checkpoint(point)
+                next_checkpoint += CHECKPOINT_DAYS * 86400.
+        point = self._checkpoint(self.days)
+        self.checkpoints.append(point)
+        self._print_checkpoint(point)
+
+        for schedule_id in list(self.component.tasks):
+            await self.component._stop_schedule(schedule_id)
+        return not any(p.errors for p in self.checkpoints)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Soak the Macro Scheduler on a virtual clock.")
+    parser.add_argument("--days", type=int, default=365, help="Simulated days (default 365)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default 1)")
+    parser.add_argument("--tz", default="America/New_York", help="Local time zone with DST")
+    parser.add_argument("--failure-rate", type=float, default=0.005, help="Chance of a macro error")
+    parser.add_argument("--verbose", action="store_true", help="Show component warnings")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+    loop = VirtualClockLoop()
+    asyncio.set_event_loop(loop)
+    wall_start = time.perf_counter()
+    try:
+        sim = Simulation(args.days, args.seed, ZoneInfo(args.tz), args.failure_rate)
+        passed = loop.run_until_complete(sim.run())
+    finally:
+        loop.close()
+
+    fires = sim.fires
+    print(
+        f"\nSimulated {args.days} days in {time.perf_counter() - wall_start:.1f}s"
+        f"\n  operations: {sum(sim.operations.values())} {sim.operations}"
+        f"\n  klippy restarts: {sim.restarts}, macro calls: {sim.klippy.calls}, "
+        f"failures: {sim.klippy.failures}, database writes: {sim.database.writes}"
+        f"\n  fires on time: {fires.on_time}, late: {fires.late} "
+        f"(max {fires.max_late:.1f}s), early: {fires.early}, catch-up: {fires.catch_up}, "
+        f"dst gap: {fires.dst_gap}, drained: {fires.drained}"
+    )
+    print("\nPASSED" if passed else "\nFAILED")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()